@@ -1,77 +1,267 @@
-import os, threading, time, json, yaml, sqlite3
-from flask import Flask, render_template, jsonify, request
-from database import init_db, update_user_category
-from fetchers.gmail_fetcher import GmailFetcher
-from fetchers.sms_fetcher import SMSFetcher
-from fetchers.statement_fetcher import StatementFetcher
-from nlp_categorizer import train_and_predict, apply_rules
+import os, re, threading, time, json, sqlite3, base64, functools
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import Blueprint, Flask, Response, g, render_template, jsonify, request
+import metrics
+from database import ConnectionManager, bulk_update_category, data_version, update_user_category
+from response_cache import ResponseCache, accepts_gzip, etag_matches
+from profiles import default_profile, overlay_for, profile_configs
+from nlp_categorizer import train_and_predict, apply_rules, learn_rule
 
 def load_config(path: str) -> dict:
     if path.lower().endswith('.json'):
         return json.load(open(path, 'r', encoding='utf-8'))
     else:
+        import yaml
         return yaml.safe_load(open(path, 'r', encoding='utf-8'))
 
-CONFIG_PATH = os.environ.get('TC_CONFIG', 'config.json')
-cfg = load_config(CONFIG_PATH)
-DB_PATH = cfg['database']['path']
-conn = init_db(DB_PATH)
+def save_config(path: str, data: dict):
+    # Written beside the original and renamed over it, so a crash never leaves half a config
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        if path.lower().endswith('.json'):
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        else:
+            import yaml
+            yaml.safe_dump(data, f, sort_keys=False, allow_unicode=True)
+    os.replace(tmp, path)
 
-app = Flask(__name__)
+class Profile:
+    """One ledger: its effective config, database, response cache and fetch-cycle state.
 
-def run_fetch_cycle():
-    if cfg.get('gmail', {}).get('enabled', False):
-        try:
-            inserted = GmailFetcher(CONFIG_PATH).run()
-            print(f'[Fetch] Gmail inserted: {inserted}')
-        except Exception as e:
-            print('[Fetch] Gmail error:', e)
-    if cfg.get('sms', {}).get('enabled', False):
-        try:
-            inserted = SMSFetcher(CONFIG_PATH).run()
-            print(f'[Fetch] SMS inserted: {inserted}')
-        except Exception as e:
-            print('[Fetch] SMS error:', e)
-    if cfg.get('statements', {}).get('enabled', False):
+    Profiles share nothing mutable, so their cycles run in parallel and each
+    writes through its own ConnectionManager (and write lock).
+    """
+
+    def __init__(self, name: str, cfg: dict):
+        self.name = name
+        self.cfg = cfg
+        # Shared by request threads (per-thread readers) and the scheduler (serialized writer)
+        self.db = ConnectionManager.from_config(cfg)
+        self.response_cache = ResponseCache.from_config(cfg)
+        self.cycle_lock = threading.Lock()
+        # section -> future of a fetcher that outlived its timeout; not restarted until it ends
+        self.stragglers = {}
+
+# Set by create_app; importing this module reads no config and opens no database
+CONFIG_PATH = None
+PROFILES = {}
+DEFAULT_PROFILE = None
+
+bp = Blueprint('dashboard', __name__)
+
+def create_app(config_path: str = None) -> Flask:
+    global CONFIG_PATH, DEFAULT_PROFILE
+    CONFIG_PATH = config_path or os.environ.get('TC_CONFIG', 'config.json')
+    cfg = load_config(CONFIG_PATH)
+    PROFILES.clear()
+    for name, pcfg in profile_configs(cfg).items():
+        PROFILES[name] = Profile(name, pcfg)
+    DEFAULT_PROFILE = default_profile(cfg)
+    metrics.configure(cfg)
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    return app
+
+@bp.before_app_request
+def _start_timer():
+    if metrics.REGISTRY.enabled:
+        g.t0 = time.perf_counter()
+
+@bp.before_app_request
+def _select_profile():
+    # ?profile= wins over the X-Profile header, so plain links can pick a profile too
+    name = request.args.get('profile') or request.headers.get('X-Profile') or DEFAULT_PROFILE
+    g.profile = PROFILES.get(name)
+    if g.profile is None:
+        return jsonify({"ok": False, "error": f"Unknown profile {name!r}"}), 404
+
+def _observe_request(status: int):
+    t0 = g.pop('t0', None)
+    if t0 is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REGISTRY.observe('tc_request_seconds', time.perf_counter() - t0,
+                                 route=route, method=request.method, status=status)
+
+@bp.after_app_request
+def _record_latency(response):
+    _observe_request(response.status_code)
+    return response
+
+@bp.teardown_app_request
+def _record_failed_latency(exc):
+    # after_request is skipped when a view's exception propagates; t0 is still set then
+    _observe_request(500)
+
+# Fetcher modules pull in the Google client, requests and pdfplumber, so they are
+# imported on first use by a cycle, and only for sources that are enabled
+def _gmail(p: Profile):
+    from gmail_fetcher import GmailFetcher
+    return GmailFetcher(cfg=p.cfg, db=p.db)
+
+def _sms(p: Profile):
+    from sms_fetcher import SMSFetcher
+    return SMSFetcher(cfg=p.cfg, db=p.db)
+
+def _statements(p: Profile):
+    from statement_fetcher import StatementFetcher
+    return StatementFetcher(cfg=p.cfg, db=p.db)
+
+# (config section, log label, factory); each enabled fetcher runs in its own thread
+FETCHERS = (
+    ('gmail', 'Gmail', _gmail),
+    ('sms', 'SMS', _sms),
+    ('statements', 'Statements', _statements),
+)
+DEFAULT_FETCH_TIMEOUT = 300
+
+def timed_run(key: str, make, p: Profile) -> int:
+    with metrics.span(key):
+        return make(p).run()
+
+def run_fetch_cycle(p: Profile = None) -> bool:
+    p = p or PROFILES[DEFAULT_PROFILE]
+    cfg, db = p.cfg, p.db
+    if not p.cycle_lock.acquire(blocking=False):
+        print(f'[Fetch:{p.name}] cycle already running, skipped')
+        return False
+    try:
+        started = time.monotonic()
+        profiler = metrics.cycle_profiler(cfg)
+        profiled = profiler.wrap if profiler else (lambda fn: fn)
+        pool = ThreadPoolExecutor(max_workers=len(FETCHERS), thread_name_prefix=f'fetch-{p.name}')
+        futures = []
+        for key, label, make in FETCHERS:
+            if not cfg.get(key, {}).get('enabled', False):
+                continue
+            if key in p.stragglers and not p.stragglers[key].done():
+                print(f'[Fetch:{p.name}] {label} still running from an earlier cycle, skipped')
+                continue
+            futures.append((key, label, pool.submit(profiled(lambda key=key, make=make: timed_run(key, make, p)))))
+        for key, label, fut in futures:
+            timeout = float(cfg[key].get('timeout', DEFAULT_FETCH_TIMEOUT))
+            try:
+                inserted = fut.result(timeout=max(0.0, started + timeout - time.monotonic()))
+                print(f'[Fetch:{p.name}] {label} inserted: {inserted}')
+            except FutureTimeout:
+                # Threads can't be killed; let it finish in the background and keep going
+                p.stragglers[key] = fut
+                print(f'[Fetch:{p.name}] {label} timed out after {timeout:g}s')
+            except Exception as e:
+                print(f'[Fetch:{p.name}] {label} error:', e)
+        pool.shutdown(wait=False)
+        # Rules first, then ML
         try:
-            inserted = StatementFetcher(CONFIG_PATH).run()
-            print(f'[Fetch] Statements inserted: {inserted}')
+            r = profiled(apply_rules)(db, cfg)
+            m = profiled(train_and_predict)(db, cfg)
+            print(f'[Categorizer:{p.name}] Rules set: {r}, ML predicted: {m}')
         except Exception as e:
-            print('[Fetch] Statements error:', e)
-    # Rules first, then ML
-    try:
-        r = apply_rules(conn, cfg)
-        m = train_and_predict(conn, cfg)
-        print(f'[Categorizer] Rules set: {r}, ML predicted: {m}')
-    except Exception as e:
-        print('[Categorizer] error:', e)
+            print(f'[Categorizer:{p.name}] error:', e)
+        if cfg.get('insights', {}).get('enabled', True):
+            try:
+                import insights
+                recurring, anomalies = insights.run(db, cfg)
+                print(f'[Insights:{p.name}] recurring merchants updated: {recurring}, anomalies: {anomalies}')
+            except Exception as e:
+                print(f'[Insights:{p.name}] error:', e)
+        if cfg.get('analytics', {}).get('export_after_cycle', False):
+            try:
+                import columnar
+                with metrics.span('export_columns'):
+                    manifest = columnar.export(db, columnar.export_dir(cfg))
+                print(f"[Export:{p.name}] {manifest['rows']} rows in {manifest['generation']}")
+            except Exception as e:
+                print(f'[Export:{p.name}] error:', e)
+        elapsed = time.monotonic() - started
+        metrics.REGISTRY.set_gauge('tc_last_cycle_seconds', elapsed, profile=p.name)
+        if profiler:
+            profiler.dump()
+            if profiler.skipped:
+                print(f'[Fetch:{p.name}] {profiler.skipped} sections ran unprofiled, another was being profiled')
+        print(f'[Fetch:{p.name}] cycle finished in {elapsed:.1f}s')
+        return True
+    finally:
+        p.cycle_lock.release()
 
-def scheduler_loop(interval: int):
+def scheduler_loop(p: Profile):
+    # Fixed-rate: cycles start every interval regardless of how long the last one took;
+    # ticks missed during an overrun are dropped instead of run back to back
+    interval = max(60, int(p.cfg.get('refresh_interval', 300)))
+    next_run = time.monotonic()
     while True:
-        run_fetch_cycle()
-        time.sleep(max(60, interval))
+        run_fetch_cycle(p)
+        next_run += interval
+        now = time.monotonic()
+        if next_run <= now:
+            next_run += ((now - next_run) // interval + 1) * interval
+        time.sleep(next_run - now)
+
+def cached_json(view):
+    # GET views whose JSON depends only on the query string and the stored data.
+    # A poll with nothing new ingested or edited is one app_state lookup and a 304.
+    @functools.wraps(view)
+    def wrapper():
+        p = g.profile
+        version = data_version(p.db)
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        entry = p.response_cache.get(key, version)
+        if entry is None:
+            rv = view()
+            if isinstance(rv, tuple) or rv.status_code != 200:
+                return rv
+            entry = p.response_cache.put(key, version, rv.get_data())
+        headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding, X-Profile'}
+        if etag_matches(request.headers.get('If-None-Match', ''), entry.etag):
+            return Response(status=304, headers=headers)
+        body = entry.body
+        if len(body) >= p.response_cache.gzip_min_bytes and accepts_gzip(request.headers.get('Accept-Encoding', '')):
+            body = entry.gzipped()
+            headers['Content-Encoding'] = 'gzip'
+        return Response(body, mimetype='application/json', headers=headers)
+    return wrapper
 
-@app.route('/')
+@bp.route('/')
 def index():
-    return render_template('index.html', app_name=cfg.get('app_name', 'TheCoder Finance'))
+    return render_template('index.html', app_name=g.profile.cfg.get('app_name', 'TheCoder Finance'),
+                           profile=g.profile.name, profiles=list(PROFILES))
 
-@app.route('/api/summary')
+@bp.route('/api/profiles')
+def api_profiles():
+    return jsonify({"profiles": list(PROFILES), "default": DEFAULT_PROFILE})
+
+def rollup_filters(args) -> tuple:
+    # Optional ?start=YYYY-MM-DD&end=YYYY-MM-DD&source=... on daily_rollup. Undated rows
+    # are stored as '', which sorts before any end date; like /api/transactions, a date
+    # filter leaves them out.
+    clauses, params = [], []
+    if args.get('start') or args.get('end'):
+        clauses.append("date <> ''")
+    if args.get('start'):
+        clauses.append('date >= ?'); params.append(args['start'])
+    if args.get('end'):
+        clauses.append('date <= ?'); params.append(args['end'])
+    if args.get('source'):
+        clauses.append('source = ?'); params.append(args['source'])
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+@bp.route('/api/summary')
+@cached_json
 def api_summary():
-    cur = conn.cursor()
-    cur.execute("""        SELECT COALESCE(user_category, ai_category, category, 'Uncategorized') as cat, SUM(amount) 
-        FROM transactions
-        WHERE amount < 0 OR amount > 0
-        GROUP BY cat
+    # Reads the trigger-maintained daily_rollup instead of scanning transactions
+    where, params = rollup_filters(request.args)
+    cur = g.profile.db.reader().cursor()
+    cur.execute(f"""        SELECT category, SUM(amount) FROM daily_rollup{where}
+        GROUP BY category
+        HAVING SUM(n_nonzero) > 0
         ORDER BY SUM(amount) DESC
-    """ )
+    """, params)
     cat_rows = cur.fetchall()
 
-    cur.execute("""        SELECT date, SUM(amount) FROM transactions
+    cur.execute(f"""        SELECT NULLIF(date, ''), SUM(amount) FROM daily_rollup{where}
         GROUP BY date ORDER BY date
-    """ )
+    """, params)
     trend = cur.fetchall()
 
-    cur.execute("SELECT COUNT(*) FROM transactions" )
+    cur.execute(f"SELECT IFNULL(SUM(n), 0) FROM daily_rollup{where}", params)
     total = cur.fetchone()[0]
 
     return jsonify({
@@ -80,39 +270,242 @@ def api_summary():
         "total": total
     })
 
-@app.route('/api/transactions')
-def api_transactions():
-    cur = conn.cursor()
-    cur.execute("""        SELECT id, date, merchant, amount,
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+
+def encode_cursor(date, tx_id) -> str:
+    return base64.urlsafe_b64encode(json.dumps([date, tx_id]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(token: str):
+    date, tx_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    return date, int(tx_id)
+
+TRANSACTION_FILTER_KEYS = ('start', 'end', 'source', 'category', 'merchant', 'min_amount', 'max_amount')
+
+def transaction_filters(args) -> tuple:
+    # ?start&end&source&category&merchant(prefix)&min_amount&max_amount
+    clauses, params = [], []
+    if args.get('start'):
+        clauses.append('date >= ?'); params.append(args['start'])
+    if args.get('end'):
+        clauses.append('date <= ?'); params.append(args['end'])
+    if args.get('source'):
+        clauses.append('source = ?'); params.append(args['source'])
+    if args.get('category'):
+        clauses.append("COALESCE(user_category, ai_category, category, 'Uncategorized') = ?")
+        params.append(args['category'])
+    if args.get('merchant'):
+        # Range instead of LIKE so idx_txn_merchant is used and %/_ need no escaping
+        prefix = args['merchant']
+        clauses.append('merchant >= ? COLLATE NOCASE AND merchant < ? COLLATE NOCASE')
+        params += [prefix, prefix + '\U0010ffff']
+    if args.get('min_amount'):
+        clauses.append('amount >= ?'); params.append(float(args['min_amount']))
+    if args.get('max_amount'):
+        clauses.append('amount <= ?'); params.append(float(args['max_amount']))
+    return clauses, params
+
+def _page(cur, clauses, params, limit):
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+    cur.execute(f"""        SELECT id, date, merchant, amount,
                COALESCE(user_category, ai_category, category, 'Uncategorized') as category,
                source
-        FROM transactions
-        ORDER BY date DESC, id DESC LIMIT 500
-    """ )
-    rows = cur.fetchall()
+        FROM transactions{where}
+        ORDER BY date DESC, id DESC LIMIT ?
+    """, params + [limit])
+    return cur.fetchall()
+
+@bp.route('/api/transactions')
+@cached_json
+def api_transactions():
+    try:
+        limit = max(1, min(int(request.args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+        clauses, params = transaction_filters(request.args)
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, TypeError):
+        return jsonify({"ok": False, "error": "Bad filter or cursor"}), 400
+    cur = g.profile.db.reader().cursor()
+    # Fetch one extra row to know whether there is a next page. Rows without a date sort
+    # last (DESC), so a page that crosses into them takes a second, NULL-only query.
+    if cursor is None:
+        rows = _page(cur, clauses, params, limit + 1)
+    elif cursor[0] is None:
+        rows = _page(cur, clauses + ['date IS NULL', 'id < ?'], params + [cursor[1]], limit + 1)
+    else:
+        rows = _page(cur, clauses + ['(date, id) < (?, ?)'], params + list(cursor), limit + 1)
+        if len(rows) <= limit:
+            rows += _page(cur, clauses + ['date IS NULL'], params, limit + 1 - len(rows))
+    next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
     tx = [{
         "id": r[0], "date": r[1], "merchant": r[2], "amount": r[3],
         "category": r[4], "source": r[5]
-    } for r in rows]
-    return jsonify(tx)
+    } for r in rows[:limit]]
+    return jsonify({"items": tx, "next_cursor": next_cursor})
 
-@app.route('/api/update_category', methods=['POST'])
+SEARCH_PAGE_SIZE = 50
+
+def fts_query(text: str) -> str:
+    # Every word becomes a quoted prefix term, so user input can't inject FTS5 syntax
+    return ' '.join(f'"{w}"*' for w in re.findall(r'\w+', text))
+
+@bp.route('/api/search')
+@cached_json
+def api_search():
+    match = fts_query(request.args.get('q', ''))
+    if not match:
+        return jsonify({"ok": False, "error": "Missing q"}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), MAX_PAGE_SIZE))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Bad limit/offset"}), 400
+    cur = g.profile.db.reader().cursor()
+    # bm25 weights: merchant hits outrank subject hits, which outrank body text.
+    # ORDER BY rank lets FTS5 sort internally, so snippets are only built for the page.
+    cur.execute("""        SELECT t.id, t.date, t.merchant, t.amount,
+               COALESCE(t.user_category, t.ai_category, t.category, 'Uncategorized'),
+               t.source, f.snip
+        FROM (SELECT rowid, snippet(transactions_fts, 2, '[', ']', '...', 10) AS snip, rank
+              FROM transactions_fts
+              WHERE transactions_fts MATCH ? AND rank MATCH 'bm25(10.0, 5.0, 1.0)'
+              ORDER BY rank LIMIT ? OFFSET ?) f
+        JOIN transactions t ON t.id = f.rowid
+        ORDER BY f.rank
+    """, (match, limit + 1, offset))
+    rows = cur.fetchall()
+    items = [{
+        "id": r[0], "date": r[1], "merchant": r[2], "amount": r[3],
+        "category": r[4], "source": r[5], "snippet": r[6]
+    } for r in rows[:limit]]
+    return jsonify({"items": items, "next_offset": offset + limit if len(rows) > limit else None})
+
+@bp.route('/api/insights')
+@cached_json
+def api_insights():
+    # Recurring payments by next due date, then the newest unusual spends (?limit)
+    try:
+        limit = max(1, min(int(request.args.get('limit', 100)), MAX_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Bad limit"}), 400
+    cur = g.profile.db.reader().cursor()
+    cur.execute("""
+        SELECT merchant, category, period, period_days, occurrences, regularity,
+               typical_amount, last_amount, drift, last_date, next_date
+        FROM recurring_payments ORDER BY next_date
+    """)
+    recurring = [{
+        "merchant": r[0], "category": r[1], "period": r[2], "period_days": r[3], "occurrences": r[4],
+        "regularity": r[5], "typical_amount": r[6], "last_amount": r[7], "drift": r[8],
+        "last_date": r[9], "next_date": r[10]
+    } for r in cur.fetchall()]
+    cur.execute("""
+        SELECT t.id, t.date, t.merchant, a.amount, a.category, a.median, a.score
+        FROM spend_anomalies a JOIN transactions t ON t.id = a.tx_id
+        ORDER BY t.date DESC, t.id DESC LIMIT ?
+    """, (limit,))
+    anomalies = [{
+        "id": r[0], "date": r[1], "merchant": r[2], "amount": r[3], "category": r[4],
+        "category_median": r[5], "score": r[6]
+    } for r in cur.fetchall()]
+    return jsonify({"recurring": recurring, "anomalies": anomalies})
+
+@bp.route('/api/update_category', methods=['POST'])
 def api_update_category():
     data = request.json or {}
     tx_id = data.get('id')
     cat = data.get('category', '').strip()
     if not tx_id or not cat:
         return jsonify({"ok": False, "error": "Missing id/category"}), 400
-    update_user_category(conn, int(tx_id), cat)
+    update_user_category(g.profile.db, int(tx_id), cat)
     return jsonify({"ok": True})
 
+_config_lock = threading.Lock()
+
+def unaffected_by(change: dict):
+    # Cache keys whose filters exclude every edited row. A category edit leaves row
+    # counts, amounts and dates alone but shows up in any summary or listing that
+    # includes those rows; search results and repeated parameters are never kept.
+    def check(key) -> bool:
+        path, items = key
+        args = dict(items)
+        if path not in ('/api/summary', '/api/transactions') or len(args) != len(items):
+            return False
+        if args.get('source') and args['source'] not in change['sources']:
+            return True
+        start, end = args.get('start'), args.get('end')
+        if start or end:
+            # Date filters drop undated rows, so only the dated span matters
+            lo, hi = change['min_date'], change['max_date']
+            return lo is None or bool(end and end < lo) or bool(start and start > hi)
+        return False
+    return check
+
+@bp.route('/api/bulk_update_category', methods=['POST'])
+def api_bulk_update_category():
+    # {"category", "ids": [...]} or {"category", "filter": {same keys as /api/transactions}},
+    # plus optional "learn_rule" (with "rule_keyword", default filter.merchant) and
+    # "invalidate": "affected" to keep cached responses the edit can't have changed
+    data = request.json or {}
+    cat = (data.get('category') or '').strip()
+    ids, filters = data.get('ids'), data.get('filter') or {}
+    if not isinstance(ids, (list, type(None))) or not isinstance(filters, dict):
+        return jsonify({"ok": False, "error": "ids must be a list and filter an object"}), 400
+    if not cat or (not ids and not any(filters.values())):
+        return jsonify({"ok": False, "error": "Missing category and ids/filter"}), 400
+    unknown = sorted(set(filters) - set(TRANSACTION_FILTER_KEYS))
+    if unknown:
+        return jsonify({"ok": False, "error": f"Unknown filter keys: {', '.join(unknown)}"}), 400
+    keyword = (data.get('rule_keyword') or filters.get('merchant') or '').strip()
+    if data.get('learn_rule') and not keyword:
+        return jsonify({"ok": False, "error": "learn_rule needs rule_keyword or filter.merchant"}), 400
+    p = g.profile
+    try:
+        if ids:
+            change = bulk_update_category(p.db, cat, ids=ids)
+        else:
+            clauses, params = transaction_filters(filters)
+            if not clauses:
+                # A filter that narrows nothing would recategorize the whole ledger
+                return jsonify({"ok": False, "error": "Filter matches every transaction"}), 400
+            change = bulk_update_category(p.db, cat, clauses=clauses, params=params)
+    except (ValueError, TypeError):
+        return jsonify({"ok": False, "error": "Bad ids or filter"}), 400
+    out = {"ok": True, "updated": change["updated"]}
+    before, after = change["version"]
+    if after != before and data.get('invalidate') == 'affected':
+        out["cache_kept"] = p.response_cache.rebase(before, after, unaffected_by(change))
+    if data.get('learn_rule'):
+        with _config_lock:
+            # Swap in a new dict rather than editing lists a running cycle may be reading
+            p.cfg['categories_rules'], effective = learn_rule(p.cfg.get('categories_rules') or {}, cat, keyword)
+            on_disk = load_config(CONFIG_PATH)
+            # Into the profile's own overlay when profiles are configured
+            overlay_for(on_disk, p.name)['categories_rules'] = p.cfg['categories_rules']
+            save_config(CONFIG_PATH, on_disk)
+        out["rule"] = {"keyword": keyword.lower(), "effective": effective}
+    return jsonify(out)
+
+@bp.route('/api/fetch', methods=['POST'])
+def api_fetch():
+    # Runs a cycle now in the background; the dashboard polls for the results
+    p = g.profile
+    if p.cycle_lock.locked():
+        return jsonify({"ok": True, "started": False, "reason": "cycle already running"}), 202
+    threading.Thread(target=run_fetch_cycle, args=(p,), name=f'fetch-on-demand-{p.name}', daemon=True).start()
+    return jsonify({"ok": True, "started": True}), 202
+
+@bp.route('/api/metrics')
+def api_metrics():
+    # Prometheus text format; empty unless metrics.enabled is set in config
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 def start_scheduler():
-    interval = int(cfg.get('refresh_interval', 300))
-    t = threading.Thread(target=scheduler_loop, args=(interval,), daemon=True)
-    t.start()
+    # One loop per profile, each on its own refresh_interval
+    for p in PROFILES.values():
+        threading.Thread(target=scheduler_loop, args=(p,), name=f'scheduler-{p.name}', daemon=True).start()
 
 if __name__ == '__main__':
+    app = create_app()
+    # The first scheduler tick runs a cycle immediately so the dashboard shows real data
     start_scheduler()
-    # Run one immediate cycle so the dashboard shows real data instantly
-    run_fetch_cycle()
     app.run(host='127.0.0.1', port=5000, debug=False)
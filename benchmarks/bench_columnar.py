@@ -0,0 +1,110 @@
+"""Benchmark analytics: SQLite cursor loops and GROUP BY vs the columnar NumPy export.
+
+    python benchmarks/bench_columnar.py --rows 1000000
+
+Builds a throwaway database of synthetic transactions, exports it, then
+times monthly spend, category breakdown and a 30-day rolling average.
+"""
+import argparse, datetime, os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import columnar
+from database import init_db
+
+MERCHANTS = ["AMAZON", "FLIPKART", "SWIGGY", "ZOMATO", "UBER", "BIGBASKET", "IRCTC", "HP PETROL",
+             "NETFLIX", "DMART", "MYNTRA", "APOLLO PHARMACY", "AIRTEL", "JIO"]
+CATEGORIES = [None, "Shopping", "Food", "Fuel", "Travel", "Bills", "Subscriptions"]
+SOURCES = ["sms", "amazon", "flipkart", "sbi_txn", "statement"]
+
+def build_db(path: str, rows: int, years: int, rng: random.Random):
+    conn = init_db(path)
+    first = datetime.date.today() - datetime.timedelta(days=365 * years)
+    # Distinct updated_at per row, as BatchWriter stamps them, so the export watermark is meaningful
+    written = datetime.datetime.utcnow() - datetime.timedelta(seconds=rows)
+    batch = []
+    for i in range(rows):
+        day = first + datetime.timedelta(days=rng.randrange(365 * years))
+        batch.append((day.isoformat(), f"{rng.choice(MERCHANTS)} {rng.randrange(500)}", rng.choice(CATEGORIES),
+                      round(rng.uniform(10, 5000), 2), rng.choice(SOURCES), f"synthetic {i}",
+                      (written + datetime.timedelta(seconds=i)).isoformat(), f"fp{i}"))
+        if len(batch) == 50000:
+            _insert(conn, batch)
+            batch = []
+    _insert(conn, batch)
+    return conn
+
+def _insert(conn, batch):
+    conn.executemany("""INSERT INTO transactions (date, merchant, category, amount, source, raw_snippet, updated_at, fingerprint)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", batch)
+    conn.commit()
+
+def timed(label: str, fn, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"  {label:<34} {best * 1000:10.1f} ms")
+    return result
+
+def loop_monthly(conn):
+    # What app.py-style code does today: one Python object per row
+    out = {}
+    for date, amount in conn.execute("SELECT date, amount FROM transactions"):
+        if date:
+            out[date[:7]] = out.get(date[:7], 0.0) + (amount or 0.0)
+    return out
+
+def loop_categories(conn):
+    out = {}
+    for cat, amount in conn.execute(
+            "SELECT COALESCE(user_category, ai_category, category, 'Uncategorized'), amount FROM transactions"):
+        out[cat] = out.get(cat, 0.0) + (amount or 0.0)
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=1000000)
+    ap.add_argument("--years", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=3)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="tc_bench_")
+    rng = random.Random(args.seed)
+    t0 = time.perf_counter()
+    conn = build_db(os.path.join(tmp, "bench.db"), args.rows, args.years, rng)
+    print(f"{args.rows:,} rows over {args.years} years built in {time.perf_counter() - t0:.1f} s ({tmp})")
+    out_dir = os.path.join(tmp, "bench.columns")
+
+    print("export")
+    timed("full", lambda: columnar.export(conn, out_dir, incremental=False), repeat=1)
+    now = datetime.datetime.utcnow().isoformat()
+    conn.execute("UPDATE transactions SET user_category='Misc', updated_at=? WHERE id % 100 = 0", (now,))
+    conn.commit()
+    manifest = timed("incremental (1% rows changed)", lambda: columnar.export(conn, out_dir), repeat=1)
+    timed("incremental (nothing changed)", lambda: columnar.export(conn, out_dir), repeat=1)
+    gen_dir = os.path.join(out_dir, manifest["generation"])
+    size = sum(os.path.getsize(os.path.join(gen_dir, f)) for f in os.listdir(gen_dir))
+    print(f"  {manifest['rows']:,} rows, {size / 1e6:.1f} MB on disk")
+
+    cols = timed("open (memory-mapped)", lambda: columnar.Columns(out_dir))
+    print("monthly spend")
+    slow = timed("sqlite rows -> Python dict", lambda: loop_monthly(conn), repeat=1)
+    timed("sqlite GROUP BY", lambda: conn.execute(
+        "SELECT substr(date, 1, 7), SUM(amount) FROM transactions GROUP BY 1").fetchall(), repeat=1)
+    months, totals = timed("columnar.monthly_spend", lambda: columnar.monthly_spend(cols))
+    fast = {str(m): t for m, t in zip(months, totals) if t}
+    assert set(fast) == set(slow) and all(abs(fast[k] - slow[k]) < 1e-3 for k in slow)
+
+    print("category breakdown")
+    slow = timed("sqlite rows -> Python dict", lambda: loop_categories(conn), repeat=1)
+    fast = timed("columnar.category_breakdown", lambda: columnar.category_breakdown(cols))
+    assert {c: round(t, 2) for c, t, _ in fast} == {c: round(t, 2) for c, t in slow.items()}
+    timed("  ... one source, last year", lambda: columnar.category_breakdown(
+        cols, cols.mask(start=(datetime.date.today() - datetime.timedelta(days=365)).isoformat(), source="sms")))
+
+    print("rolling average")
+    timed("columnar.rolling_average (30 d)", lambda: columnar.rolling_average(cols, 30))
+
+if __name__ == "__main__":
+    main()
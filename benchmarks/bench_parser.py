@@ -0,0 +1,123 @@
+"""Benchmark SMS/e-mail parsing throughput: legacy per-call regexes vs txn_parser.
+
+    python benchmarks/bench_parser.py --messages 100000
+"""
+import argparse, os, random, re, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import txn_parser
+
+# --- The pre-txn_parser implementations, kept here as the baseline -----------------
+
+def legacy_extract_amount(text):
+    txt = text.replace(",", "")
+    pats = [
+        r"(?:₹|INR|Rs\.?)\s*([0-9]+(?:\.[0-9]{1,2})?)",
+        r"([0-9]+(?:\.[0-9]{1,2})?)\s*(?:INR|₹|Rs\.?)"
+    ]
+    for p in pats:
+        m = re.search(p, txt, re.IGNORECASE)
+        if m:
+            try:
+                return float(m.group(1))
+            except: pass
+    return None
+
+def legacy_extract_merchant(text, fallback):
+    hints = [
+        r"at\s+([A-Za-z0-9 &\-\._]+)",
+        r"merchant\s*:\s*([A-Za-z0-9 &\-\._]+)",
+        r"spent at\s+([A-Za-z0-9 &\-\._]+)"
+    ]
+    for h in hints:
+        m = re.search(h, text, re.IGNORECASE)
+        if m:
+            name = m.group(1).strip(" .,-")
+            if 2 <= len(name) <= 64:
+                return name
+    return fallback.title()
+
+def legacy_parse_sms_text(text):
+    pat = r'(?:₹|INR|Rs\.?)\s*([0-9]+(?:\.[0-9]{1,2})?).{0,40}?(?:at|in)\s+([A-Za-z0-9 &\-\._]{2,64})'
+    m = re.search(pat, text, re.IGNORECASE)
+    if not m:
+        return None
+    return float(m.group(1)), m.group(2).strip(' .,-')
+
+# --- Synthetic corpus -------------------------------------------------------------
+
+MERCHANTS = ["AMAZON", "FLIPKART", "SWIGGY", "ZOMATO LTD", "UBER INDIA", "BIGBASKET", "IRCTC", "HP PETROL",
+             "NETFLIX", "DMART", "MYNTRA", "APOLLO PHARMACY", "INDIAN OIL", "AIRTEL", "JIO"]
+
+SMS_TEMPLATES = [
+    ("SBICRD", "Rs.{amt} spent on your SBI Credit Card ending {card} at {m} on 10/08/25. Trxn not done by you? Call 1800"),
+    ("VM-HDFCBK", "Spent Rs.{amt} On HDFC Bank Card {card} At {m} On 2025-08-10:10:00:00. Not You? Call 18002586161"),
+    ("AD-HDFCBK", "Rs.{amt} debited from a/c **{card} on 10-08-25 to VPA {vpa}@okicici (UPI Ref No 52{card}1)"),
+    ("ICICIB", "INR {amt} spent on ICICI Bank Card XX{card} on 10-Aug-25 at {m}. Avl Lmt: INR 1,00,000.00"),
+    ("ICICIB", "ICICI Bank Acct XX{card} debited for Rs {amt} on 10-Aug-25; {m} credited. UPI:52{card}1"),
+    ("SBIINB", "Your A/C XXXXX{card} debited by {amt} on 10Aug25 trf to {m} Refno 3{card}9. If not done by you call 1800"),
+    ("", "Rs {amt} debited at {m}"),
+    ("", "Your OTP for login is {card}. Do not share it with anyone."),
+]
+
+def fmt_amount(rng):
+    v = rng.choice([rng.uniform(10, 999), rng.uniform(1000, 99999), rng.uniform(100000, 500000)])
+    return f"{v:,.2f}" if rng.random() < 0.5 else f"{v:.2f}"
+
+def synthetic_corpus(n, rng, email_share=0.3, body_kb=24):
+    filler = ("<tr><td style='padding:4px;font-family:Arial'>Thank you for shopping with us. "
+              "Track your package from Your Orders.</td></tr>\n") * (body_kb * 1024 // 110)
+    out = []
+    for _ in range(n):
+        m = rng.choice(MERCHANTS)
+        if rng.random() < email_share:
+            shop, sender = rng.choice([("amazon", "auto-confirm@amazon.in"), ("flipkart", "noreply@flipkart.com")])
+            text = (f"Your {shop.title()} order #40{rng.randint(10**6, 10**7)}\n"
+                    f"Order Total: ₹{fmt_amount(rng)}\n{filler}")
+            out.append(("email", sender, shop, text))
+        else:
+            sender, tpl = rng.choice(SMS_TEMPLATES)
+            text = tpl.format(amt=fmt_amount(rng), card=rng.randint(1000, 9999), m=m, vpa=m.lower().replace(" ", ""))
+            out.append(("sms", sender, "sms", text))
+    return out
+
+def run_legacy(corpus):
+    for kind, sender, source, text in corpus:
+        if kind == "email":
+            legacy_extract_amount(text)
+            legacy_extract_merchant(text, source)
+        else:
+            legacy_parse_sms_text(text)
+
+def run_new(corpus):
+    for kind, sender, source, text in corpus:
+        if kind == "email":
+            txn_parser.parse_message(text, sender=sender, source=source)
+        else:
+            txn_parser.parse_sms(text, sender)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--messages", type=int, default=100000)
+    ap.add_argument("--email-share", type=float, default=0.3, help="fraction of messages that are e-mail receipts")
+    ap.add_argument("--body-kb", type=int, default=24, help="size of each e-mail body")
+    ap.add_argument("--seed", type=int, default=11)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = synthetic_corpus(args.messages, rng, args.email_share, args.body_kb)
+    sms = [c for c in corpus if c[0] == "sms"]
+    print(f"{len(corpus)} messages ({len(sms)} SMS, {len(corpus) - len(sms)} e-mails of ~{args.body_kb} KB)")
+
+    parsed = sum(1 for c in sms if txn_parser.parse_sms(c[3], c[1]))
+    legacy_parsed = sum(1 for c in sms if legacy_parse_sms_text(c[3]))
+    print(f"SMS recognized: legacy {legacy_parsed}, txn_parser {parsed}")
+
+    for label, fn in (("legacy", run_legacy), ("txn_parser", run_new)):
+        t0 = time.perf_counter()
+        fn(corpus)
+        t = time.perf_counter() - t0
+        print(f"{label:<11} {t:8.2f} s  {len(corpus) / t:12,.0f} msgs/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark rule categorization: per-keyword substring scan vs compiled RuleMatcher.
+
+    python benchmarks/bench_rules.py --merchants 100000 --extra-rules 500
+"""
+import argparse, json, os, random, string, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from nlp_categorizer import RuleMatcher
+
+def naive_rule_category(merchant: str, rules: dict) -> str:
+    # The pre-compilation implementation, kept here as the baseline
+    low = (merchant or '').lower()
+    for cat, keys in rules.items():
+        for k in keys:
+            if k.lower() in low:
+                return cat
+    return ''
+
+def synthetic_rules(base: dict, extra: int, rng: random.Random) -> dict:
+    rules = {cat: list(keys) for cat, keys in base.items()}
+    cats = list(rules) or ['Other']
+    for i in range(extra):
+        name = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+        rules.setdefault(cats[i % len(cats)], []).append(f"{name} {i}")
+    return rules
+
+def synthetic_merchants(rules: dict, n: int, distinct: int, rng: random.Random) -> list:
+    keys = [k for ks in rules.values() for k in ks]
+    pool = []
+    for _ in range(distinct):
+        if rng.random() < 0.6 and keys:
+            pool.append(f"{rng.choice(['POS ', 'UPI-', '', 'www.'])}{rng.choice(keys).upper()}{rng.choice(['', ' PVT LTD', '.com', ' #' + str(rng.randint(1, 999))])}")
+        else:
+            pool.append(''.join(rng.choice(string.ascii_uppercase + ' ') for _ in range(rng.randint(6, 28))).strip())
+    return [rng.choice(pool) for _ in range(n)]
+
+def timed(fn, merchants):
+    t0 = time.perf_counter()
+    out = [fn(m) for m in merchants]
+    return time.perf_counter() - t0, out
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--config', default='config.json')
+    ap.add_argument('--merchants', type=int, default=100000)
+    ap.add_argument('--distinct', type=int, default=5000, help='distinct merchant strings in the corpus')
+    ap.add_argument('--extra-rules', type=int, default=500, help='synthetic keywords added to categories_rules')
+    ap.add_argument('--seed', type=int, default=7)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    base = {}
+    if os.path.exists(args.config):
+        base = json.load(open(args.config, 'r', encoding='utf-8')).get('categories_rules', {})
+    rules = synthetic_rules(base, args.extra_rules, rng)
+    merchants = synthetic_merchants(rules, args.merchants, args.distinct, rng)
+    n_keys = sum(len(k) for k in rules.values())
+    print(f"{len(merchants)} merchants ({args.distinct} distinct), {n_keys} keywords in {len(rules)} categories")
+
+    t_naive, expected = timed(lambda m: naive_rule_category(m, rules), merchants)
+    t0 = time.perf_counter()
+    matcher = RuleMatcher(rules)
+    t_compile = time.perf_counter() - t0
+    matcher.CACHE_LIMIT = 0  # cold: every lookup runs the regex
+    t_cold, got = timed(matcher.match, merchants)
+    assert got == expected, "RuleMatcher disagrees with the naive scan"
+    matcher = RuleMatcher(rules)
+    t_warm, got = timed(matcher.match, merchants)
+    assert got == expected, "RuleMatcher disagrees with the naive scan"
+
+    for label, t in (("naive scan", t_naive), ("compiled, no memo", t_cold), ("compiled + memo", t_warm)):
+        print(f"{label:<18} {t * 1000:9.1f} ms  {len(merchants) / t:12,.0f} merchants/s")
+    print(f"{'compile':<18} {t_compile * 1000:9.1f} ms")
+
+if __name__ == '__main__':
+    main()
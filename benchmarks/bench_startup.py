@@ -0,0 +1,103 @@
+"""Benchmark cold start: importing app.py, building the Flask app, and the slowest imports.
+
+    python benchmarks/bench_startup.py --config config.json --runs 5
+
+Each run is a fresh interpreter, so nothing is served from sys.modules. Runs use
+a copy of the config in a temp dir whose databases start empty, so the real
+ledger is never opened and migrations don't count toward the timings.
+"""
+import argparse, json, os, shutil, statistics, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = {
+    "import app": "import app",
+    "create_app": "import app; app.create_app({config!r})",
+    "first request (/)": "import app; app.create_app({config!r}).test_client().get('/')",
+}
+# Modules that must not be loaded by create_app alone
+HEAVY = ("sklearn", "pdfplumber", "googleapiclient", "google_auth_oauthlib", "requests", "yaml")
+
+# Set by main to the temp dir holding the config copy; subprocesses run there
+WORKDIR = None
+
+def sandbox_config(config: str, workdir: str) -> str:
+    """Copy config into workdir with every database path pointing at a fresh file there."""
+    is_json = config.lower().endswith(".json")
+    if not is_json:
+        import yaml
+    with open(config, encoding="utf-8") as f:
+        cfg = json.load(f) if is_json else yaml.safe_load(f)
+    cfg.setdefault("database", {})["path"] = os.path.join(workdir, "transactions.db")
+    for name, overlay in (cfg.get("profiles") or {}).items():
+        if (overlay or {}).get("database", {}).get("path"):
+            overlay["database"]["path"] = os.path.join(workdir, f"transactions.{name}.db")
+    path = os.path.join(workdir, os.path.basename(config))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cfg, f) if is_json else yaml.safe_dump(cfg, f)
+    return path
+
+def fresh_databases():
+    # Every create_app run starts from an empty ledger, like a first start
+    for name in os.listdir(WORKDIR):
+        if name.startswith("transactions."):
+            os.remove(os.path.join(WORKDIR, name))
+
+def _env() -> dict:
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+
+def run(code: str) -> float:
+    fresh_databases()
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=WORKDIR, env=_env(), check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+def slowest_imports(config: str, top: int):
+    # -X importtime writes "import time: self [us] | cumulative | imported package" to stderr
+    code = STAGES["create_app"].format(config=config)
+    fresh_databases()
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=WORKDIR, env=_env(),
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in out.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2].startswith("  "):
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def loaded_heavy(config: str):
+    code = (STAGES["create_app"].format(config=config) +
+            f"; import sys; print(','.join(m for m in {HEAVY!r} if m in sys.modules))")
+    fresh_databases()
+    out = subprocess.run([sys.executable, "-c", code], cwd=WORKDIR, env=_env(), capture_output=True, text=True, check=True)
+    return [m for m in out.stdout.strip().splitlines()[-1].split(",") if m] if out.stdout.strip() else []
+
+def main():
+    global WORKDIR
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--config", default="config.json")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=10, help="top-level imports to list by cumulative time")
+    args = ap.parse_args()
+    WORKDIR = tempfile.mkdtemp(prefix="tc_startup_")
+    try:
+        measure(sandbox_config(os.path.abspath(args.config), WORKDIR), args)
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+def measure(config: str, args):
+    run("pass")  # warm the OS file cache
+    base = statistics.median(run("pass") for _ in range(args.runs))
+    print(f"{'interpreter':<18} {base * 1000:8.0f} ms")
+    for label, code in STAGES.items():
+        t = statistics.median(run(code.format(config=config)) for _ in range(args.runs))
+        print(f"{label:<18} {t * 1000:8.0f} ms  (+{(t - base) * 1000:.0f} ms over bare interpreter)")
+
+    print(f"\nslowest top-level imports during create_app:")
+    for us, name in slowest_imports(config, args.top):
+        print(f"  {us / 1000:8.1f} ms  {name}")
+    heavy = loaded_heavy(config)
+    print(f"\nheavy modules loaded by create_app: {', '.join(heavy) if heavy else 'none'}")
+
+if __name__ == "__main__":
+    main()
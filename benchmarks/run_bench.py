@@ -0,0 +1,361 @@
+"""End-to-end benchmark: ingest, categorize and serve a synthetic ledger, timing every stage.
+
+    python benchmarks/run_bench.py --size 100k --out results/before.json
+    python benchmarks/run_bench.py --size 100k --out results/after.json --compare results/before.json
+
+Works on a copy of the prebuilt database from synth.py (built on first use).
+Gmail and the SMS bridge are in-process stubs serving synth.py messages, so
+fetcher timings cover paging, batching, parsing and writes but no network
+unless --rtt-ms adds a simulated round trip. Stages whose optional
+dependency is missing are recorded as skipped, so results from different
+machines still line up key by key.
+"""
+import argparse, codecs, copy, datetime, json, os, platform, random, re, shutil, sqlite3, statistics
+import subprocess, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+import synth
+from database import BatchWriter, ConnectionManager, upsert_transaction
+
+# --- Stub services ----------------------------------------------------------------
+
+class _Request:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+class _Batch:
+    def __init__(self, callback, rtt: float):
+        self.callback = callback
+        self.rtt = rtt
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        # One HTTP round trip for the whole batch, as with googleapiclient
+        time.sleep(self.rtt)
+        for request_id, request in self.requests:
+            self.callback(request_id, request.fn(), None)
+
+class StubGmail:
+    """The users().messages().list/get and new_batch_http_request surface GmailFetcher uses.
+
+    by_query maps a configured search query to the message resources it matches;
+    "after:<epoch>" terms the fetcher appends are honoured.
+    """
+
+    def __init__(self, by_query: dict, rtt: float = 0.0):
+        self.by_query = by_query
+        self.by_id = {m["id"]: m for msgs in by_query.values() for m in msgs}
+        self.rtt = rtt
+        self.calls = 0
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, userId, q, maxResults=100, pageToken=None):
+        def run():
+            self.calls += 1
+            time.sleep(self.rtt)
+            msgs = next((m for query, m in self.by_query.items() if query in q), [])
+            after = re.search(r"after:(\d+)", q)
+            if after:
+                msgs = [m for m in msgs if int(m["internalDate"]) // 1000 > int(after.group(1))]
+            # Newest first, like Gmail
+            msgs = sorted(msgs, key=lambda m: int(m["internalDate"]), reverse=True)
+            start = int(pageToken or 0)
+            page = msgs[start:start + maxResults]
+            out = {"messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+                   "resultSizeEstimate": len(msgs)}
+            if start + maxResults < len(msgs):
+                out["nextPageToken"] = str(start + maxResults)
+            return out
+        return _Request(run)
+
+    def get(self, userId, id, format="full", metadataHeaders=None):
+        def run():
+            msg = self.by_id[id]
+            if format != "metadata":
+                return msg
+            wanted = {h.lower() for h in metadataHeaders or ()}
+            headers = [h for h in msg["payload"]["headers"] if not wanted or h["name"].lower() in wanted]
+            return dict(msg, payload={"mimeType": msg["payload"]["mimeType"], "headers": headers})
+        return _Request(run)
+
+    def new_batch_http_request(self, callback=None):
+        self.calls += 1
+        return _Batch(callback, self.rtt)
+
+class StubSMSResponse:
+    def __init__(self, body: bytes):
+        self.body = body
+        self.encoding = "utf-8"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        for i in range(0, len(self.body), chunk_size):
+            chunk = self.body[i:i + chunk_size]
+            yield decoder.decode(chunk) if decode_unicode else chunk
+
+class StubSMSSession:
+    """A requests-like session for SMSFetcher answering with a JSON array; honours ?since=."""
+
+    def __init__(self, messages: list, rtt: float = 0.0):
+        self.messages = messages
+        self.rtt = rtt
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        time.sleep(self.rtt)
+        since = (params or {}).get("since") or ""
+        msgs = [m for m in self.messages if str(m.get("date") or "") > since]
+        return StubSMSResponse(json.dumps(msgs, ensure_ascii=False).encode("utf-8"))
+
+# --- Runner -------------------------------------------------------------------------
+
+class Skipped(Exception):
+    pass
+
+def measure(results: dict, name: str, fn):
+    """Time fn() once; it returns the number of rows it handled (or None)."""
+    try:
+        t0 = time.perf_counter()
+        rows = fn()
+        secs = time.perf_counter() - t0
+    except (ImportError, Skipped) as e:
+        results[name] = {"skipped": str(e) or type(e).__name__}
+        print(f"  {name:<28} skipped: {results[name]['skipped']}")
+        return
+    entry = {"seconds": round(secs, 6)}
+    if rows is not None:
+        entry["rows"] = int(rows)
+        entry["rows_per_s"] = round(rows / secs, 1) if secs > 0 else None
+    results[name] = entry
+    print(f"  {name:<28} {secs * 1000:10.1f} ms" + (f"  {rows:>9,} rows" if rows is not None else ""))
+
+def bench_config(base: dict, db: str, work: str, workers: int) -> dict:
+    cfg = copy.deepcopy(base)
+    cfg.pop("profiles", None)
+    cfg.pop("default_profile", None)
+    cfg["database"] = dict(cfg.get("database", {}), path=db)
+    cfg["gmail"] = dict(cfg.get("gmail", {}), enabled=True, token_file=os.path.join(work, "token.json"))
+    cfg["sms"] = dict(cfg.get("sms", {}), enabled=True, android_api_url="stub://sms")
+    cfg["statements"] = dict(cfg.get("statements", {}), enabled=True, workers=workers,
+                             folder=os.path.join(work, "statements"))
+    cfg["categorizer"] = dict(cfg.get("categorizer", {}), model_path=os.path.join(work, "model.pkl"))
+    cfg["analytics"] = dict(cfg.get("analytics", {}), export_dir=os.path.join(work, "columns"))
+    cfg["metrics"] = {"enabled": False}
+    return cfg
+
+def new_rows(n: int, rng: random.Random, tag: str) -> list:
+    today = datetime.date.today()
+    out = []
+    for i in range(n):
+        s = synth.spend(rng, today - datetime.timedelta(days=rng.randrange(30)))
+        out.append({"date": s["date"].isoformat(), "merchant": s["merchant"], "amount": s["amount"],
+                    "source": "sms", "raw_snippet": f"{tag} {i} " + synth.sms_message(s, rng)["body"]})
+    return out
+
+def run_stages(cfg: dict, db: ConnectionManager, activity: dict, args) -> dict:
+    import nlp_categorizer
+    results = {}
+    rng = random.Random(args.seed)
+    print("pipeline")
+
+    rows = new_rows(args.ingest, rng, "bench")
+    def write_batch():
+        with BatchWriter(db, cfg["database"].get("batch_size", 500)) as w:
+            for tx in rows:
+                w.add(dict(tx))
+        return w.inserted + w.updated + w.skipped
+    measure(results, "batch_writer.insert", write_batch)
+    measure(results, "batch_writer.duplicates", write_batch)
+    singles = new_rows(args.single_rows, rng, "single")
+    def write_singles():
+        for tx in singles:
+            upsert_transaction(db, dict(tx))
+        return len(singles)
+    measure(results, "upsert_transaction", write_singles)
+
+    by_query = {cfg["gmail"]["search_queries"][source]: msgs for source, msgs in activity["gmail"].items()
+                if source in cfg["gmail"].get("search_queries", {})}
+    rtt = args.rtt_ms / 1000.0
+    def gmail():
+        from gmail_fetcher import GmailFetcher
+        return GmailFetcher(cfg=cfg, db=db, service=StubGmail(by_query, rtt)).run()
+    measure(results, "fetch.gmail", gmail)
+    measure(results, "fetch.gmail.repeat", gmail)
+    def sms():
+        from sms_fetcher import SMSFetcher
+        return SMSFetcher(cfg=cfg, db=db, session=StubSMSSession(activity["sms"], rtt)).run()
+    measure(results, "fetch.sms", sms)
+    def statements():
+        from statement_fetcher import StatementFetcher
+        if any(n.endswith(".pdf") for n in os.listdir(cfg["statements"]["folder"])):
+            import pdfplumber  # noqa: F401  (skip rather than record every PDF as a parse error)
+        return StatementFetcher(cfg=cfg, db=db).run()
+    measure(results, "fetch.statements", statements)
+
+    measure(results, "apply_rules", lambda: nlp_categorizer.apply_rules(db, cfg))
+    def train():
+        import sklearn  # noqa: F401
+        return nlp_categorizer.train_and_predict(db, cfg)
+    measure(results, "train_and_predict", train)
+    def insights(full: bool):
+        import insights
+        return sum(insights.run(db, cfg, full=full))
+    measure(results, "insights.full", lambda: insights(True))
+    measure(results, "insights.incremental", lambda: insights(False))
+    def export():
+        import columnar
+        return columnar.export(db, columnar.export_dir(cfg), incremental=False)["rows"]
+    measure(results, "columnar.export", export)
+    return results
+
+def endpoints(today: datetime.date) -> dict:
+    year_ago = (today - datetime.timedelta(days=365)).isoformat()
+    return {
+        "summary": "/api/summary",
+        "summary.last_year": f"/api/summary?start={year_ago}",
+        "transactions": "/api/transactions",
+        "transactions.category": "/api/transactions?category=Food&limit=200",
+        "transactions.merchant_prefix": "/api/transactions?merchant=SWI",
+        "transactions.amount_range": "/api/transactions?min_amount=5000&max_amount=20000",
+        "search": "/api/search?q=amazon",
+        "search.prefix": "/api/search?q=netfl",
+        "insights": "/api/insights",
+    }
+
+def run_endpoints(config_path: str, args) -> dict:
+    results = {}
+    print("endpoints")
+    try:
+        import app
+        flask_app = app.create_app(config_path)
+    except ImportError as e:
+        for name in endpoints(datetime.date.today()):
+            results[name] = {"skipped": str(e)}
+        print(f"  skipped: {e}")
+        return results
+    client = flask_app.test_client()
+    cache = app.PROFILES[app.DEFAULT_PROFILE].response_cache
+    for name, url in endpoints(datetime.date.today()).items():
+        cold = []
+        for _ in range(args.requests):
+            cache.clear()
+            t0 = time.perf_counter()
+            resp = client.get(url)
+            cold.append(time.perf_counter() - t0)
+        etag = resp.headers.get("ETag")
+        warm = []
+        for _ in range(args.requests):
+            t0 = time.perf_counter()
+            client.get(url, headers={"If-None-Match": etag} if etag else {})
+            warm.append(time.perf_counter() - t0)
+        results[name] = {"url": url, "status": resp.status_code, "bytes": len(resp.get_data()),
+                         "median_ms": round(statistics.median(cold) * 1000, 3),
+                         "p95_ms": round(sorted(cold)[int(0.95 * (len(cold) - 1))] * 1000, 3),
+                         "revalidate_median_ms": round(statistics.median(warm) * 1000, 3)}
+        r = results[name]
+        print(f"  {name:<28} {r['median_ms']:10.2f} ms  p95 {r['p95_ms']:8.2f} ms  "
+              f"304 {r['revalidate_median_ms']:6.2f} ms  {r['bytes']:>9,} B")
+    return results
+
+def environment(args, rows: int) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"size": args.size, "rows": rows, "seed": args.seed, "ingest": args.ingest, "messages": args.messages,
+            "rtt_ms": args.rtt_ms, "commit": commit, "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version, "platform": platform.platform(), "cpus": os.cpu_count(),
+            "started": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z"}
+
+def compare(current: dict, baseline: dict):
+    print(f"\ncompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('started')}):")
+    differ = [k for k in ("rows", "messages", "ingest", "rtt_ms") if current["meta"].get(k) != baseline["meta"].get(k)]
+    if differ:
+        print(f"  note: runs differ in {', '.join(differ)}; ratios are not like for like")
+    for section, field in (("stages", "seconds"), ("endpoints", "median_ms")):
+        for name, entry in current[section].items():
+            old = baseline.get(section, {}).get(name, {})
+            if field not in entry or field not in old:
+                continue
+            ratio = entry[field] / old[field] if old[field] else float("inf")
+            print(f"  {section[:-1]:<9} {name:<28} {old[field]:10.4f} -> {entry[field]:10.4f}  x{ratio:5.2f}")
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--size", default="10k", help="prebuilt database size: 10k, 100k, 1m or a row count")
+    ap.add_argument("--data", default=os.path.join(ROOT, "bench_data"), help="where prebuilt databases are kept (synth.py --out)")
+    ap.add_argument("--config", default=os.path.join(ROOT, "config.json"), help="rules and settings to start from")
+    ap.add_argument("--messages", type=int, default=5000, help="new Gmail/SMS/statement items to fetch")
+    ap.add_argument("--ingest", type=int, default=20000, help="rows written through BatchWriter")
+    ap.add_argument("--single-rows", type=int, default=500, help="rows written one by one via upsert_transaction")
+    ap.add_argument("--requests", type=int, default=20, help="requests per endpoint")
+    ap.add_argument("--rtt-ms", type=float, default=0.0, help="simulated round trip per Gmail/SMS call")
+    ap.add_argument("--workers", type=int, default=0, help="statement parser processes (0: one per CPU)")
+    ap.add_argument("--rebuild", action="store_true", help="regenerate the database and messages")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", help="write results as JSON here")
+    ap.add_argument("--compare", help="earlier results JSON to compare against")
+    args = ap.parse_args()
+
+    rows = synth.parse_size(args.size)
+    os.makedirs(args.data, exist_ok=True)
+    prebuilt = synth.db_path(args.data, args.size)
+    if args.rebuild or not os.path.exists(prebuilt):
+        t0 = time.perf_counter()
+        synth.build_db(prebuilt, rows, random.Random(f"{args.seed}:{args.size}"))
+        print(f"built {prebuilt} ({rows:,} rows) in {time.perf_counter() - t0:.1f} s")
+    activity = synth.recent_activity(args.messages, 30, random.Random(args.seed))
+
+    work = tempfile.mkdtemp(prefix="tc_bench_")
+    try:
+        db_file = os.path.join(work, "bench.db")
+        shutil.copyfile(prebuilt, db_file)
+        synth.write_statements(os.path.join(work, "statements"), activity["statements"])
+        with open(args.config, encoding="utf-8") as f:
+            base = json.load(f) if args.config.lower().endswith(".json") else __import__("yaml").safe_load(f)
+        cfg = bench_config(base, db_file, work, args.workers or os.cpu_count() or 1)
+        config_path = os.path.join(work, "config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(cfg, f)
+        print(f"{rows:,} rows, {args.messages} new messages, work dir {work}")
+        result = {"meta": environment(args, rows)}
+        db = ConnectionManager.from_config(cfg)
+        result["stages"] = run_stages(cfg, db, activity, args)
+        result["endpoints"] = run_endpoints(config_path, args)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nresults written to {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+if __name__ == "__main__":
+    main()
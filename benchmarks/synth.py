@@ -0,0 +1,309 @@
+"""Synthetic ledgers for benchmarks: Gmail messages, SMS, statement files and databases.
+
+    python benchmarks/synth.py --out bench_data --sizes 10k,100k,1m
+
+Writes db_<size>.db for every size, plus gmail.json (Gmail API message
+resources by source), sms.json (an SMS bridge response) and statements/
+(CSV and PDF) holding recent activity to ingest on top of them. Everything
+follows from --seed; dates count back from today.
+"""
+import argparse, base64, datetime, itertools, json, os, random, sys, time
+from email.utils import format_datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import init_db, tx_fingerprint
+
+SIZES = {"10k": 10000, "100k": 100000, "1m": 1000000}
+
+# (name as banks print it, category the default rules give it or None, amount range, relative frequency)
+MERCHANTS = [
+    ("AMAZON", "Shopping", 199, 4999, 8), ("FLIPKART", "Shopping", 299, 8999, 5), ("MYNTRA", "Shopping", 499, 3999, 2),
+    ("SWIGGY", "Food", 120, 900, 12), ("ZOMATO", "Food", 150, 1200, 10), ("DOMINOS PIZZA", "Food", 250, 900, 3),
+    ("KFC", "Food", 200, 800, 2), ("HP PETROL PUMP", "Fuel", 500, 3000, 4), ("INDIAN OIL", "Fuel", 500, 3500, 3),
+    ("UBER INDIA", "Travel", 90, 800, 10), ("OLA CABS", "Travel", 80, 700, 6), ("IRCTC", "Travel", 300, 4000, 1),
+    ("INDIGO", "Travel", 2500, 12000, 0.3), ("BESCOM ELECTRICITY", "Bills", 600, 4000, 0.5),
+    ("AIRTEL MOBILE RECHARGE", "Bills", 199, 999, 1), ("BIGBASKET", None, 400, 3500, 6), ("DMART", None, 300, 5000, 4),
+    ("APOLLO PHARMACY", None, 100, 2500, 3), ("STARBUCKS", None, 250, 900, 3), ("DECATHLON", None, 500, 6000, 1),
+    ("CROMA", None, 999, 45000, 0.2), ("PVR CINEMAS", None, 300, 1500, 1), ("URBAN COMPANY", None, 299, 2500, 1),
+]
+_CUM_WEIGHTS = list(itertools.accumulate(m[4] for m in MERCHANTS))
+# (name, amount, days between payments): the recurring payments insights should find
+SUBSCRIPTIONS = [
+    ("NETFLIX", 649, 30), ("SPOTIFY", 119, 30), ("YOUTUBE PREMIUM", 129, 30), ("ACT BROADBAND", 1050, 30),
+    ("GYM MEMBERSHIP", 1500, 30), ("LIC PREMIUM", 12500, 91), ("AMAZON PRIME", 1499, 365),
+]
+# What the ML model is taught for merchants no rule covers
+GUESSES = {"BIGBASKET": "Groceries", "DMART": "Groceries", "APOLLO PHARMACY": "Health", "STARBUCKS": "Food",
+           "DECATHLON": "Shopping", "CROMA": "Shopping", "PVR CINEMAS": "Entertainment",
+           "URBAN COMPANY": "Services", "GYM MEMBERSHIP": "Health", "LIC PREMIUM": "Insurance"}
+CITIES = ["", " BANGALORE", " MUMBAI", " NEW DELHI", " PUNE", " HYDERABAD", " CHENNAI"]
+BANKS = [("VM-HDFCBK", "hdfc"), ("SBICRD", "sbi"), ("ICICIB", "icici"), ("AX-AXISBK", "axis")]
+
+SMS_TEMPLATES = {
+    "hdfc": "Spent Rs.{amt} On HDFC Bank Card {card} At {m} On {d}:10:00:00. Not You? Call 18002586161",
+    "sbi": "Rs.{amt} spent on your SBI Credit Card ending {card} at {m} on {d}. Trxn not done by you? Call 18001801290",
+    "icici": "INR {amt} spent on ICICI Bank Card XX{card} on {d} at {m}. Avl Lmt: INR 1,00,000.00",
+    "axis": "INR {amt} spent at {m} on Axis Bank Card no. XX{card} on {d}. Avl Lmt INR 82,100.50",
+}
+NOISE_SMS = ["Your OTP for login is {card}. Do not share it with anyone.",
+             "Dear Customer, your statement for card XX{card} is ready. Total due Rs.{amt}, due on {d}."]
+# Bodies of real receipts are mostly layout; this keeps the decoded size realistic
+RECEIPT_FILLER = ("<tr><td style='padding:4px;font-family:Arial'>Thank you for shopping with us. "
+                  "Track your package from Your Orders.</td></tr>\n")
+
+def parse_size(text: str) -> int:
+    return SIZES.get(text.lower()) or int(text.replace("_", ""))
+
+def fmt_amount(amount: float, rng: random.Random) -> str:
+    return f"{amount:,.2f}" if rng.random() < 0.5 else f"{amount:.2f}"
+
+def spend(rng: random.Random, day: datetime.date) -> dict:
+    """One card/UPI spend: merchant as printed on the alert, its base name and amount."""
+    name, category, low, high, _ = rng.choices(MERCHANTS, cum_weights=_CUM_WEIGHTS)[0]
+    # Most spends near the bottom of the range; one in a hundred is an outlier far above it
+    amount = rng.triangular(low, high, low)
+    if rng.random() < 0.01:
+        amount *= rng.uniform(3, 8)
+    amount = round(amount, 2)
+    printed = name + rng.choice(CITIES) if rng.random() < 0.7 else f"{name}*{rng.randrange(1000, 9999)}"
+    return {"date": day, "merchant": printed, "base": name, "category": category, "amount": amount}
+
+def subscription_spends(first: datetime.date, last: datetime.date, rng: random.Random):
+    for name, amount, every in SUBSCRIPTIONS:
+        day = first + datetime.timedelta(days=rng.randrange(every))
+        while day <= last:
+            # Prices move now and then; dates slip by a day or two
+            price = amount * (1.15 if rng.random() < 0.05 else 1.0)
+            yield {"date": day, "merchant": name, "base": name, "category": "Subscriptions" if every < 365 else None,
+                   "amount": round(price, 2)}
+            day += datetime.timedelta(days=every + rng.choice((-1, 0, 0, 0, 1, 2)))
+
+def sms_message(s: dict, rng: random.Random) -> dict:
+    """An SMS bridge record ({address, body, date}) announcing spend s."""
+    sender, bank = rng.choice(BANKS)
+    d = s["date"]
+    body = SMS_TEMPLATES[bank].format(amt=fmt_amount(s["amount"], rng), card=rng.randrange(1000, 9999),
+                                      m=s["merchant"], d=d.strftime("%d-%m-%y"))
+    return {"address": sender, "body": body, "date": f"{d.isoformat()}T{rng.randrange(8, 23):02d}:{rng.randrange(60):02d}:00"}
+
+def noise_sms(day: datetime.date, rng: random.Random) -> dict:
+    body = rng.choice(NOISE_SMS).format(card=rng.randrange(1000, 9999), amt=fmt_amount(rng.uniform(500, 90000), rng),
+                                        d=day.strftime("%d-%m-%y"))
+    return {"address": rng.choice(BANKS)[0], "body": body, "date": day.isoformat() + "T09:00:00"}
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+
+def gmail_source(s: dict) -> str:
+    return {"AMAZON": "amazon", "FLIPKART": "flipkart"}.get(s["base"], "sbi_txn")
+
+def gmail_message(s: dict, msg_id: str, rng: random.Random, body_kb: int = 24) -> dict:
+    """A users.messages.get(format="full") resource for spend s, as the Gmail API returns it."""
+    source = gmail_source(s)
+    sent = datetime.datetime.combine(s["date"], datetime.time(rng.randrange(8, 23), rng.randrange(60)),
+                                     tzinfo=datetime.timezone(datetime.timedelta(hours=5, minutes=30)))
+    amt = fmt_amount(s["amount"], rng)
+    if source == "sbi_txn":
+        sender, subject = "onlinesbicard@sbicard.com", "Transaction Alert from SBI Card"
+        text = (f"Rs.{amt} spent on your SBI Credit Card ending {rng.randrange(1000, 9999)} at {s['merchant']} "
+                f"on {s['date'].strftime('%d/%m/%y')}. Trxn not done by you? Report at sbicard.com")
+        snippet = text[:200]
+    else:
+        shop = source.title()
+        sender = "auto-confirm@amazon.in" if source == "amazon" else "noreply@flipkart.com"
+        subject = f"Your Amazon.in order #40{rng.randrange(10**6, 10**7)}" if source == "amazon" \
+            else f"Order Confirmation - Flipkart OD{rng.randrange(10**11, 10**12)}"
+        text = f"Hello, thank you for your {shop} order.\nOrder Total: ₹{amt}\n"
+        # Half the receipts show the total in the snippet; the rest need the full body fetched
+        snippet = text.replace("\n", " ")[:200] if rng.random() < 0.5 else f"Hello, thank you for your {shop} order."
+    html = "<html><body><table>" + text.replace("\n", "<br>") + RECEIPT_FILLER * (body_kb * 1024 // len(RECEIPT_FILLER)) \
+        + "</table></body></html>"
+    parts = [{"mimeType": "text/plain", "body": {"data": _b64(text), "size": len(text)}},
+             {"mimeType": "text/html", "body": {"data": _b64(html), "size": len(html)}}]
+    if source != "sbi_txn":
+        parts.append({"mimeType": "application/pdf", "filename": "invoice.pdf",
+                      "body": {"attachmentId": "att" + msg_id, "size": 48213}})
+    return {
+        "id": msg_id, "threadId": msg_id, "labelIds": ["INBOX", "CATEGORY_UPDATES"],
+        "internalDate": str(int(sent.timestamp() * 1000)), "snippet": snippet,
+        "payload": {"mimeType": "multipart/mixed", "headers": [
+            {"name": "From", "value": sender}, {"name": "Subject", "value": subject},
+            {"name": "Date", "value": format_datetime(sent)}, {"name": "To", "value": "me@example.com"},
+        ], "parts": parts},
+    }
+
+def statement_line(s: dict) -> tuple:
+    return s["date"].strftime("%d-%m-%Y"), f"POS {s['merchant']}", f"{s['amount']:,.2f}"
+
+def write_statement_csv(path: str, spends):
+    import csv
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["Date", "Description", "Amount"])
+        # ISO dates: parse_csv keeps the first ten characters as they are
+        w.writerows((s["date"].isoformat(),) + statement_line(s)[1:] for s in spends)
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_statement_pdf(path: str, spends, lines_per_page: int = 60):
+    """A plain text-layer PDF (Helvetica, one row per line), like most card statements."""
+    rows = [" ".join(statement_line(s)) for s in spends]
+    pages = [rows[i:i + lines_per_page] for i in range(0, len(rows), lines_per_page)] or [[]]
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        ops = ["BT /F1 9 Tf 12 TL 40 800 Td", "(Date Description Amount) Tj T*"]
+        ops += [f"({_pdf_escape(line)}) Tj T*" for line in lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for n, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % n + (obj if isinstance(obj, bytes) else obj.encode("latin-1")) + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+def recent_activity(n: int, days: int, rng: random.Random, body_kb: int = 24, id_offset: int = 0) -> dict:
+    """About n new messages from the last `days` days, split the way a real inbox is.
+
+    Returns {"gmail": {source: [message, ...]}, "sms": [...], "statements": [spend, ...]}.
+    """
+    today = datetime.date.today()
+    out = {"gmail": {}, "sms": [], "statements": []}
+    for i in range(n):
+        s = spend(rng, today - datetime.timedelta(days=rng.randrange(days)))
+        r = rng.random()
+        if r < 0.35:
+            msg = gmail_message(s, "%016x" % (0x18c0000000000000 + id_offset + i), rng, body_kb)
+            out["gmail"].setdefault(gmail_source(s), []).append(msg)
+        elif r < 0.85:
+            out["sms"].append(sms_message(s, rng) if rng.random() < 0.9 else noise_sms(s["date"], rng))
+        else:
+            out["statements"].append(s)
+    return out
+
+def ledger_rows(rows: int, years: int, rng: random.Random, pending_share: float = 0.05):
+    """Transaction rows (column dicts) as the fetchers would have stored them, oldest first.
+
+    The newest pending_share of rows are uncategorized, as right after an ingest;
+    older ones carry the rule or ML category a previous cycle gave them.
+    """
+    last = datetime.date.today()
+    first = last - datetime.timedelta(days=365 * years)
+    subs = sorted(subscription_spends(first, last, rng), key=lambda s: s["date"])
+    step = (365 * years) / max(1, rows - len(subs))
+    spends, j = [], 0
+    for i in range(max(0, rows - len(subs))):
+        day = first + datetime.timedelta(days=int(i * step))
+        while j < len(subs) and subs[j]["date"] <= day:
+            spends.append(subs[j])
+            j += 1
+        spends.append(spend(rng, day))
+    spends += subs[j:]
+    spends = spends[:rows]
+    pending_from = int(len(spends) * (1 - pending_share))
+    written = datetime.datetime.utcnow() - datetime.timedelta(seconds=len(spends))
+    for i, s in enumerate(spends):
+        r = rng.random()
+        row = {"date": s["date"].isoformat(), "merchant": s["merchant"], "amount": s["amount"], "currency": "INR",
+               "category": None, "ai_category": None, "user_category": None,
+               "message_id": None, "subject": None, "from_email": None,
+               "updated_at": (written + datetime.timedelta(seconds=i)).isoformat()}
+        if r < 0.3:
+            msg = gmail_message(s, "%016x" % (0x1800000000000000 + i), rng, body_kb=0)
+            headers = {h["name"]: h["value"] for h in msg["payload"]["headers"]}
+            row.update(source=gmail_source(s), message_id=msg["id"], subject=headers["Subject"],
+                       from_email=headers["From"], raw_snippet=msg["snippet"])
+        elif r < 0.8:
+            row.update(source="sms", raw_snippet=sms_message(s, rng)["body"])
+        else:
+            row.update(source="statement", raw_snippet=" ".join(statement_line(s)))
+        if i < pending_from:
+            if s["category"]:
+                row["category"] = s["category"]
+            else:
+                row["ai_category"] = GUESSES.get(s["base"], "Other")
+            if rng.random() < 0.01:
+                row["user_category"] = rng.choice(("Gifts", "Work", "Reimbursable"))
+        row["fingerprint"] = tx_fingerprint(row)
+        yield row
+
+COLUMNS = ("date", "merchant", "category", "ai_category", "user_category", "amount", "currency", "source",
+           "message_id", "subject", "from_email", "raw_snippet", "updated_at", "fingerprint")
+
+def build_db(path: str, rows: int, rng: random.Random, years: int = 3) -> str:
+    """Create a database at path holding `rows` synthetic transactions (replacing any file there)."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = init_db(path)
+    sql = f"INSERT INTO transactions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+    batch = []
+    for row in ledger_rows(rows, years, rng):
+        batch.append(tuple(row[c] for c in COLUMNS))
+        if len(batch) == 50000:
+            conn.executemany(sql, batch)
+            conn.commit()
+            batch = []
+    conn.executemany(sql, batch)
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return path
+
+def db_path(out_dir: str, size: str) -> str:
+    return os.path.join(out_dir, f"db_{size.lower()}.db")
+
+def write_statements(folder: str, spends: list, files: int = 8, pdf_share: float = 0.5):
+    """Spread spends over `files` statements in folder (emptied first), PDF first then CSV."""
+    os.makedirs(folder, exist_ok=True)
+    for name in os.listdir(folder):
+        os.remove(os.path.join(folder, name))
+    per_file = -(-len(spends) // files) if spends else 0
+    for k in range(files):
+        chunk = spends[k * per_file:(k + 1) * per_file]
+        if not chunk:
+            break
+        if k < files * pdf_share:
+            write_statement_pdf(os.path.join(folder, f"statement_{k:02d}.pdf"), chunk)
+        else:
+            write_statement_csv(os.path.join(folder, f"statement_{k:02d}.csv"), chunk)
+    return folder
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--out", default="bench_data")
+    ap.add_argument("--sizes", default="10k,100k,1m", help="comma-separated row counts (10k, 100k, 1m or a number)")
+    ap.add_argument("--years", type=int, default=3)
+    ap.add_argument("--messages", type=int, default=5000, help="recent messages across Gmail, SMS and statements")
+    ap.add_argument("--days", type=int, default=30, help="span of the recent messages")
+    ap.add_argument("--body-kb", type=int, default=24, help="size of each e-mail's HTML body")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for size in args.sizes.split(","):
+        t0 = time.perf_counter()
+        path = build_db(db_path(args.out, size), parse_size(size), random.Random(f"{args.seed}:{size}"), args.years)
+        print(f"{path}: {parse_size(size):,} rows in {time.perf_counter() - t0:.1f} s")
+    activity = recent_activity(args.messages, args.days, random.Random(args.seed), args.body_kb)
+    with open(os.path.join(args.out, "gmail.json"), "w", encoding="utf-8") as f:
+        json.dump(activity["gmail"], f)
+    with open(os.path.join(args.out, "sms.json"), "w", encoding="utf-8") as f:
+        json.dump(activity["sms"], f, ensure_ascii=False)
+    folder = write_statements(os.path.join(args.out, "statements"), activity["statements"])
+    print(f"{sum(map(len, activity['gmail'].values()))} Gmail messages, {len(activity['sms'])} SMS, "
+          f"{len(activity['statements'])} statement rows in {len(os.listdir(folder))} files")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Columnar export of the transactions table for analysis without SQLite.
+
+An export directory holds generations of ``.npy`` files, one per column,
+plus a ``CURRENT`` file naming the complete one, so a reader never sees a
+half-written export. Merchant, category (the effective COALESCE of user, AI
+and rule categories) and source are dictionary-encoded as int32 codes;
+dates are ``datetime64[D]`` with NaT for missing ones. Re-exports only read
+rows whose ``updated_at`` moved past the previous run and patch them in.
+
+``Columns`` opens a generation as read-only memory maps; the helpers below
+aggregate them with bincount/cumsum instead of per-row Python.
+"""
+import json, os, shutil, time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+import numpy as np
+from database import Database, reading
+
+ENCODED = ("merchant", "category", "source")
+DTYPES = {"id": np.int64, "date": "datetime64[D]", "amount": np.float64,
+          "merchant": np.int32, "category": np.int32, "source": np.int32}
+
+SELECT_SQL = """
+    SELECT id, date, amount, merchant,
+           COALESCE(user_category, ai_category, category, 'Uncategorized'),
+           source, updated_at
+    FROM transactions{where} ORDER BY id
+"""
+
+def export_dir(cfg: dict) -> str:
+    path = cfg.get("analytics", {}).get("export_dir")
+    if path:
+        return path
+    return os.path.splitext(cfg["database"]["path"])[0] + ".columns"
+
+def _current(out_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(out_dir, "CURRENT"), encoding="utf-8") as f:
+            return os.path.join(out_dir, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+@contextmanager
+def _snapshot(conn):
+    # Changed rows and the row count must come from the same point in time
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+
+def to_dates(values) -> np.ndarray:
+    """ISO date strings as datetime64[D]; missing or unparseable ones become NaT."""
+    try:
+        return np.array([(v or "")[:10] for v in values], dtype="datetime64[D]")
+    except ValueError:
+        out = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[D]")
+        for i, v in enumerate(values):
+            try:
+                out[i] = np.datetime64((v or "")[:10], "D")
+            except ValueError:
+                pass
+        return out
+
+def _encode(values, vocab: list, index: dict) -> np.ndarray:
+    # Codes only ever get appended to vocab, so earlier generations' codes stay valid
+    if not values:
+        return np.empty(0, dtype=np.int32)
+    uniq, inverse = np.unique(np.array([v or "" for v in values], dtype=object), return_inverse=True)
+    lookup = np.empty(len(uniq), dtype=np.int32)
+    for i, u in enumerate(uniq):
+        code = index.get(u)
+        if code is None:
+            code = index[u] = len(vocab)
+            vocab.append(u)
+        lookup[i] = code
+    return lookup[inverse.reshape(-1)]
+
+def _columns_from_rows(rows, vocabs: dict, indexes: dict) -> dict:
+    ids, dates, amounts, merchants, cats, sources, _ = zip(*rows) if rows else ((),) * 7
+    return {
+        "id": np.array(ids, dtype=np.int64),
+        "date": to_dates(dates),
+        "amount": np.array(amounts, dtype=np.float64),  # None becomes NaN
+        "merchant": _encode(merchants, vocabs["merchant"], indexes["merchant"]),
+        "category": _encode(cats, vocabs["category"], indexes["category"]),
+        "source": _encode(sources, vocabs["source"], indexes["source"]),
+    }
+
+def export(db: Database, out_dir: str, incremental: bool = True) -> dict:
+    """Write a new generation if anything changed; returns its manifest.
+
+    Falls back to a full export when there is no previous one or when the
+    row count shows deletes, which updated_at cannot reveal.
+    """
+    prev = _current(out_dir) if incremental else None
+    conn = reading(db)
+    with _snapshot(conn):
+        if prev:
+            manifest = json.load(open(os.path.join(prev, "manifest.json"), encoding="utf-8"))
+            # >= so rows written in the watermark's own microsecond are not missed; patching is idempotent
+            rows = conn.execute(SELECT_SQL.format(where=" WHERE updated_at >= ? OR id > ?"),
+                                (manifest["watermark"] or "", manifest["max_id"])).fetchall()
+        else:
+            rows = conn.execute(SELECT_SQL.format(where="")).fetchall()
+        total = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    if prev:
+        vocabs = json.load(open(os.path.join(prev, "dictionaries.json"), encoding="utf-8"))
+        cols = {name: np.load(os.path.join(prev, name + ".npy")) for name in DTYPES}
+    else:
+        vocabs = {name: [] for name in ENCODED}
+        cols = None
+    indexes = {name: {v: i for i, v in enumerate(vocabs[name])} for name in ENCODED}
+    fresh = _columns_from_rows(rows, vocabs, indexes)
+    watermark = max((r[6] for r in rows if r[6]), default=None)
+
+    if cols is not None:
+        pos = np.searchsorted(cols["id"], fresh["id"])
+        found = pos < len(cols["id"])
+        found[found] = cols["id"][pos[found]] == fresh["id"][found]
+        appended = ~found
+        # AUTOINCREMENT ids only grow, so anything not patched must be past the old end
+        if appended.any() and fresh["id"][appended].min() <= manifest["max_id"]:
+            return export(db, out_dir, incremental=False)
+        unchanged = all(np.array_equal(cols[name][pos[found]], fresh[name][found], equal_nan=True)
+                        for name in ("date", "amount") + ENCODED)
+        if not appended.any() and unchanged and total == len(cols["id"]):
+            return manifest
+        for name in DTYPES:
+            cols[name][pos[found]] = fresh[name][found]
+            cols[name] = np.concatenate([cols[name], fresh[name][appended]])
+        if len(cols["id"]) != total:
+            return export(db, out_dir, incremental=False)
+        watermark = max(filter(None, (watermark, manifest["watermark"])), default=None)
+    else:
+        cols = fresh
+
+    generation = "g%d" % time.time_ns()
+    path = os.path.join(out_dir, generation)
+    os.makedirs(path)
+    for name in DTYPES:
+        np.save(os.path.join(path, name + ".npy"), cols[name].astype(DTYPES[name], copy=False))
+    with open(os.path.join(path, "dictionaries.json"), "w", encoding="utf-8") as f:
+        json.dump(vocabs, f, ensure_ascii=False)
+    manifest = {"generation": generation, "rows": int(len(cols["id"])),
+                "max_id": int(cols["id"].max()) if len(cols["id"]) else 0,
+                "watermark": watermark, "patched": len(rows)}
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    tmp = os.path.join(out_dir, "CURRENT.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(generation)
+    os.replace(tmp, os.path.join(out_dir, "CURRENT"))
+    for old in os.listdir(out_dir):
+        if old != generation and old.startswith("g"):
+            # Open memory maps keep working on POSIX; elsewhere the next export retries
+            shutil.rmtree(os.path.join(out_dir, old), ignore_errors=True)
+    return manifest
+
+def export_parquet(cols: "Columns", path: str):
+    """Write the columns as Parquet with dictionary-typed string columns (needs pyarrow)."""
+    import pyarrow as pa, pyarrow.parquet as pq
+    table = pa.table({
+        "id": cols.id, "date": cols.date, "amount": cols.amount,
+        **{name: pa.DictionaryArray.from_arrays(np.asarray(getattr(cols, name)), pa.array(cols.dictionaries[name]))
+           for name in ENCODED},
+    })
+    pq.write_table(table, path)
+
+class Columns:
+    """The current export generation; arrays are read-only memory maps unless mmap=False."""
+
+    def __init__(self, out_dir: str, mmap: bool = True):
+        path = _current(out_dir)
+        if path is None:
+            raise FileNotFoundError(f"no columnar export in {out_dir}")
+        mode = "r" if mmap else None
+        self.manifest = json.load(open(os.path.join(path, "manifest.json"), encoding="utf-8"))
+        self.dictionaries = json.load(open(os.path.join(path, "dictionaries.json"), encoding="utf-8"))
+        for name in DTYPES:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode=mode))
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def code(self, column: str, value: str) -> int:
+        try:
+            return self.dictionaries[column].index(value)
+        except ValueError:
+            return -1
+
+    def mask(self, start: str = None, end: str = None, category: str = None, source: str = None) -> np.ndarray:
+        """Row filter with the same meaning as the /api/transactions parameters."""
+        m = np.ones(len(self), dtype=bool)
+        if start:
+            m &= self.date >= np.datetime64(start, "D")
+        if end:
+            m &= self.date <= np.datetime64(end, "D")
+        if category:
+            m &= self.category == self.code("category", category)
+        if source:
+            m &= self.source == self.code("source", source)
+        return m
+
+def _selected(cols: Columns, mask) -> Tuple[np.ndarray, np.ndarray]:
+    dated = ~np.isnat(cols.date)
+    if mask is not None:
+        dated &= mask
+    amount = cols.amount[dated]
+    return cols.date[dated], np.where(np.isnan(amount), 0.0, amount)
+
+def monthly_spend(cols: Columns, mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(months as datetime64[M], total amount per month), every month in range included."""
+    dates, amount = _selected(cols, mask)
+    if not len(dates):
+        return np.empty(0, dtype="datetime64[M]"), np.empty(0)
+    months = dates.astype("datetime64[M]").astype(np.int64)
+    first = months.min()
+    totals = np.bincount(months - first, weights=amount)
+    return np.arange(first, first + len(totals)).astype("datetime64[M]"), totals
+
+def daily_spend(cols: Columns, mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(days as datetime64[D], total amount per day), with zero for days without rows."""
+    dates, amount = _selected(cols, mask)
+    if not len(dates):
+        return np.empty(0, dtype="datetime64[D]"), np.empty(0)
+    days = dates.astype(np.int64)
+    first = days.min()
+    totals = np.bincount(days - first, weights=amount)
+    return np.arange(first, first + len(totals)).astype("datetime64[D]"), totals
+
+def rolling_average(cols: Columns, window_days: int = 30, mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Trailing window_days mean of daily spend, from the first day with a full window."""
+    days, totals = daily_spend(cols, mask)
+    if len(totals) < window_days:
+        return days[:0], totals[:0]
+    csum = np.concatenate([[0.0], np.cumsum(totals)])
+    return days[window_days - 1:], (csum[window_days:] - csum[:-window_days]) / window_days
+
+def category_breakdown(cols: Columns, mask: np.ndarray = None) -> List[Tuple[str, float, int]]:
+    """[(category, total amount, rows)] largest total first; undated rows count too."""
+    codes = cols.category if mask is None else cols.category[mask]
+    amount = cols.amount if mask is None else cols.amount[mask]
+    size = len(cols.dictionaries["category"])
+    totals = np.bincount(codes, weights=np.where(np.isnan(amount), 0.0, amount), minlength=size)
+    counts = np.bincount(codes, minlength=size)
+    order = np.argsort(-totals, kind="stable")
+    names = cols.dictionaries["category"]
+    return [(names[i], float(totals[i]), int(counts[i])) for i in order if counts[i]]
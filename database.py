@@ -1,4 +1,7 @@
-import sqlite3, datetime
+import sqlite3, datetime, hashlib, json, threading
+from contextlib import contextmanager, nullcontext
+from typing import Tuple, Union
+import metrics
 
 SCHEMA = '''
 CREATE TABLE IF NOT EXISTS transactions (
@@ -15,56 +18,494 @@ CREATE TABLE IF NOT EXISTS transactions (
     subject TEXT,
     from_email TEXT,
     raw_snippet TEXT,
-    updated_at TEXT
+    updated_at TEXT,
+    fingerprint TEXT          -- content hash used to dedupe re-ingested rows
 );
 CREATE INDEX IF NOT EXISTS idx_txn_date ON transactions(date);
 CREATE INDEX IF NOT EXISTS idx_txn_cat ON transactions(category);
 CREATE INDEX IF NOT EXISTS idx_txn_ai_cat ON transactions(ai_category);
 CREATE UNIQUE INDEX IF NOT EXISTS ux_transactions_message_id ON transactions(message_id);
+-- Covers the /api/transactions listing so (date, id) keyset pages never touch the table
+CREATE INDEX IF NOT EXISTS idx_txn_date_id ON transactions(date, id, merchant, amount, source, user_category, ai_category, category);
+CREATE INDEX IF NOT EXISTS idx_txn_merchant ON transactions(merchant COLLATE NOCASE);
+-- Incremental columnar exports read rows changed since their last run
+CREATE INDEX IF NOT EXISTS idx_txn_updated_at ON transactions(updated_at);
+CREATE TABLE IF NOT EXISTS app_state (
+    key TEXT PRIMARY KEY,     -- e.g. gmail_watermark:amazon
+    value TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS statement_files (
+    path TEXT PRIMARY KEY,    -- manifest of statement files already ingested
+    size INTEGER,
+    mtime REAL,
+    sha256 TEXT,
+    rows INTEGER,
+    processed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS recurring_payments (
+    merchant_key TEXT PRIMARY KEY,  -- normalized merchant, see insights.merchant_key
+    merchant TEXT,                  -- latest raw name seen
+    category TEXT,
+    occurrences INTEGER,
+    period_days REAL,               -- median days between payments
+    period TEXT,                    -- weekly, monthly, quarterly, yearly...
+    regularity REAL,                -- MAD of the intervals / period_days; 0 is clockwork
+    typical_amount REAL,            -- median amount
+    last_amount REAL,
+    drift REAL,                     -- (last_amount - typical_amount) / typical_amount
+    last_date TEXT,
+    next_date TEXT,
+    updated_at TEXT
+);
+-- Raw merchant name -> insights.merchant_key, so a run finds a key's spellings without a full scan
+CREATE TABLE IF NOT EXISTS merchant_keys (
+    merchant TEXT PRIMARY KEY,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_merchant_keys_key ON merchant_keys(key);
+CREATE TABLE IF NOT EXISTS spend_anomalies (
+    tx_id INTEGER PRIMARY KEY,
+    category TEXT,
+    amount REAL,
+    median REAL,                    -- category median when the row was scored
+    score REAL,                     -- robust z-score, 0.6745 * (amount - median) / MAD
+    detected_at TEXT
+);
+CREATE TABLE IF NOT EXISTS daily_rollup (
+    date TEXT NOT NULL,       -- '' for rows without a date
+    category TEXT NOT NULL,   -- COALESCE(user_category, ai_category, category, 'Uncategorized')
+    source TEXT NOT NULL,     -- '' for rows without a source
+    amount REAL NOT NULL DEFAULT 0,
+    n INTEGER NOT NULL DEFAULT 0,
+    n_nonzero INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (date, category, source)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON transactions
+BEGIN
+    INSERT INTO daily_rollup (date, category, source, amount, n, n_nonzero)
+    VALUES (IFNULL(NEW.date, ''), COALESCE(NEW.user_category, NEW.ai_category, NEW.category, 'Uncategorized'),
+            IFNULL(NEW.source, ''), IFNULL(NEW.amount, 0), 1, IFNULL(NEW.amount, 0) <> 0)
+    ON CONFLICT (date, category, source) DO UPDATE
+    SET amount = amount + excluded.amount, n = n + 1, n_nonzero = n_nonzero + excluded.n_nonzero;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON transactions
+BEGIN
+    UPDATE daily_rollup
+    SET amount = amount - IFNULL(OLD.amount, 0), n = n - 1, n_nonzero = n_nonzero - (IFNULL(OLD.amount, 0) <> 0)
+    WHERE date = IFNULL(OLD.date, '') AND source = IFNULL(OLD.source, '')
+      AND category = COALESCE(OLD.user_category, OLD.ai_category, OLD.category, 'Uncategorized');
+    DELETE FROM daily_rollup
+    WHERE date = IFNULL(OLD.date, '') AND source = IFNULL(OLD.source, '')
+      AND category = COALESCE(OLD.user_category, OLD.ai_category, OLD.category, 'Uncategorized') AND n <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_rollup_update AFTER UPDATE OF date, amount, source, category, ai_category, user_category ON transactions
+WHEN IFNULL(OLD.date, '') IS NOT IFNULL(NEW.date, '')
+  OR IFNULL(OLD.source, '') IS NOT IFNULL(NEW.source, '')
+  OR OLD.amount IS NOT NEW.amount
+  OR COALESCE(OLD.user_category, OLD.ai_category, OLD.category, 'Uncategorized')
+     IS NOT COALESCE(NEW.user_category, NEW.ai_category, NEW.category, 'Uncategorized')
+BEGIN
+    UPDATE daily_rollup
+    SET amount = amount - IFNULL(OLD.amount, 0), n = n - 1, n_nonzero = n_nonzero - (IFNULL(OLD.amount, 0) <> 0)
+    WHERE date = IFNULL(OLD.date, '') AND source = IFNULL(OLD.source, '')
+      AND category = COALESCE(OLD.user_category, OLD.ai_category, OLD.category, 'Uncategorized');
+    DELETE FROM daily_rollup
+    WHERE date = IFNULL(OLD.date, '') AND source = IFNULL(OLD.source, '')
+      AND category = COALESCE(OLD.user_category, OLD.ai_category, OLD.category, 'Uncategorized') AND n <= 0;
+    INSERT INTO daily_rollup (date, category, source, amount, n, n_nonzero)
+    VALUES (IFNULL(NEW.date, ''), COALESCE(NEW.user_category, NEW.ai_category, NEW.category, 'Uncategorized'),
+            IFNULL(NEW.source, ''), IFNULL(NEW.amount, 0), 1, IFNULL(NEW.amount, 0) <> 0)
+    ON CONFLICT (date, category, source) DO UPDATE
+    SET amount = amount + excluded.amount, n = n + 1, n_nonzero = n_nonzero + excluded.n_nonzero;
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+    merchant, subject, raw_snippet,
+    content='transactions', content_rowid='id', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON transactions
+BEGIN
+    INSERT INTO transactions_fts (rowid, merchant, subject, raw_snippet)
+    VALUES (NEW.id, NEW.merchant, NEW.subject, NEW.raw_snippet);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON transactions
+BEGIN
+    INSERT INTO transactions_fts (transactions_fts, rowid, merchant, subject, raw_snippet)
+    VALUES ('delete', OLD.id, OLD.merchant, OLD.subject, OLD.raw_snippet);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_fts_update AFTER UPDATE OF merchant, subject, raw_snippet ON transactions
+BEGIN
+    INSERT INTO transactions_fts (transactions_fts, rowid, merchant, subject, raw_snippet)
+    VALUES ('delete', OLD.id, OLD.merchant, OLD.subject, OLD.raw_snippet);
+    INSERT INTO transactions_fts (rowid, merchant, subject, raw_snippet)
+    VALUES (NEW.id, NEW.merchant, NEW.subject, NEW.raw_snippet);
+END;
+'''
+
+ROLLUP_SELECT = '''
+    SELECT IFNULL(date, ''), COALESCE(user_category, ai_category, category, 'Uncategorized'), IFNULL(source, ''),
+           TOTAL(amount), COUNT(*), TOTAL(IFNULL(amount, 0) <> 0)
+    FROM transactions
+    GROUP BY 1, 2, 3
 '''
 
 def init_db(db_path: str) -> sqlite3.Connection:
     conn = sqlite3.connect(db_path, check_same_thread=False)
     conn.execute('PRAGMA journal_mode=WAL;')
+    had_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name='transactions_fts'").fetchone()
+    # Rollup triggers from before the keyed delete scanned all of daily_rollup per row;
+    # drop them so SCHEMA recreates them
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger' "
+                                "AND name IN ('trg_rollup_update', 'trg_rollup_delete') "
+                                "AND sql LIKE '%DELETE FROM daily_rollup WHERE n <= 0%'").fetchall():
+        conn.execute(f"DROP TRIGGER {name}")
     conn.executescript(SCHEMA)
+    if not had_fts:
+        # Index rows written before the search table existed; must run before any
+        # trigger-driven delete reaches the external-content index
+        rebuild_search_index(conn)
+    migrate_fingerprints(conn)
+    if conn.execute("SELECT 1 FROM daily_rollup LIMIT 1").fetchone() is None \
+            and conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone() is not None:
+        # First start on a database that predates the rollup table
+        rebuild_rollups(conn)
     return conn
 
-def upsert_transaction(conn: sqlite3.Connection, tx: dict) -> bool:
-    # If message_id provided, try upsert by message_id; else insert
-    now = datetime.datetime.utcnow().isoformat()
-    tx.setdefault("updated_at", now)
+def rebuild_search_index(conn: sqlite3.Connection) -> None:
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+    conn.commit()
+
+def rebuild_rollups(conn: sqlite3.Connection) -> int:
+    """Recompute daily_rollup from scratch; returns the number of rollup rows."""
     cur = conn.cursor()
+    cur.execute("DELETE FROM daily_rollup")
+    cur.execute("INSERT INTO daily_rollup (date, category, source, amount, n, n_nonzero) " + ROLLUP_SELECT)
+    conn.commit()
+    return conn.execute("SELECT COUNT(*) FROM daily_rollup").fetchone()[0]
+
+def check_rollups(conn: sqlite3.Connection) -> list:
+    """Return (date, category, source) keys where daily_rollup disagrees with transactions."""
+    cur = conn.cursor()
+    cur.execute("SELECT date, category, source, amount, n, n_nonzero FROM daily_rollup")
+    stored = {r[:3]: r[3:] for r in cur.fetchall()}
+    cur.execute(ROLLUP_SELECT)
+    fresh = {r[:3]: r[3:] for r in cur.fetchall()}
+    bad = []
+    for key in stored.keys() | fresh.keys():
+        a, b = stored.get(key), fresh.get(key)
+        if a is None or b is None or a[1:] != (b[1], int(b[2])) or abs(a[0] - b[0]) > 0.005:
+            bad.append(key)
+    return sorted(bad)
+
+class ConnectionManager:
+    """Per-thread read connections and one lock-serialized writer for a database file.
+
+    With WAL, readers never wait on the writer, so dashboard queries keep
+    answering while ingest or categorization holds the write lock.
+    """
+
+    def __init__(self, db_path: str, busy_timeout_ms: int = 5000,
+                 cache_size_kb: int = 65536, mmap_size: int = 268435456):
+        self.db_path = db_path
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self.cache_size_kb = int(cache_size_kb)
+        self.mmap_size = int(mmap_size)
+        self._write_conn = init_db(db_path)
+        self._write_conn.execute(f'PRAGMA busy_timeout={self.busy_timeout_ms};')
+        # Durable across crashes in WAL mode; only a power loss can drop the last commits
+        self._write_conn.execute('PRAGMA synchronous=NORMAL;')
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "ConnectionManager":
+        db_cfg = cfg['database']
+        return cls(db_cfg['path'],
+                   busy_timeout_ms=db_cfg.get('busy_timeout_ms', 5000),
+                   cache_size_kb=db_cfg.get('cache_size_kb', 65536),
+                   mmap_size=db_cfg.get('mmap_size', 268435456))
+
+    def reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000)
+            conn.execute(f'PRAGMA busy_timeout={self.busy_timeout_ms};')
+            conn.execute(f'PRAGMA cache_size={-self.cache_size_kb};')
+            conn.execute(f'PRAGMA mmap_size={self.mmap_size};')
+            conn.execute('PRAGMA query_only=ON;')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def writer(self):
+        # Commits on success, rolls back on error; re-entrant within one thread
+        with self._write_lock:
+            try:
+                yield self._write_conn
+                self._write_conn.commit()
+            except Exception:
+                self._write_conn.rollback()
+                raise
+
+Database = Union[sqlite3.Connection, ConnectionManager]
+
+def reading(db: Database) -> sqlite3.Connection:
+    # Lets helpers take either a plain connection or a ConnectionManager
+    return db.reader() if isinstance(db, ConnectionManager) else db
+
+def writing(db: Database):
+    return db.writer() if isinstance(db, ConnectionManager) else nullcontext(db)
+
+# Bump when tx_fingerprint changes; init_db then re-fingerprints the stored non-Gmail rows
+FINGERPRINT_SCHEME = "2"
+FINGERPRINT_SCHEME_KEY = "fingerprint_scheme"
+
+def tx_fingerprint(tx: dict) -> str:
+    # Gmail rows are identified by message_id; everything else by the message as received.
+    # Parsed fields (amount, merchant) are left out so a parser change can't turn a
+    # re-ingested message into a new row; they only stand in when there is no raw text.
+    # Identical text on one day is told apart by "occurrence", the fetcher's count of that
+    # text within one statement file or bridge response (1 for the first, left out of the key).
     if tx.get("message_id"):
-        # Try insert ignore
-        cur.execute('''
-            INSERT OR IGNORE INTO transactions
-            (date, merchant, category, ai_category, user_category, amount, currency, source, message_id, subject, from_email, raw_snippet, updated_at)
-            VALUES (:date, :merchant, :category, :ai_category, :user_category, :amount, :currency, :source, :message_id, :subject, :from_email, :raw_snippet, :updated_at)
-        ''', tx)
-        inserted = cur.rowcount == 1
-        if not inserted:
-            # Update existing minimal fields
-            cur.execute('''
-                UPDATE transactions
-                SET date=:date, merchant=:merchant, category=COALESCE(:category, category),
-                    amount=COALESCE(:amount, amount), source=COALESCE(:source, source),
-                    subject=COALESCE(:subject, subject), from_email=COALESCE(:from_email, from_email),
-                    raw_snippet=COALESCE(:raw_snippet, raw_snippet), updated_at=:updated_at
-                WHERE message_id=:message_id
-            ''', tx)
-        conn.commit()
-        return inserted
+        key = "msg\x1f" + tx["message_id"]
     else:
-        cur.execute('''
-            INSERT INTO transactions
-            (date, merchant, category, ai_category, user_category, amount, currency, source, message_id, subject, from_email, raw_snippet, updated_at)
-            VALUES (:date, :merchant, :category, :ai_category, :user_category, :amount, :currency, :source, :message_id, :subject, :from_email, :raw_snippet, :updated_at)
-        ''', tx)
-        conn.commit()
-        return True
+        raw = (tx.get("raw_snippet") or "").strip()
+        parts = [tx.get("source") or "", (tx.get("date") or "")[:10], raw]
+        if not raw:
+            amount = tx.get("amount")
+            parts += ["" if amount is None else f"{float(amount):.2f}", (tx.get("merchant") or "").strip().lower()]
+        occurrence = int(tx.get("occurrence") or 1)
+        if occurrence > 1:
+            parts.append(f"#{occurrence}")
+        key = "\x1f".join(parts)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
 
-def update_user_category(conn: sqlite3.Connection, tx_id: int, new_cat: str):
-    now = datetime.datetime.utcnow().isoformat()
+def migrate_fingerprints(conn: sqlite3.Connection) -> Tuple[int, int]:
+    """Backfill fingerprints, drop duplicate rows and enforce uniqueness.
+
+    Cheap on an up-to-date database: the NULL lookup uses the unique index.
+    """
     cur = conn.cursor()
-    cur.execute('UPDATE transactions SET user_category=?, updated_at=? WHERE id=?', (new_cat, now, tx_id))
+    cols = {r[1] for r in cur.execute("PRAGMA table_info(transactions)")}
+    if "fingerprint" not in cols:
+        cur.execute("ALTER TABLE transactions ADD COLUMN fingerprint TEXT")
+    scheme = cur.execute("SELECT value FROM app_state WHERE key=?", (FINGERPRINT_SCHEME_KEY,)).fetchone()
+    if (scheme or (None,))[0] != FINGERPRINT_SCHEME:
+        # Fingerprints from an older scheme are recomputed below like missing ones
+        cur.execute("UPDATE transactions SET fingerprint=NULL WHERE message_id IS NULL AND fingerprint IS NOT NULL")
+        cur.execute("""
+            INSERT INTO app_state (key, value, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at
+        """, (FINGERPRINT_SCHEME_KEY, FINGERPRINT_SCHEME, datetime.datetime.utcnow().isoformat()))
+    # Prefer keeping the copy the user already categorized, then the oldest one. Copies that
+    # were parsed alike are separate purchases and get occurrence numbers; copies parsed
+    # differently are one message ingested by two parser versions and are deduped.
+    cur.execute("""
+        SELECT id, date, merchant, amount, source, message_id, raw_snippet FROM transactions
+        WHERE fingerprint IS NULL
+        ORDER BY (user_category IS NULL OR TRIM(user_category)=''), id
+    """)
+    rows = cur.fetchall()
+    keep, drop, seen = {}, [], {}
+    for tid, date, merchant, amount, source, message_id, raw in rows:
+        tx = {"date": date, "merchant": merchant, "amount": amount, "source": source,
+              "message_id": message_id, "raw_snippet": raw}
+        variant = (tx_fingerprint(tx), amount, (merchant or "").strip().lower())
+        tx["occurrence"] = seen[variant] = seen.get(variant, 0) + 1
+        fp = tx_fingerprint(tx)
+        if fp in keep:
+            drop.append(tid)
+        else:
+            keep[fp] = tid
+    for fp in _existing_values(cur, "fingerprint", keep):
+        drop.append(keep.pop(fp))
+    cur.executemany("DELETE FROM transactions WHERE id=?", [(t,) for t in drop])
+    cur.executemany("UPDATE transactions SET fingerprint=? WHERE id=?", list(keep.items()))
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_transactions_fingerprint ON transactions(fingerprint)")
     conn.commit()
+    if rows:
+        print(f"[DB] fingerprinted {len(keep)} rows, removed {len(drop)} duplicates")
+    return len(keep), len(drop)
+
+DEFAULT_BATCH_SIZE = 500
+# Bumped whenever category/user_category labels change; the categorizer retrains on a new value
+LABEL_VERSION_KEY = "label_version"
+# Bumped by every write the dashboard can see; drives API ETags and the response cache
+DATA_VERSION_KEY = "data_version"
+
+TX_DEFAULTS = {
+    "date": None, "merchant": None, "category": None, "ai_category": None,
+    "user_category": None, "amount": None, "currency": "INR", "source": None,
+    "message_id": None, "subject": None, "from_email": None, "raw_snippet": None,
+    "fingerprint": None,
+}
+
+UPSERT_SQL = '''
+    INSERT INTO transactions
+    (date, merchant, category, ai_category, user_category, amount, currency, source, message_id, subject, from_email, raw_snippet, updated_at, fingerprint)
+    VALUES (:date, :merchant, :category, :ai_category, :user_category, :amount, :currency, :source, :message_id, :subject, :from_email, :raw_snippet, :updated_at, :fingerprint)
+    ON CONFLICT(fingerprint) DO UPDATE
+    SET date=excluded.date, merchant=excluded.merchant, category=COALESCE(excluded.category, category),
+        amount=COALESCE(excluded.amount, amount), source=COALESCE(excluded.source, source),
+        subject=COALESCE(excluded.subject, subject), from_email=COALESCE(excluded.from_email, from_email),
+        raw_snippet=COALESCE(excluded.raw_snippet, raw_snippet), updated_at=excluded.updated_at
+    WHERE transactions.message_id IS NOT NULL
+'''
+
+class BatchWriter:
+    """Buffers transactions and upserts them with executemany, committing once per chunk.
+
+    Rows are matched on their fingerprint: Gmail rows refresh the stored copy
+    (counted in ``updated``), re-ingested SMS/statement rows are left alone
+    (counted in ``skipped``).
+
+    Use as a context manager so the final partial chunk is flushed:
+
+        with BatchWriter(conn, batch_size=500) as w:
+            for tx in txns:
+                w.add(tx)
+        print(w.inserted, w.updated)
+    """
+
+    def __init__(self, db: Database, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = max(1, int(batch_size or DEFAULT_BATCH_SIZE))
+        self.pending = []
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Keep whatever was parsed before a failure, like the old per-row commits did
+        self.flush()
+        return False
+
+    def add(self, tx: dict):
+        row = dict(TX_DEFAULTS)
+        row.update(tx)
+        row.setdefault("updated_at", datetime.datetime.utcnow().isoformat())
+        row["fingerprint"] = row["fingerprint"] or tx_fingerprint(row)
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> Tuple[int, int]:
+        if not self.pending:
+            return 0, 0
+        rows, self.pending = self.pending, []
+        with metrics.span("db_write"), writing(self.db) as conn:
+            return self._write(conn, rows)
+
+    def _write(self, conn: sqlite3.Connection, rows: list) -> Tuple[int, int]:
+        cur = conn.cursor()
+        seen = _existing_values(cur, "fingerprint", {r["fingerprint"] for r in rows})
+        inserted = updated = 0
+        for r in rows:
+            if r["fingerprint"] not in seen:
+                inserted += 1
+                seen.add(r["fingerprint"])
+            elif r["message_id"]:
+                updated += 1
+            else:
+                self.skipped += 1
+        cur.executemany(UPSERT_SQL, rows)
+        if inserted or updated:
+            bump_state(conn, DATA_VERSION_KEY)
+        conn.commit()
+        self.inserted += inserted
+        self.updated += updated
+        return inserted, updated
+
+def _existing_values(cur: sqlite3.Cursor, column: str, values) -> set:
+    found, values = set(), list(values)
+    # Stay well under SQLITE_MAX_VARIABLE_NUMBER on older builds
+    for i in range(0, len(values), 900):
+        chunk = values[i:i + 900]
+        cur.execute(f"SELECT {column} FROM transactions WHERE {column} IN ({','.join('?' * len(chunk))})", chunk)
+        found.update(r[0] for r in cur.fetchall())
+    return found
+
+def upsert_transaction(conn: Database, tx: dict) -> bool:
+    # Single-row convenience wrapper; bulk callers should use BatchWriter directly
+    tx.setdefault("updated_at", datetime.datetime.utcnow().isoformat())
+    with BatchWriter(conn, batch_size=1) as w:
+        w.add(tx)
+    return w.inserted == 1
+
+def existing_message_ids(db: Database, ids) -> set:
+    return _existing_values(reading(db).cursor(), "message_id", ids)
+
+def get_state(db: Database, key: str, default=None):
+    row = reading(db).execute("SELECT value FROM app_state WHERE key=?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_state(db: Database, key: str, value):
+    now = datetime.datetime.utcnow().isoformat()
+    with writing(db) as conn:
+        conn.execute('''
+            INSERT INTO app_state (key, value, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at
+        ''', (key, str(value), now))
+        conn.commit()
+
+def data_version(db: Database) -> int:
+    return int(get_state(db, DATA_VERSION_KEY, 0))
+
+def bump_state(conn: sqlite3.Connection, key: str) -> None:
+    # Counter in app_state; no commit so it lands in the caller's transaction
+    now = datetime.datetime.utcnow().isoformat()
+    conn.execute('''
+        INSERT INTO app_state (key, value, updated_at) VALUES (?, '1', ?)
+        ON CONFLICT(key) DO UPDATE SET value=CAST(value AS INTEGER) + 1, updated_at=excluded.updated_at
+    ''', (key, now))
+
+def update_user_category(db: Database, tx_id: int, new_cat: str):
+    now = datetime.datetime.utcnow().isoformat()
+    with writing(db) as conn:
+        cur = conn.cursor()
+        cur.execute('UPDATE transactions SET user_category=?, updated_at=? WHERE id=?', (new_cat, now, tx_id))
+        if cur.rowcount:
+            bump_state(conn, LABEL_VERSION_KEY)
+            bump_state(conn, DATA_VERSION_KEY)
+        conn.commit()
+
+def bulk_update_category(db: Database, new_cat: str, ids=None, clauses=(), params=()) -> dict:
+    """Set user_category on the rows with the given ids, or matching all clauses, in one transaction.
+
+    Rows already carrying new_cat are left out, so repeating an edit writes
+    nothing. Returns the row count, the span of dates and the sources touched,
+    and the data_version before and after, for selective cache invalidation.
+    Without ids at least one clause is required; it never updates every row.
+    """
+    clauses, params = list(clauses), list(params)
+    if ids is None and not clauses:
+        raise ValueError("bulk_update_category needs ids or at least one filter clause")
+    if ids is not None:
+        # json_each instead of one placeholder per id, which would hit SQLite's variable limit
+        clauses.append('id IN (SELECT value FROM json_each(?))')
+        params.append(json.dumps([int(i) for i in ids]))
+    clauses.append("IFNULL(user_category, '') <> ?")
+    params.append(new_cat)
+    where = ' AND '.join(clauses)
+    now = datetime.datetime.utcnow().isoformat()
+    with writing(db) as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT COUNT(*), COUNT(date), MIN(date), MAX(date), json_group_array(DISTINCT IFNULL(source, ''))
+            FROM transactions WHERE {where}
+        """, params)
+        n, dated, min_date, max_date, sources = cur.fetchone()
+        before = int((cur.execute("SELECT value FROM app_state WHERE key=?", (DATA_VERSION_KEY,)).fetchone() or (0,))[0])
+        result = {"updated": n, "min_date": min_date, "max_date": max_date, "undated": n - dated,
+                  "sources": set(json.loads(sources)), "version": (before, before)}
+        if not n:
+            return result
+        cur.execute(f"UPDATE transactions SET user_category=?, updated_at=? WHERE {where}", [new_cat, now] + params)
+        bump_state(conn, LABEL_VERSION_KEY)
+        bump_state(conn, DATA_VERSION_KEY)
+        conn.commit()
+    result["version"] = (before, before + 1)
+    return result
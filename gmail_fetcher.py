@@ -1,33 +1,95 @@
 \
-import base64, os, pickle, re
+import base64, hashlib, html, os, pickle, re
 from datetime import datetime
 from email.utils import parsedate_to_datetime
 from typing import Dict, Optional
-import pytz, yaml, json
+import pytz, json
 
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-
-from database import init_db, upsert_transaction
+import metrics, txn_parser
+from database import ConnectionManager, BatchWriter, DEFAULT_BATCH_SIZE, existing_message_ids, get_state, set_state
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+# Gmail allows up to 100 calls per batch but recommends staying at 50 to avoid rate limiting
+GET_BATCH_SIZE = 50
+# Re-list a day behind the watermark; already-stored ids are skipped before any get
+WATERMARK_OVERLAP_SECS = 86400
+# app_state key suffix for a listing to resume (JSON: query, page token, newest date seen)
+RESUME_SUFFIX = ":resume"
 
 def load_config(path: str) -> dict:
     if path.lower().endswith(".json"):
         return json.load(open(path, "r", encoding="utf-8"))
     else:
+        import yaml
         return yaml.safe_load(open(path, "r", encoding="utf-8"))
 
-def decode_payload(payload: dict) -> str:
-    def walk(p):
+def _api_errors() -> tuple:
+    # HttpError exists only with the Google client installed; an injected stub service
+    # doesn't need it, and its own exceptions propagate
+    try:
+        from googleapiclient.errors import HttpError
+    except ImportError:
+        return ()
+    return (HttpError,)
+
+# Receipts need a few KB of text; anything past this is never decoded
+MAX_BODY_BYTES = 16 * 1024
+# HTML is mostly <head>, CSS and layout; this much markup is decoded so the text that
+# survives stripping isn't cut off before MAX_BODY_BYTES applies to it
+MAX_MARKUP_BYTES = 512 * 1024
+METADATA_HEADERS = ["Subject", "From", "Date"]
+
+_HTML_DROP = re.compile(r"<(style|script|head)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_HTML_TAG = re.compile(r"<[^>]*>")
+_SPACES = re.compile(r"\s+")
+
+def html_to_text(markup: str) -> str:
+    markup = _HTML_DROP.sub(" ", markup)
+    return _SPACES.sub(" ", html.unescape(_HTML_TAG.sub(" ", markup))).strip()
+
+def _decode_part(data: str, max_bytes: int) -> str:
+    # Decode only the base64 prefix that yields max_bytes, not the whole part
+    data = data[:(max_bytes + 2) // 3 * 4]
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    return raw.decode("utf-8", errors="ignore")
+
+def decode_payload(payload: dict, max_bytes: int = MAX_BODY_BYTES) -> str:
+    """Readable body text: text/plain parts if any, else tag-stripped text/html.
+
+    Attachments and non-text parts are skipped without decoding. At most
+    max_bytes of text are returned; for HTML that limit applies after the
+    markup is stripped, and at most MAX_MARKUP_BYTES of markup is decoded.
+    """
+    plain, markup = [], []
+    stack = [payload]
+    while stack:
+        p = stack.pop()
         if "parts" in p:
-            return " ".join(walk(pp) for pp in p["parts"])
-        data = p.get("body", {}).get("data")
-        if not data: return ""
-        return base64.urlsafe_b64decode(data.encode("utf-8")).decode("utf-8", errors="ignore")
-    return walk(payload)
+            stack.extend(reversed(p["parts"]))
+            continue
+        body = p.get("body", {})
+        data = body.get("data")
+        if not data or p.get("filename") or body.get("attachmentId"):
+            continue
+        mime = (p.get("mimeType") or "text/plain").lower()
+        if mime == "text/html":
+            markup.append(data)
+        elif mime.startswith("text/"):
+            plain.append(data)
+    chosen, is_html = (plain, False) if plain else (markup, True)
+    out, budget = [], max(max_bytes, MAX_MARKUP_BYTES) if is_html else max_bytes
+    for data in chosen:
+        if budget <= 0:
+            break
+        text = _decode_part(data, budget)
+        budget -= len(text.encode("utf-8"))
+        out.append(text)
+    text = " ".join(out)
+    if not is_html:
+        return text
+    text = html_to_text(text)
+    raw = text.encode("utf-8")
+    return raw[:max_bytes].decode("utf-8", errors="ignore") if len(raw) > max_bytes else text
 
 def to_iso_date(date_header: str) -> str:
     try:
@@ -37,41 +99,25 @@ def to_iso_date(date_header: str) -> str:
         return datetime.now().strftime("%Y-%m-%d")
 
 def extract_amount(text: str) -> Optional[float]:
-    txt = text.replace(",", "")
-    pats = [
-        r"(?:₹|INR|Rs\.?)\s*([0-9]+(?:\.[0-9]{1,2})?)",
-        r"([0-9]+(?:\.[0-9]{1,2})?)\s*(?:INR|₹|Rs\.?)"
-    ]
-    for p in pats:
-        m = re.search(p, txt, re.IGNORECASE)
-        if m:
-            try:
-                return float(m.group(1))
-            except: pass
-    return None
+    return txn_parser.find_amount(text)
+
+SOURCE_MERCHANTS = {"amazon": "Amazon.in", "flipkart": "Flipkart", "sbi_txn": "SBI", "sbi_stmt": "SBI Card"}
 
 def extract_merchant(text: str, fallback: str) -> str:
-    hints = [
-        r"at\s+([A-Za-z0-9 &\-\._]+)",
-        r"merchant\s*:\s*([A-Za-z0-9 &\-\._]+)",
-        r"spent at\s+([A-Za-z0-9 &\-\._]+)"
-    ]
-    for h in hints:
-        m = re.search(h, text, re.IGNORECASE)
-        if m:
-            name = m.group(1).strip(" .,-")
-            if 2 <= len(name) <= 64:
-                return name
-    mapping = {"amazon": "Amazon.in", "flipkart": "Flipkart", "sbi_txn": "SBI", "sbi_stmt": "SBI Card"}
-    return mapping.get(fallback, fallback.title())
+    return txn_parser.find_merchant(text) or SOURCE_MERCHANTS.get(fallback, fallback.title())
 
 class GmailFetcher:
-    def __init__(self, config_path: str):
-        self.cfg = load_config(config_path)
-        self.conn = init_db(self.cfg["database"]["path"])
-        self.service = self._auth()
+    def __init__(self, config_path: str = None, service=None, db: ConnectionManager = None, cfg: dict = None):
+        # service: a ready Gmail client (or a stub with the same users()/new_batch_http_request
+        # surface) to bypass OAuth; cfg: an already-loaded (e.g. per-profile) config
+        self.cfg = cfg if cfg is not None else load_config(config_path)
+        self.db = db or ConnectionManager.from_config(self.cfg)
+        self.service = service or self._auth()
 
     def _auth(self):
+        from googleapiclient.discovery import build
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from google.auth.transport.requests import Request
         creds = None
         token_file = self.cfg["gmail"]["token_file"]
         cred_file = self.cfg["gmail"]["credentials_file"]
@@ -91,44 +137,136 @@ class GmailFetcher:
     def run(self) -> int:
         if not self.cfg.get("gmail", {}).get("enabled", False):
             return 0
-        total = 0
         user_id = self.cfg["gmail"]["user_id"]
-        max_results = self.cfg["gmail"].get("max_results_per_query", 100)
-        for source, query in self.cfg["gmail"]["search_queries"].items():
-            try:
-                results = self.service.users().messages().list(userId=user_id, q=query, maxResults=max_results).execute()
-            except HttpError as e:
-                print(f"[Gmail] list error {source}: {e}")
-                continue
-            for m in results.get("messages", []) or []:
-                try:
-                    msg = self.service.users().messages().get(userId=user_id, id=m["id"], format="full").execute()
-                except HttpError as e:
-                    print(f"[Gmail] get error {m['id']}: {e}")
+        with BatchWriter(self.db, self.cfg["database"].get("batch_size", DEFAULT_BATCH_SIZE)) as writer:
+            for source, query in self.cfg["gmail"]["search_queries"].items():
+                self._sync_query(writer, user_id, source, query)
+        return writer.inserted
+
+    def _sync_query(self, writer: BatchWriter, user_id: str, source: str, query: str):
+        # Keyed on the query text too, so editing a search in config starts a fresh backfill
+        key = f"gmail_watermark:{source}:{hashlib.sha1(query.encode('utf-8')).hexdigest()[:12]}"
+        watermark = int(get_state(self.db, key, 0))
+        # A listing cut short by max_pages_per_query carries on from its page token next cycle;
+        # the watermark only moves once a listing has reached its last page with every get done
+        saved = get_state(self.db, key + RESUME_SUFFIX)
+        resume = json.loads(saved) if saved else None
+        if resume is None:
+            q = f"({query}) after:{max(0, watermark // 1000 - WATERMARK_OVERLAP_SECS)}" if watermark else query
+            resume = {"q": q, "token": None, "newest": watermark, "clean": True}
+        api_errors = _api_errors()
+        try:
+            ids, next_token = self._list_ids(user_id, resume["q"], resume["token"])
+        except api_errors as e:
+            print(f"[Gmail] list error {source}: {e}")
+            if resume["token"]:
+                # The page token may have expired; list from the watermark again next cycle
+                set_state(self.db, key + RESUME_SUFFIX, "")
+            return
+        known = existing_message_ids(self.db, ids)
+        new_ids = [i for i in ids if i not in known]
+        newest, failed = resume["newest"], []
+        need_body = new_ids
+        if self.cfg["gmail"].get("metadata_first", True):
+            # Headers + snippet are often enough for alerts; only the rest pay for a full body
+            need_body = []
+            for msg in self._get_messages(user_id, new_ids, fmt="metadata", failed=failed):
+                tx = self._to_tx(msg, source, need_complete=True)
+                if tx is None:
+                    need_body.append(msg["id"])
                     continue
-                headers = {h["name"].lower(): h["value"] for h in msg.get("payload", {}).get("headers", [])}
-                subject = headers.get("subject", "")
-                from_email = headers.get("from", "")
-                date_iso = to_iso_date(headers.get("date", ""))
-                snippet = msg.get("snippet", "") or ""
-                body = decode_payload(msg.get("payload", {}))
-                full = f"{subject}\n{snippet}\n{body}"
-                amount = extract_amount(full) or 0.0
-                merchant = extract_merchant(full, source)
-                tx = {
-                    "date": date_iso,
-                    "merchant": merchant,
-                    "category": None,
-                    "ai_category": None,
-                    "user_category": None,
-                    "amount": float(amount),
-                    "currency": "INR",
-                    "source": source,
-                    "message_id": msg.get("id"),
-                    "subject": subject,
-                    "from_email": from_email,
-                    "raw_snippet": snippet[:1000]
-                }
-                if upsert_transaction(self.conn, tx):
-                    total += 1
-        return total
+                writer.add(tx)
+                newest = max(newest, int(msg.get("internalDate") or 0))
+        for msg in self._get_messages(user_id, need_body, failed=failed):
+            writer.add(self._to_tx(msg, source))
+            newest = max(newest, int(msg.get("internalDate") or 0))
+        # Only record progress once the rows behind it are committed
+        writer.flush()
+        resume.update(newest=newest, clean=resume["clean"] and not failed, token=next_token)
+        if failed:
+            print(f"[Gmail] {len(failed)} {source} messages could not be fetched; retried next cycle")
+        if next_token:
+            set_state(self.db, key + RESUME_SUFFIX, json.dumps(resume))
+            return
+        if saved:
+            set_state(self.db, key + RESUME_SUFFIX, "")
+        # Failed gets are found again by listing from the old watermark; stored ids are skipped
+        if resume["clean"] and newest > watermark:
+            set_state(self.db, key, newest)
+
+    def _list_ids(self, user_id: str, query: str, page_token: str = None):
+        """(message ids, token of the next page or None) for up to max_pages_per_query pages."""
+        page_size = self.cfg["gmail"].get("max_results_per_query", 100)
+        max_pages = self.cfg["gmail"].get("max_pages_per_query")
+        ids, pages = [], 0
+        while True:
+            params = {"userId": user_id, "q": query, "maxResults": page_size}
+            if page_token:
+                params["pageToken"] = page_token
+            with metrics.span("gmail_list"):
+                results = self.service.users().messages().list(**params).execute()
+            ids.extend(m["id"] for m in results.get("messages", []) or [])
+            pages += 1
+            page_token = results.get("nextPageToken")
+            if not page_token or (max_pages and pages >= max_pages):
+                return ids, page_token
+
+    def _get_messages(self, user_id: str, ids: list, fmt: str = "full", failed: list = None):
+        # Ids whose get errored are appended to `failed`
+        api_errors = _api_errors()
+        fetched = []
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                print(f"[Gmail] get error {request_id}: {exception}")
+            else:
+                fetched.append(response)
+
+        for i in range(0, len(ids), GET_BATCH_SIZE):
+            chunk = ids[i:i + GET_BATCH_SIZE]
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for mid in chunk:
+                params = {"userId": user_id, "id": mid, "format": fmt}
+                if fmt == "metadata":
+                    params["metadataHeaders"] = METADATA_HEADERS
+                batch.add(self.service.users().messages().get(**params), request_id=mid)
+            try:
+                with metrics.span(f"gmail_get_{fmt}"):
+                    batch.execute()
+            except api_errors as e:
+                print(f"[Gmail] batch error: {e}")
+            if failed is not None and len(fetched) < len(chunk):
+                got = {m.get("id") for m in fetched}
+                failed.extend(mid for mid in chunk if mid not in got)
+            yield from fetched
+            fetched.clear()
+
+    def _to_tx(self, msg: dict, source: str, need_complete: bool = False) -> Optional[dict]:
+        # need_complete: return None unless both amount and merchant were found
+        headers = {h["name"].lower(): h["value"] for h in msg.get("payload", {}).get("headers", [])}
+        subject = headers.get("subject", "")
+        from_email = headers.get("from", "")
+        date_iso = to_iso_date(headers.get("date", ""))
+        snippet = msg.get("snippet", "") or ""
+        with metrics.span("parse_gmail"):
+            body = decode_payload(msg.get("payload", {}))
+            full = f"{subject}\n{snippet}\n{body}"
+            amount, merchant = txn_parser.parse_message(full, sender=from_email, source=source)
+        if need_complete and (amount is None or merchant is None):
+            return None
+        amount = amount or 0.0
+        merchant = merchant or SOURCE_MERCHANTS.get(source, source.title())
+        return {
+            "date": date_iso,
+            "merchant": merchant,
+            "category": None,
+            "ai_category": None,
+            "user_category": None,
+            "amount": float(amount),
+            "currency": "INR",
+            "source": source,
+            "message_id": msg.get("id"),
+            "subject": subject,
+            "from_email": from_email,
+            "raw_snippet": snippet[:1000]
+        }
@@ -0,0 +1,231 @@
+"""Recurring-payment and unusual-spend detection over the transactions table.
+
+Rows are grouped by a normalized merchant key ("NETFLIX.COM 8821" and
+"Netflix" are one merchant). A merchant is recurring when the gaps between
+its payments cluster tightly around a weekly...yearly period; its amount
+drift is the latest payment against the median. A debit is anomalous when
+its robust z-score (median/MAD) within its effective category is high;
+positive amounts outside ``insights.credit_categories`` are debits.
+
+Each run only looks at rows added since the previous one: recurring stats
+are recomputed for the merchants those rows belong to (found through the
+merchant_keys table), and only the new rows are scored. All per-group statistics are computed with sorted NumPy
+arrays, no per-row Python.
+"""
+import datetime, json, re
+from typing import Tuple
+import numpy as np
+import metrics
+from columnar import to_dates
+from database import DATA_VERSION_KEY, Database, bump_state, get_state, reading, writing
+
+WATERMARK_KEY = "insights_max_id"
+
+# (label, days); a median gap within PERIOD_TOLERANCE of one of these is a period
+PERIODS = (("weekly", 7), ("biweekly", 14), ("monthly", 30.4), ("quarterly", 91.3),
+           ("half-yearly", 182.6), ("yearly", 365.25))
+PERIOD_TOLERANCE = 0.15
+# Gaps may wobble by this fraction of the period (MAD) and still count as regular
+MAX_IRREGULARITY = 0.2
+MIN_OCCURRENCES = 3
+# Spend outliers: robust z above this, against a category with at least MIN_CATEGORY_ROWS rows
+ANOMALY_Z = 3.5
+MIN_CATEGORY_ROWS = 8
+HISTORY_DAYS = 365
+# Categories holding money coming in; never scored as spends
+CREDIT_CATEGORIES = ("Income",)
+
+EFFECTIVE_CATEGORY = "COALESCE(user_category, ai_category, category, 'Uncategorized')"
+
+_DOMAIN = re.compile(r"\.(?:com|in|co\.in|net|org)\b")
+_NOISE = re.compile(r"[^a-z]+")
+_STOPWORDS = {"pvt", "private", "ltd", "limited", "llp", "inc", "india", "payments", "payment", "online",
+              "services", "technologies", "retail", "upi", "pos", "ecom", "ref", "txn", "vpa", "www",
+              "ybl", "okicici", "oksbi", "okhdfcbank", "okaxis", "paytm", "razorpay", "payu"}
+
+def merchant_key(name: str) -> str:
+    """Lowercase words of a merchant name without digits, domains, legal suffixes or UPI noise."""
+    low = _DOMAIN.sub(" ", (name or "").lower())
+    words = [w for w in _NOISE.sub(" ", low).split() if w not in _STOPWORDS and len(w) > 1]
+    return " ".join(words[:3]) or (name or "").strip().lower()
+
+def settings(cfg: dict) -> dict:
+    icfg = cfg.get("insights", {})
+    return {"anomaly_z": float(icfg.get("anomaly_z", ANOMALY_Z)),
+            "min_occurrences": int(icfg.get("min_occurrences", MIN_OCCURRENCES)),
+            "history_days": int(icfg.get("history_days", HISTORY_DAYS)),
+            "credit_categories": list(icfg.get("credit_categories", CREDIT_CATEGORIES))}
+
+def group_median(groups: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(group ids, median per group, size per group) for integer group labels."""
+    order = np.lexsort((values, groups))
+    g, v = groups[order], values[order]
+    ids, starts, counts = np.unique(g, return_index=True, return_counts=True)
+    median = (v[starts + (counts - 1) // 2] + v[starts + counts // 2]) / 2
+    return ids, median, counts
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+def _days(dates) -> np.ndarray:
+    # Day ordinals; rows without a parseable date become -1 and are dropped by callers
+    d = to_dates(dates)
+    return np.where(np.isnat(d), -1, d.astype(np.int64) + _EPOCH_ORDINAL)
+
+def detect_recurring(keys: np.ndarray, days: np.ndarray, amounts: np.ndarray, min_occurrences: int = MIN_OCCURRENCES) -> dict:
+    """Per recurring merchant key code: period, regularity, amounts and the index of its latest row."""
+    ok = days >= 0
+    idx = np.flatnonzero(ok)
+    order = idx[np.lexsort((days[ok], keys[ok]))]
+    k, d, a = keys[order], days[order], np.nan_to_num(amounts[order])
+    if len(k) < 2:
+        return {}
+    same = k[1:] == k[:-1]
+    gaps = (d[1:] - d[:-1])[same].astype(np.float64)
+    gap_keys = k[1:][same]
+    # Several payments on one day (split bills, retries) are one occurrence
+    distinct = gaps > 0
+    gaps, gap_keys = gaps[distinct], gap_keys[distinct]
+    if not len(gaps):
+        return {}
+    gk, period, n_gaps = group_median(gap_keys, gaps)
+    per_gap = np.searchsorted(gk, gap_keys)
+    _, mad, _ = group_median(gap_keys, np.abs(gaps - period[per_gap]))
+    irregularity = mad / np.maximum(period, 1.0)
+
+    targets = np.array([p for _, p in PERIODS])
+    nearest = np.abs(period[:, None] - targets[None, :]).argmin(axis=1)
+    close = np.abs(period - targets[nearest]) <= PERIOD_TOLERANCE * targets[nearest]
+    recurring = (n_gaps + 1 >= min_occurrences) & close & (irregularity <= MAX_IRREGULARITY)
+
+    ak, typical, _ = group_median(k, a)
+    last = np.flatnonzero(np.r_[k[1:] != k[:-1], True])   # latest row of every key
+    typical_at = typical[np.searchsorted(ak, gk)]
+    last_at = last[np.searchsorted(k[last], gk)]
+    out = {}
+    for i in np.flatnonzero(recurring):
+        row = int(order[last_at[i]])
+        last_amount = a[last_at[i]]
+        drift = (last_amount - typical_at[i]) / typical_at[i] if typical_at[i] else 0.0
+        out[int(gk[i])] = {
+            "period_days": float(period[i]), "period": PERIODS[nearest[i]][0],
+            "occurrences": int(n_gaps[i]) + 1, "regularity": float(irregularity[i]),
+            "typical_amount": float(typical_at[i]), "last_amount": float(last_amount),
+            "drift": float(drift), "last_day": int(d[last_at[i]]), "row": row,
+        }
+    return out
+
+def score_anomalies(cats: np.ndarray, amounts: np.ndarray, new: np.ndarray, z: float = ANOMALY_Z):
+    """Robust z-scores of the rows flagged in `new` against all rows of their category.
+
+    Returns (row indexes, scores, category medians) of the new rows above z.
+    Only unusually *large* spends are reported.
+    """
+    a = np.where(np.isnan(amounts), 0.0, amounts)
+    ids, median, counts = group_median(cats, a)
+    at = np.searchsorted(ids, cats)
+    _, mad, _ = group_median(cats, np.abs(a - median[at]))
+    # MAD is 0 when most of a category is one price; fall back to the mean deviation
+    spread = mad[at] / 0.6745
+    mean_dev = np.bincount(at, weights=np.abs(a - median[at])) / counts
+    spread = np.where(spread > 0, spread, 1.2533 * mean_dev[at])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = np.where(spread > 0, (a - median[at]) / spread, 0.0)
+    hit = np.flatnonzero(new & (counts[at] >= MIN_CATEGORY_ROWS) & (score > z))
+    return hit, score[hit], median[at][hit]
+
+def run(db: Database, cfg: dict, full: bool = False) -> Tuple[int, int]:
+    """Update recurring_payments and spend_anomalies; returns (recurring merchants updated, anomalies found)."""
+    with metrics.span("insights"):
+        return _run(db, cfg, full)
+
+def _run(db: Database, cfg: dict, full: bool) -> Tuple[int, int]:
+    opts = settings(cfg)
+    since = 0 if full else int(get_state(db, WATERMARK_KEY, 0))
+    conn = reading(db)
+    new_rows = conn.execute(f"SELECT id, merchant, {EFFECTIVE_CATEGORY} FROM transactions WHERE id > ?",
+                            (since,)).fetchall()
+    if not new_rows:
+        return 0, 0
+    max_id = max(r[0] for r in new_rows)
+
+    # Full history, but only for merchants and categories the new rows belong to. Keys are
+    # lowercase, so NOCASE loses nothing and lets idx_txn_merchant serve the lookup.
+    new_keys = {m: merchant_key(m) for m in {r[1] for r in new_rows} if m is not None}
+    touched_keys = {merchant_key(r[1]) for r in new_rows}
+    backfill = []
+    if since and conn.execute("SELECT 1 FROM merchant_keys LIMIT 1").fetchone() is None:
+        # First run since merchant_keys was added: map the names ingested before the watermark
+        backfill = [(m, merchant_key(m)) for (m,) in conn.execute(
+            "SELECT DISTINCT merchant FROM transactions WHERE id <= ? AND merchant IS NOT NULL", (since,))]
+    known = conn.execute("SELECT merchant FROM merchant_keys WHERE key IN (SELECT value FROM json_each(?))",
+                         (json.dumps(sorted(touched_keys)),)).fetchall()
+    names = {m for (m,) in known} | {m for m, k in backfill if k in touched_keys} | set(new_keys)
+    hist = conn.execute(f"""
+        SELECT id, date, amount, merchant, {EFFECTIVE_CATEGORY} FROM transactions
+        WHERE merchant COLLATE NOCASE IN (SELECT value FROM json_each(?))
+    """, (json.dumps(sorted(names)),)).fetchall()
+    recurring = _recurring_rows(hist, opts) if hist else {}
+
+    cutoff = (datetime.date.today() - datetime.timedelta(days=opts["history_days"])).isoformat()
+    credit = opts["credit_categories"]
+    touched_cats = sorted({r[2] for r in new_rows} - set(credit))
+    cat_rows = conn.execute(f"""
+        SELECT id, amount, {EFFECTIVE_CATEGORY} FROM transactions
+        WHERE {EFFECTIVE_CATEGORY} IN (SELECT value FROM json_each(?)) AND (date >= ? OR id > ?)
+              AND amount > 0
+    """, (json.dumps(touched_cats), cutoff, since)).fetchall()
+    anomalies = _anomaly_rows(cat_rows, since, opts) if cat_rows else []
+
+    now = datetime.datetime.utcnow().isoformat()
+    with writing(db) as wconn:
+        if full:
+            wconn.execute("DELETE FROM recurring_payments")
+            wconn.execute("DELETE FROM spend_anomalies")
+            wconn.execute("DELETE FROM merchant_keys")
+        wconn.executemany("INSERT OR IGNORE INTO merchant_keys (merchant, key) VALUES (?, ?)",
+                          backfill + list(new_keys.items()))
+        wconn.execute("DELETE FROM spend_anomalies WHERE category IN (SELECT value FROM json_each(?))",
+                      (json.dumps(credit),))
+        wconn.executemany("DELETE FROM recurring_payments WHERE merchant_key=?",
+                          [(k,) for k in touched_keys if k not in recurring])
+        wconn.executemany("""
+            INSERT OR REPLACE INTO recurring_payments
+                (merchant_key, merchant, category, occurrences, period_days, period, regularity,
+                 typical_amount, last_amount, drift, last_date, next_date, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(k,) + v + (now,) for k, v in recurring.items()])
+        wconn.executemany("""
+            INSERT OR REPLACE INTO spend_anomalies (tx_id, category, amount, median, score, detected_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [a + (now,) for a in anomalies])
+        wconn.execute("""
+            INSERT INTO app_state (key, value, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at
+        """, (WATERMARK_KEY, str(max_id), now))
+        bump_state(wconn, DATA_VERSION_KEY)
+        wconn.commit()
+    return len(recurring), len(anomalies)
+
+def _recurring_rows(hist, opts) -> dict:
+    ids, dates, amounts, merchants, cats = zip(*hist)
+    key_names = [merchant_key(m) for m in merchants]
+    vocab = {k: i for i, k in enumerate(dict.fromkeys(key_names))}
+    keys = np.array([vocab[k] for k in key_names], dtype=np.int64)
+    found = detect_recurring(keys, _days(dates), np.array(amounts, dtype=np.float64), opts["min_occurrences"])
+    names = list(vocab)
+    out = {}
+    for code, r in found.items():
+        last = datetime.date.fromordinal(r["last_day"])
+        nxt = last + datetime.timedelta(days=round(r["period_days"]))
+        out[names[code]] = (merchants[r["row"]], cats[r["row"]], r["occurrences"], r["period_days"], r["period"],
+                            r["regularity"], r["typical_amount"], r["last_amount"], r["drift"],
+                            last.isoformat(), nxt.isoformat())
+    return out
+
+def _anomaly_rows(cat_rows, since: int, opts) -> list:
+    ids, amounts, cats = zip(*cat_rows)
+    vocab = {c: i for i, c in enumerate(dict.fromkeys(cats))}
+    codes = np.array([vocab[c] for c in cats], dtype=np.int64)
+    id_arr = np.array(ids, dtype=np.int64)
+    hit, score, median = score_anomalies(codes, np.array(amounts, dtype=np.float64), id_arr > since, opts["anomaly_z"])
+    return [(int(id_arr[i]), cats[i], amounts[i], float(m), float(s)) for i, s, m in zip(hit, score, median)]
@@ -1,18 +1,54 @@
-import os, argparse, webbrowser
-from app import app, start_scheduler, run_fetch_cycle
+import argparse, webbrowser
+from app import create_app, start_scheduler, load_config
+from database import init_db, check_rollups, rebuild_rollups
+from profiles import profile_configs
 
 def main():
     parser = argparse.ArgumentParser(description='TheCoder Finance App')
     parser.add_argument('--config', default='config.json', help='config.json or config.yaml path')
     parser.add_argument('--open', action='store_true', help='Open dashboard in browser')
+    parser.add_argument('--profile', action='append',
+                        help='Limit the maintenance commands below to this profile (repeatable; default: all)')
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help='Check the summary rollup table against transactions, rebuild it and exit')
+    parser.add_argument('--rebuild-insights', action='store_true',
+                        help='Recompute recurring payments and spend anomalies from all transactions and exit')
+    parser.add_argument('--export-columns', action='store_true',
+                        help='Update the columnar (NumPy) export of transactions and exit')
     args = parser.parse_args()
 
-    # app.py reads TC_CONFIG env var on import; set it here then run
-    os.environ['TC_CONFIG'] = args.config
-    # First fetch cycle is run on app start; we can open browser
+    if args.rebuild_rollups or args.rebuild_insights or args.export_columns:
+        configs = profile_configs(load_config(args.config))
+        unknown = set(args.profile or ()) - set(configs)
+        if unknown:
+            parser.error(f'unknown profile(s): {", ".join(sorted(unknown))}')
+        for name, cfg in configs.items():
+            if not args.profile or name in args.profile:
+                maintain(args, name, cfg)
+        return
+
+    app = create_app(args.config)
+    # The first scheduler tick runs a fetch cycle right away; fetchers and the ML
+    # stack load in that background thread, so the server is up before they are
+    start_scheduler()
     if args.open:
         webbrowser.open('http://127.0.0.1:5000/')
     app.run(host='127.0.0.1', port=5000, debug=False)
 
+def maintain(args, name: str, cfg: dict):
+    conn = init_db(cfg['database']['path'])
+    if args.rebuild_rollups:
+        drift = check_rollups(conn)
+        print(f'[Rollup:{name}] {len(drift)} out-of-sync keys' + (f', e.g. {drift[:5]}' if drift else ''))
+        print(f'[Rollup:{name}] rebuilt {rebuild_rollups(conn)} rows')
+    if args.rebuild_insights:
+        import insights
+        recurring, anomalies = insights.run(conn, cfg, full=True)
+        print(f'[Insights:{name}] {recurring} recurring merchants, {anomalies} anomalies')
+    if args.export_columns:
+        import columnar
+        manifest = columnar.export(conn, columnar.export_dir(cfg))
+        print(f"[Export:{name}] {manifest['rows']} rows in {columnar.export_dir(cfg)}/{manifest['generation']}")
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,175 @@
+"""Timing spans, request latency histograms and optional cycle profiles.
+
+Everything is a no-op until ``configure`` enables it: ``span`` then hands back
+a shared do-nothing context manager, so instrumented code pays one attribute
+check. Output is the Prometheus text exposition format (``render``).
+"""
+import cProfile, pstats, threading, time
+from typing import Optional
+
+# Seconds; wide enough for a single SQLite write and a full Gmail backfill
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+class _Span:
+    __slots__ = ("registry", "stage", "t0")
+
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe("tc_stage_seconds", time.perf_counter() - self.t0, stage=self.stage)
+        return False
+
+class Registry:
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._hists = {}    # (name, sorted label items) -> Histogram
+        self._gauges = {}   # (name, sorted label items) -> float
+        self._help = {
+            "tc_stage_seconds": "Duration of fetch/parse/write/categorize stages",
+            "tc_request_seconds": "Flask request latency by route",
+            "tc_last_cycle_seconds": "Wall time of the most recent fetch cycle",
+        }
+
+    def span(self, stage: str):
+        return _Span(self, stage) if self.enabled else _NOOP
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._hists.get(key)
+            if hist is None:
+                hist = self._hists[key] = Histogram()
+            hist.observe(value)
+
+    def set_gauge(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = float(value)
+
+    def render(self) -> str:
+        with self._lock:
+            hists = {k: (list(h.counts), h.total, h.count) for k, h in self._hists.items()}
+            gauges = dict(self._gauges)
+        lines, typed = [], set()
+        for (name, labels), (counts, total, count) in sorted(hists.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, n in zip(BUCKETS, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels, le=repr(bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for (name, labels), value in sorted(gauges.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{_labels(labels)} {value:.6f}")
+        return "\n".join(lines) + "\n"
+
+def _labels(items, **extra) -> str:
+    pairs = list(items) + list(extra.items())
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+# Only one cProfile may be enabled per process at a time (3.12+ raises ValueError
+# otherwise), across cycles and profiles
+_PROFILE_LOCK = threading.Lock()
+
+class CycleProfiler:
+    """cProfile for one fetch cycle across its worker threads, merged into one .prof file.
+
+    A section that starts while another is being profiled runs unprofiled
+    rather than waiting, so profiling never delays or serializes a cycle.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._profiles = []
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    def wrap(self, fn):
+        # cProfile only sees the thread that enabled it, so each worker gets its own
+        def run(*args, **kwargs):
+            if not _PROFILE_LOCK.acquire(blocking=False):
+                with self._lock:
+                    self.skipped += 1
+                return fn(*args, **kwargs)
+            try:
+                prof = cProfile.Profile()
+                prof.enable()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    prof.disable()
+                    with self._lock:
+                        self._profiles.append(prof)
+            finally:
+                _PROFILE_LOCK.release()
+        return run
+
+    def dump(self):
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return
+        stats = pstats.Stats(profiles[0])
+        for prof in profiles[1:]:
+            stats.add(prof)
+        stats.dump_stats(self.path)
+
+REGISTRY = Registry()
+
+def configure(cfg: dict):
+    REGISTRY.enabled = bool(cfg.get("metrics", {}).get("enabled", False))
+
+def span(stage: str):
+    return REGISTRY.span(stage)
+
+def cycle_profiler(cfg: dict) -> Optional[CycleProfiler]:
+    mcfg = cfg.get("metrics", {})
+    if not mcfg.get("profile_cycles", False):
+        return None
+    return CycleProfiler(mcfg.get("profile_path", "last_cycle.prof"))
@@ -1,25 +1,131 @@
-import json, yaml, sqlite3
+import datetime, json, os, pickle, re, sqlite3
 from typing import List, Tuple
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import MultinomialNB
-from sklearn.pipeline import Pipeline
+import metrics
+from database import DATA_VERSION_KEY, LABEL_VERSION_KEY, Database, bump_state, get_state, reading, writing
+
+# model_path -> (label_version, fitted pipeline), so a warm process skips unpickling too
+_MODELS = {}
+# serialized categories_rules -> RuleMatcher
+_MATCHERS = {}
 
 def load_config(path: str) -> dict:
     if path.lower().endswith('.json'):
         return json.load(open(path, 'r', encoding='utf-8'))
     else:
+        import yaml
         return yaml.safe_load(open(path, 'r', encoding='utf-8'))
 
+def _trie_pattern(words) -> str:
+    # Shared prefixes become nested groups, so the regex branches on one character per step
+    # instead of trying every keyword at every position (a poor man's Aho-Corasick)
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node) -> str:
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ''
+        body = alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+        # Optional when a keyword ends here; greedy, so the longest keyword wins
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+class RuleMatcher:
+    """categories_rules compiled into a single trie-shaped regex.
+
+    Gives the same answer as checking each category in config order for any
+    keyword substring: every keyword occurrence is found in one pass and the
+    one from the earliest category wins.
+    """
+
+    CACHE_LIMIT = 100000
+
+    def __init__(self, rules: dict):
+        rank = {}
+        self.default = None
+        for i, (cat, keys) in enumerate(rules.items()):
+            for k in keys or []:
+                k = k.lower()
+                if not k:
+                    # An empty keyword matches everything, as with a plain substring test
+                    self.default = self.default or (i, cat)
+                elif k not in rank:
+                    rank[k] = (i, cat)
+        # The regex reports the longest keyword at each position; any shorter keyword that
+        # also matches there is one of its prefixes, so fold their priorities in up front
+        self.rank = {k: min(rank[k[:n]] for n in range(1, len(k) + 1) if k[:n] in rank) for k in rank}
+        # Lookahead so overlapping keywords are all seen
+        self.regex = re.compile('(?=(' + _trie_pattern(rank) + '))') if rank else None
+        self.cache = {}
+
+    def match(self, merchant: str) -> str:
+        low = (merchant or '').lower()
+        cat = self.cache.get(low)
+        if cat is None:
+            best = self.default
+            if self.regex is not None:
+                for m in self.regex.finditer(low):
+                    hit = self.rank[m.group(1)]
+                    if best is None or hit < best:
+                        best = hit
+                        if hit[0] == 0:
+                            break
+            cat = best[1] if best else ''
+            if len(self.cache) >= self.CACHE_LIMIT:
+                self.cache.clear()
+            self.cache[low] = cat
+        return cat
+
+def compiled_rules(cfg: dict) -> RuleMatcher:
+    rules = cfg.get('categories_rules', {}) or {}
+    key = json.dumps(rules)
+    matcher = _MATCHERS.get(key)
+    if matcher is None:
+        matcher = _MATCHERS[key] = RuleMatcher(rules)
+    return matcher
+
 def rule_category(merchant: str, cfg: dict) -> str:
-    low = (merchant or '').lower()
-    for cat, keys in cfg.get('categories_rules', {}).items():
-        for k in keys:
-            if k.lower() in low:
-                return cat
-    return ''
-
-def train_and_predict(conn: sqlite3.Connection, cfg: dict) -> int:
-    cur = conn.cursor()
+    return compiled_rules(cfg).match(merchant)
+
+def learn_rule(rules: dict, category: str, keyword: str) -> Tuple[dict, bool]:
+    """Copy of rules with keyword filed under category (and removed from every other one).
+
+    The flag says whether the keyword now maps to category; it doesn't when an
+    earlier category has a keyword that is a substring of it.
+    """
+    keyword = keyword.strip().lower()
+    learned = {cat: [k for k in keys or [] if k.lower() != keyword] for cat, keys in rules.items()}
+    learned.setdefault(category, []).append(keyword)
+    return learned, RuleMatcher(learned).match(keyword) == category
+
+def model_path(cfg: dict) -> str:
+    path = cfg.get('categorizer', {}).get('model_path')
+    if path:
+        return path
+    return os.path.splitext(cfg['database']['path'])[0] + '.model.pkl'
+
+def load_or_train(db: Database, cfg: dict):
+    """Return a pipeline fitted on the current labels, retraining only when they changed."""
+    path = model_path(cfg)
+    version = get_state(db, LABEL_VERSION_KEY, '0')
+    cached = _MODELS.get(path)
+    if cached is None and os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                saved = pickle.load(f)
+            cached = (saved['label_version'], saved['model'])
+        except Exception as e:
+            print('[Categorizer] ignoring unreadable model file:', e)
+    if cached and cached[0] == version:
+        _MODELS[path] = cached
+        return cached[1]
+
+    cur = reading(db).cursor()
     # Training data: rows where user_category or category is present
     cur.execute("""        SELECT id, COALESCE(user_category, category), merchant||' '||IFNULL(subject,'')||' '||IFNULL(raw_snippet,'') 
         FROM transactions 
@@ -28,38 +134,80 @@ def train_and_predict(conn: sqlite3.Connection, cfg: dict) -> int:
     """)
     rows = cur.fetchall()
     if not rows:
-        return 0
+        return None
     y = [r[1] for r in rows]
     X = [r[2] for r in rows]
-    model: Pipeline = Pipeline([('tfidf', TfidfVectorizer(max_features=5000)), ('nb', MultinomialNB())])
+    # sklearn costs ~1 s to import; only pay it when there is something to fit
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import Pipeline
+    model = Pipeline([('tfidf', TfidfVectorizer(max_features=5000)), ('nb', MultinomialNB())])
     try:
-        model.fit(X, y)
+        with metrics.span('train'):
+            model.fit(X, y)
     except Exception:
-        return 0
+        return None
+    _MODELS[path] = (version, model)
+    try:
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump({'label_version': version, 'model': model}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print('[Categorizer] could not save model:', e)
+    return model
 
-    # Predict for items missing ai_category and user_category
+def train_and_predict(db: Database, cfg: dict) -> int:
+    # Reads and fitting happen outside the write lock; only the final UPDATE takes it
+    # Predict for items missing ai_category and user_category; rows a rule already
+    # categorized keep the rule's answer
+    cur = reading(db).cursor()
     cur.execute("""        SELECT id, merchant||' '||IFNULL(subject,'')||' '||IFNULL(raw_snippet,'') FROM transactions
         WHERE (ai_category IS NULL OR ai_category='') 
           AND (user_category IS NULL OR user_category='')
+          AND (category IS NULL OR TRIM(category)='')
     """)
     targets = cur.fetchall()
-    updated = 0
-    for tid, text in targets:
-        pred = model.predict([text])[0]
-        cur.execute('UPDATE transactions SET ai_category=? WHERE id=?', (pred, tid))
-        updated += 1
-    conn.commit()
-    return updated
-
-def apply_rules(conn: sqlite3.Connection, cfg: dict) -> int:
-    cur = conn.cursor()
+    if not targets:
+        return 0
+    model = load_or_train(db, cfg)
+    if model is None:
+        return 0
+    with metrics.span('predict'):
+        preds = model.predict([text for _, text in targets])
+    now = datetime.datetime.utcnow().isoformat()
+    with writing(db) as conn:
+        conn.executemany('UPDATE transactions SET ai_category=?, updated_at=? WHERE id=?',
+                         [(str(p), now, tid) for p, (tid, _) in zip(preds, targets)])
+        bump_state(conn, DATA_VERSION_KEY)
+        conn.commit()
+    return len(targets)
+
+def apply_rules(db: Database, cfg: dict) -> int:
+    with metrics.span('apply_rules'):
+        return _apply_rules(db, cfg)
+
+def _apply_rules(db: Database, cfg: dict) -> int:
+    cur = reading(db).cursor()
+    matcher = compiled_rules(cfg)
     # Only set category if empty and rules match
     cur.execute("SELECT id, merchant FROM transactions WHERE category IS NULL OR TRIM(category)='' ")
-    updated = 0
+    updates = []
     for tid, merchant in cur.fetchall():
-        cat = rule_category(merchant or '', cfg)
+        cat = matcher.match(merchant)
         if cat:
-            cur.execute('UPDATE transactions SET category=? WHERE id=?', (cat, tid))
-            updated += 1
-    conn.commit()
-    return updated
+            updates.append((cat, tid))
+    if not updates:
+        return 0
+    now = datetime.datetime.utcnow().isoformat()
+    with writing(db) as conn:
+        # Re-check emptiness: the row may have been categorized since it was read
+        cur = conn.executemany("UPDATE transactions SET category=?, updated_at=? WHERE id=? AND (category IS NULL OR TRIM(category)='')",
+                               [(cat, now, tid) for cat, tid in updates])
+        # executemany's rowcount is the total over all parameter sets
+        changed = max(0, cur.rowcount)
+        if changed:
+            bump_state(conn, LABEL_VERSION_KEY)
+            bump_state(conn, DATA_VERSION_KEY)
+        conn.commit()
+    return changed
@@ -0,0 +1,73 @@
+"""Profile-aware configuration: one config file, several isolated ledgers.
+
+A config may have a ``profiles`` section mapping names to overlays. Each
+overlay is merged onto the rest of the config (nested sections key by key,
+lists and scalars replaced), so a profile only states what differs:
+
+    "profiles": {
+        "household": {"statements": {"folder": "statements/household"}},
+        "business": {"refresh_interval": 900, "sms": {"enabled": false}}
+    }
+
+Files that must not be shared (database, Gmail token, model, exports) get
+the profile name added to their path unless the overlay sets them. A
+config without ``profiles`` is a single profile named "default".
+"""
+import copy, os, re
+
+DEFAULT = "default"
+# (section, key) of paths each profile needs its own copy of
+PER_PROFILE_PATHS = (("database", "path"), ("gmail", "token_file"), ("categorizer", "model_path"),
+                     ("analytics", "export_dir"), ("metrics", "profile_path"))
+_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+def merge(base: dict, overlay: dict) -> dict:
+    out = copy.deepcopy(base)
+    for key, value in (overlay or {}).items():
+        if isinstance(value, dict) and isinstance(out.get(key), dict):
+            out[key] = merge(out[key], value)
+        else:
+            out[key] = copy.deepcopy(value)
+    return out
+
+def _suffixed(path: str, name: str) -> str:
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{name}{ext}"
+
+def profile_configs(cfg: dict) -> dict:
+    """name -> effective config for every profile, in config order."""
+    profiles = cfg.get("profiles")
+    if not profiles:
+        return {DEFAULT: dict(cfg, profile=DEFAULT)}
+    base = {k: v for k, v in cfg.items() if k not in ("profiles", "default_profile")}
+    out, owners = {}, {}
+    for name, overlay in profiles.items():
+        if not _NAME.match(name):
+            raise ValueError(f"profile name {name!r} may only use letters, digits, '-' and '_'")
+        overlay = overlay or {}
+        pcfg = merge(base, overlay)
+        for section, key in PER_PROFILE_PATHS:
+            if pcfg.get(section, {}).get(key) and not overlay.get(section, {}).get(key):
+                pcfg[section][key] = _suffixed(pcfg[section][key], name)
+        db_path = os.path.abspath(pcfg["database"]["path"])
+        if db_path in owners:
+            raise ValueError(f"profiles {owners[db_path]!r} and {name!r} share database {db_path}")
+        owners[db_path] = name
+        pcfg["profile"] = name
+        out[name] = pcfg
+    return out
+
+def default_profile(cfg: dict) -> str:
+    profiles = cfg.get("profiles") or {}
+    name = cfg.get("default_profile") or next(iter(profiles), DEFAULT)
+    if profiles and name not in profiles:
+        raise ValueError(f"default_profile {name!r} is not one of {list(profiles)}")
+    return name
+
+def overlay_for(on_disk: dict, name: str) -> dict:
+    """The section of a loaded config file that holds settings for profile ``name``."""
+    if not on_disk.get("profiles"):
+        return on_disk
+    if on_disk["profiles"].get(name) is None:
+        on_disk["profiles"][name] = {}
+    return on_disk["profiles"][name]
@@ -0,0 +1,100 @@
+"""In-process cache of serialized API responses, validated by the data version.
+
+Entries are keyed by route and query string and remember the ``data_version``
+they were built at; any ingest or category write bumps that counter, so a
+stale entry is simply never matched again. ETags hash the body, which keeps
+them stable when a rebuild produces identical JSON, and the gzip copy of a
+body is made once, on the first request that accepts it.
+"""
+import gzip, hashlib, threading
+from collections import OrderedDict
+
+DEFAULT_ENTRIES = 256
+# Below this a gzip header and deflate block save too little to be worth it
+DEFAULT_GZIP_MIN_BYTES = 1024
+
+class Entry:
+    __slots__ = ("version", "body", "etag", "_gzipped")
+
+    def __init__(self, version: int, body: bytes):
+        self.version = version
+        self.body = body
+        # Weak: the gzip and identity encodings of a body share one validator
+        self.etag = 'W/"%s"' % hashlib.sha1(body).hexdigest()[:20]
+        self._gzipped = None
+
+    def gzipped(self) -> bytes:
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+class ResponseCache:
+    def __init__(self, max_entries: int = DEFAULT_ENTRIES, gzip_min_bytes: int = DEFAULT_GZIP_MIN_BYTES):
+        self.max_entries = max(0, int(max_entries))
+        self.gzip_min_bytes = int(gzip_min_bytes)
+        self._entries = OrderedDict()   # key -> Entry, least recently used first
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "ResponseCache":
+        hcfg = cfg.get("http", {})
+        return cls(hcfg.get("cache_entries", DEFAULT_ENTRIES),
+                   hcfg.get("gzip_min_bytes", DEFAULT_GZIP_MIN_BYTES))
+
+    def get(self, key, version: int):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version: int, body: bytes) -> Entry:
+        entry = Entry(version, body)
+        if not self.max_entries:
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def rebase(self, before: int, after: int, unaffected) -> int:
+        """Carry entries built at ``before`` over to ``after`` when ``unaffected(key)`` says
+        the writes in between cannot have changed them. Returns how many were kept."""
+        kept = 0
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.version == before and unaffected(key):
+                    entry.version = after
+                    kept += 1
+        return kept
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored on both sides
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == bare:
+            return True
+    return False
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    weights = {}
+    for item in (accept_encoding or "").lower().split(","):
+        coding, _, params = item.partition(";")
+        q = params.strip()
+        try:
+            weights[coding.strip()] = float(q[2:]) if q.startswith("q=") else 1.0
+        except ValueError:
+            weights[coding.strip()] = 0.0
+    return weights.get("gzip", weights.get("*", 0.0)) > 0
@@ -1,61 +1,130 @@
-import re, requests, json, yaml
-from datetime import datetime
-from database import init_db, upsert_transaction
+import json
+from datetime import datetime, timedelta
+import metrics, txn_parser
+from database import ConnectionManager, BatchWriter, DEFAULT_BATCH_SIZE, get_state, set_state
+
+SINCE_KEY = "sms_since"
+# Bridges filter on date > since, and some only send whole dates, so ask for a day before the
+# newest stored message; anything already stored is a fingerprint no-op
+SINCE_OVERLAP = timedelta(days=1)
+CHUNK_SIZE = 64 * 1024
 
 def load_config(path: str) -> dict:
     if path.lower().endswith(".json"):
         return json.load(open(path, "r", encoding="utf-8"))
     else:
+        import yaml
         return yaml.safe_load(open(path, "r", encoding="utf-8"))
 
-def parse_sms_text(text: str):
+def parse_sms_text(text: str, sender: str = ""):
     # Example matches: Rs 4500 debited at AMAZON
-    pat = r'(?:₹|INR|Rs\.?)\s*([0-9]+(?:\.[0-9]{1,2})?).{0,40}?(?:at|in)\s+([A-Za-z0-9 &\-\._]{2,64})'
-    m = re.search(pat, text, re.IGNORECASE)
-    if not m:
-        return None
-    amount = float(m.group(1))
-    merch = m.group(2).strip(' .,-')
-    return amount, merch
+    return txn_parser.parse_sms(text, sender)
+
+def request_since(newest: str) -> str:
+    """The ?since= to send when the newest stored message is dated `newest`."""
+    try:
+        day = datetime.strptime(newest[:10], "%Y-%m-%d")
+    except ValueError:
+        return newest
+    return (day - SINCE_OVERLAP).strftime("%Y-%m-%d")
+
+def iter_json_array(chunks):
+    """Yield the elements of a top-level JSON array while its text is still arriving."""
+    decoder = json.JSONDecoder()
+    buf, pos, opened = "", 0, False
+    for chunk in chunks:
+        buf = buf[pos:] + chunk
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if not opened:
+                if buf[pos] != "[":
+                    raise ValueError("expected a JSON array")
+                opened = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                break  # element not complete yet
+            if not isinstance(obj, (dict, list, str)) and (end == len(buf) or buf[end] not in " \t\r\n,]"):
+                break  # a bare number may be cut mid-way ("12" of "12.5")
+            yield obj
+            pos = end
+    raise ValueError("truncated JSON array")
 
 class SMSFetcher:
-    def __init__(self, config_path: str):
-        self.cfg = load_config(config_path)
-        self.conn = init_db(self.cfg["database"]["path"])
+    def __init__(self, config_path: str = None, db: ConnectionManager = None, cfg: dict = None, session=None):
+        # cfg: an already-loaded (e.g. per-profile) config instead of config_path;
+        # session: anything with requests' get(url, params=, timeout=, stream=), e.g. a
+        # requests.Session or a benchmark stub; defaults to the requests module
+        self.cfg = cfg if cfg is not None else load_config(config_path)
+        self.db = db or ConnectionManager.from_config(self.cfg)
+        self.session = session
 
     def run(self) -> int:
         if not self.cfg.get("sms", {}).get("enabled", False):
             return 0
         url = self.cfg["sms"]["android_api_url"]
+        http = self.session
+        if http is None:
+            import requests as http
+        since = get_state(self.db, SINCE_KEY)
         try:
-            resp = requests.get(url, timeout=10)
+            # Bridges that understand ?since= send only newer messages; others send everything
+            # and the fingerprint index turns the repeats into no-ops
+            resp = http.get(url, params={"since": request_since(since)} if since else None, timeout=10, stream=True)
             resp.raise_for_status()
-            messages = resp.json()  # Expect list of {body:..., date:...}
         except Exception as e:
             print("[SMS] fetch error:", e)
             return 0
-        inserted = 0
-        for sms in messages:
-            body = sms.get("body", "")
-            parsed = parse_sms_text(body)
-            if not parsed: 
-                continue
-            amount, merchant = parsed
-            date = sms.get("date") or datetime.now().strftime("%Y-%m-%d")
-            tx = {
-                "date": date[:10],
-                "merchant": merchant,
-                "category": None,
-                "ai_category": None,
-                "user_category": None,
-                "amount": float(amount),
-                "currency": "INR",
-                "source": "sms",
-                "message_id": None,
-                "subject": None,
-                "from_email": None,
-                "raw_snippet": body[:1000]
-            }
-            if upsert_transaction(self.conn, tx):
-                inserted += 1
-        return inserted
+        newest, complete, seen = since or "", True, {}
+        with resp, BatchWriter(self.db, self.cfg["database"].get("batch_size", DEFAULT_BATCH_SIZE)) as writer:
+            resp.encoding = resp.encoding or "utf-8"
+            try:
+                # Expect list of {body:..., date:...}
+                for sms in iter_json_array(resp.iter_content(CHUNK_SIZE, decode_unicode=True)):
+                    newest = max(newest, str(sms.get("date") or ""))
+                    tx = self._to_tx(sms)
+                    if tx:
+                        # Identical alerts on one day are numbered by their position in the
+                        # response; the overlap re-sends whole days, so numbers are stable
+                        key = (tx["date"], tx["raw_snippet"])
+                        tx["occurrence"] = seen[key] = seen.get(key, 0) + 1
+                        writer.add(tx)
+            except Exception as e:
+                # Rows decoded so far are still written, but the cursor stays put
+                print("[SMS] stream error:", e)
+                complete = False
+        if complete and newest and newest != since:
+            set_state(self.db, SINCE_KEY, newest)
+        return writer.inserted
+
+    def _to_tx(self, sms: dict):
+        body = sms.get("body", "")
+        # Android exposes the sender id (VM-HDFCBK) as "address"
+        with metrics.span("parse_sms"):
+            parsed = parse_sms_text(body, sms.get("address") or sms.get("sender") or "")
+        if not parsed: 
+            return None
+        amount, merchant = parsed
+        date = sms.get("date") or datetime.now().strftime("%Y-%m-%d")
+        return {
+            "date": date[:10],
+            "merchant": merchant,
+            "category": None,
+            "ai_category": None,
+            "user_category": None,
+            "amount": float(amount),
+            "currency": "INR",
+            "source": "sms",
+            "message_id": None,
+            "subject": None,
+            "from_email": None,
+            "raw_snippet": body[:1000]
+        }
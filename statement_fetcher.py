@@ -1,87 +1,166 @@
-import os, csv, json, yaml
-import pdfplumber
+import os, csv, json, hashlib, multiprocessing, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from database import init_db, upsert_transaction
+import metrics
+from database import ConnectionManager, BatchWriter, DEFAULT_BATCH_SIZE, reading, writing
 
 def load_config(path: str) -> dict:
     if path.lower().endswith(".json"):
         return json.load(open(path, "r", encoding="utf-8"))
     else:
+        import yaml
         return yaml.safe_load(open(path, "r", encoding="utf-8"))
 
+def iter_pdf_lines(file_path: str, password=None):
+    # Yields rows page by page and drops each page's cached layout once read
+    import pdfplumber
+    with pdfplumber.open(file_path, password=password) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text() or ""
+            for line in text.split("\n"):
+                parts = line.split()
+                if len(parts) >= 3:
+                    # naive: first token date-like, last token amount-like
+                    date_tok = parts[0]
+                    amt_tok = parts[-1].replace(',', '')
+                    if len(date_tok) >= 8 and amt_tok.replace('.', '', 1).isdigit():
+                        try:
+                            amt = float(amt_tok)
+                        except ValueError:
+                            continue
+                        merchant = " ".join(parts[1:-1]).strip()
+                        # normalize date
+                        date = date_tok
+                        for fmt in ("%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d"):
+                            try:
+                                date = datetime.strptime(date_tok, fmt).strftime("%Y-%m-%d")
+                                break
+                            except ValueError:
+                                pass
+                        yield {
+                            "date": date,
+                            "merchant": merchant,
+                            "amount": amt,
+                            "raw": line
+                        }
+            close = getattr(page, "close", None)
+            if close:
+                close()
+
 def parse_pdf_lines(file_path: str, password=None):
     txns = []
     try:
-        with pdfplumber.open(file_path, password=password) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text() or ""
-                for line in text.split("\n"):
-                    parts = line.split()
-                    if len(parts) >= 3:
-                        # naive: first token date-like, last token amount-like
-                        date_tok = parts[0]
-                        amt_tok = parts[-1].replace(',', '')
-                        if len(date_tok) >= 8 and amt_tok.replace('.', '', 1).isdigit():
-                            try:
-                                amt = float(amt_tok)
-                            except:
-                                continue
-                            merchant = " ".join(parts[1:-1]).strip()
-                            # normalize date
-                            date = date_tok
-                            for fmt in ("%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d"):
-                                try:
-                                    date = datetime.strptime(date_tok, fmt).strftime("%Y-%m-%d")
-                                    break
-                                except: pass
-                            txns.append({
-                                "date": date,
-                                "merchant": merchant,
-                                "amount": amt,
-                                "raw": line
-                            })
+        for t in iter_pdf_lines(file_path, password):
+            txns.append(t)
     except Exception as e:
         print("[STATEMENT] PDF parse error:", e)
     return txns
 
 def parse_csv(file_path: str):
+    # Unreadable or undecodable files raise, so parse_statement reports them and the
+    # file stays out of the manifest to be retried; only bad amounts skip a row
     txns = []
+    with open(file_path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            date = (row.get("Date") or row.get("Txn Date") or row.get("date") or "")[:10]
+            merchant = row.get("Description") or row.get("Narration") or row.get("Merchant") or ""
+            amt_str = (row.get("Amount") or row.get("Debit") or row.get("Credit") or "0").replace(',', '')
+            try:
+                amt = float(amt_str)
+            except ValueError:
+                continue
+            txns.append({"date": date, "merchant": merchant, "amount": amt, "raw": str(row)})
+    return txns
+
+def pool_context():
+    # Never fork: the parent already runs Flask, scheduler and fetcher threads, and a child
+    # forked while one of them holds the import lock (or any other) can deadlock
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def parse_statement(path: str, password=None):
+    """Process-pool entry point: returns (path, rows, seconds, error)."""
+    t0 = time.perf_counter()
     try:
-        with open(file_path, newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                date = (row.get("Date") or row.get("Txn Date") or row.get("date") or "")[:10]
-                merchant = row.get("Description") or row.get("Narration") or row.get("Merchant") or ""
-                amt_str = (row.get("Amount") or row.get("Debit") or row.get("Credit") or "0").replace(',', '')
-                try:
-                    amt = float(amt_str)
-                except:
-                    continue
-                txns.append({"date": date, "merchant": merchant, "amount": amt, "raw": str(row)})
+        if path.lower().endswith(".pdf"):
+            rows = list(iter_pdf_lines(path, password))
+        else:
+            rows = parse_csv(path)
+        return path, rows, time.perf_counter() - t0, None
     except Exception as e:
-        print("[STATEMENT] CSV parse error:", e)
-    return txns
+        return path, [], time.perf_counter() - t0, str(e)
 
 class StatementFetcher:
-    def __init__(self, config_path: str):
-        self.cfg = load_config(config_path)
-        self.conn = init_db(self.cfg["database"]["path"])
+    def __init__(self, config_path: str = None, db: ConnectionManager = None, cfg: dict = None):
+        # cfg: an already-loaded (e.g. per-profile) config instead of config_path
+        self.cfg = cfg if cfg is not None else load_config(config_path)
+        self.db = db or ConnectionManager.from_config(self.cfg)
 
     def run(self) -> int:
         if not self.cfg.get("statements", {}).get("enabled", False):
             return 0
         folder = self.cfg["statements"]["folder"]
         password = self.cfg["statements"].get("password")
-        inserted = 0
         if not os.path.isdir(folder):
             return 0
-        for name in os.listdir(folder):
+        pending = self._changed_files(folder)
+        if not pending:
+            return 0
+        workers = int(self.cfg["statements"].get("workers") or os.cpu_count() or 1)
+        with BatchWriter(self.db, self.cfg["database"].get("batch_size", DEFAULT_BATCH_SIZE)) as writer:
+            if workers <= 1 or len(pending) == 1:
+                results = (parse_statement(path, password) for path in pending)
+                self._ingest(writer, pending, results)
+            else:
+                with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=pool_context()) as pool:
+                    futures = [pool.submit(parse_statement, path, password) for path in pending]
+                    self._ingest(writer, pending, (f.result() for f in as_completed(futures)))
+        return writer.inserted
+
+    def _changed_files(self, folder: str) -> dict:
+        """Map path -> (size, mtime, sha256) for statement files not yet ingested as-is."""
+        cur = reading(self.db).cursor()
+        cur.execute("SELECT path, size, mtime, sha256 FROM statement_files")
+        manifest = {r[0]: r[1:] for r in cur.fetchall()}
+        pending, touched = {}, []
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith((".pdf", ".csv")):
+                continue
             path = os.path.join(folder, name)
-            txns = []
-            if name.lower().endswith(".pdf"):
-                txns = parse_pdf_lines(path, password)
-            elif name.lower().endswith(".csv"):
-                txns = parse_csv(path)
+            st = os.stat(path)
+            seen = manifest.get(path)
+            if seen and seen[0] == st.st_size and seen[1] == st.st_mtime:
+                continue
+            # Size/mtime moved: only re-parse if the bytes actually changed
+            digest = file_sha256(path)
+            if seen and seen[2] == digest:
+                touched.append((st.st_size, st.st_mtime, path))
+            else:
+                pending[path] = (st.st_size, st.st_mtime, digest)
+        if touched:
+            with writing(self.db) as conn:
+                conn.executemany("UPDATE statement_files SET size=?, mtime=? WHERE path=?", touched)
+                conn.commit()
+        return pending
+
+    def _ingest(self, writer: BatchWriter, pending: dict, results):
+        for i, (path, txns, secs, error) in enumerate(results, 1):
+            name = os.path.basename(path)
+            # Parsed in a worker process, so the duration comes back with the result
+            metrics.REGISTRY.observe("tc_stage_seconds", secs, stage="parse_statement")
+            if error:
+                # Not recorded in the manifest, so the next cycle retries it
+                print(f"[STATEMENT] ({i}/{len(pending)}) {name}: parse error after {secs:.2f}s: {error}")
+                continue
+            before, seen = writer.inserted, {}
             for t in txns:
                 tx = {
                     "date": (t["date"] or datetime.now().strftime("%Y-%m-%d"))[:10],
@@ -97,7 +176,19 @@ class StatementFetcher:
                     "from_email": None,
                     "raw_snippet": (t.get("raw") or "")[:1000]
                 }
-                from database import upsert_transaction
-                if upsert_transaction(self.conn, tx):
-                    inserted += 1
-        return inserted
+                # The same line twice in one file is two purchases, not a re-import
+                key = (tx["date"], tx["raw_snippet"])
+                tx["occurrence"] = seen[key] = seen.get(key, 0) + 1
+                writer.add(tx)
+            # Commit the file's rows before marking it processed
+            writer.flush()
+            size, mtime, digest = pending[path]
+            with writing(self.db) as conn:
+                conn.execute('''
+                    INSERT INTO statement_files (path, size, mtime, sha256, rows, processed_at) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET size=excluded.size, mtime=excluded.mtime, sha256=excluded.sha256,
+                        rows=excluded.rows, processed_at=excluded.processed_at
+                ''', (path, size, mtime, digest, len(txns), datetime.utcnow().isoformat()))
+                conn.commit()
+            print(f"[STATEMENT] ({i}/{len(pending)}) {name}: {len(txns)} rows, "
+                  f"{writer.inserted - before} new, parsed in {secs:.2f}s")
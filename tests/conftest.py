@@ -0,0 +1,25 @@
+import copy, os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+BASE_CONFIG = {
+    "app_name": "Test Finance",
+    "refresh_interval": 300,
+    "database": {"batch_size": 50},
+    "gmail": {"enabled": False, "user_id": "me", "max_results_per_query": 2,
+              "search_queries": {"sbi_txn": "subject:\"Transaction Alert from SBI\""}},
+    "sms": {"enabled": False, "android_api_url": "http://127.0.0.1:1/sms"},
+    "statements": {"enabled": False, "workers": 1},
+    "categories_rules": {"Food": ["swiggy", "zomato"], "Shopping": ["amazon"], "Income": ["salary"]},
+}
+
+@pytest.fixture
+def cfg(tmp_path):
+    """A config with every source disabled and all files under tmp_path."""
+    c = copy.deepcopy(BASE_CONFIG)
+    c["database"]["path"] = str(tmp_path / "tx.db")
+    c["gmail"]["token_file"] = str(tmp_path / "token.json")
+    c["statements"]["folder"] = str(tmp_path / "statements")
+    return c
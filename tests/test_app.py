@@ -0,0 +1,243 @@
+import json, os, sqlite3, threading, time
+
+import pytest
+
+pytest.importorskip("flask")
+
+import app as app_module
+import metrics
+
+@pytest.fixture
+def make_app(tmp_path, cfg):
+    def make(**overrides):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps(dict(cfg, **overrides)), encoding="utf-8")
+        flask_app = app_module.create_app(str(path))
+        flask_app.testing = True
+        return flask_app
+    yield make
+    metrics.REGISTRY.enabled = False
+    app_module.PROFILES.clear()
+
+def test_request_that_raises_is_timed_as_500(make_app):
+    flask_app = make_app(metrics={"enabled": True})
+
+    @flask_app.route("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flask_app.test_client().get("/boom")
+    assert 'route="/boom"' in metrics.REGISTRY.render()
+    assert 'status="500"' in metrics.REGISTRY.render()
+
+def ledger(p):
+    return p.db.reader().execute("SELECT merchant, source FROM transactions ORDER BY merchant").fetchall()
+
+def test_fetch_cycle_with_every_source_disabled(make_app):
+    make_app()
+    p = app_module.PROFILES[app_module.DEFAULT_PROFILE]
+    assert app_module.run_fetch_cycle(p) is True
+    assert ledger(p) == []
+
+def test_fetch_cycle_imports_and_runs_enabled_fetchers(make_app, cfg, monkeypatch):
+    # The statements factory is the real one; Gmail is swapped for a stub source
+    os.makedirs(cfg["statements"]["folder"])
+    with open(os.path.join(cfg["statements"]["folder"], "aug.csv"), "w", encoding="utf-8") as f:
+        f.write("Date,Description,Amount\n2025-08-10,SWIGGY,450.00\n")
+    calls = []
+
+    class StubGmail:
+        def __init__(self, p):
+            calls.append(p.name)
+
+        def run(self):
+            return 0
+
+    fetchers = tuple((key, label, StubGmail if key == "gmail" else make)
+                     for key, label, make in app_module.FETCHERS)
+    monkeypatch.setattr(app_module, "FETCHERS", fetchers)
+    make_app(gmail=dict(cfg["gmail"], enabled=True), statements=dict(cfg["statements"], enabled=True))
+    p = app_module.PROFILES[app_module.DEFAULT_PROFILE]
+    assert app_module.run_fetch_cycle(p) is True
+    assert calls == [p.name]
+    assert [m for m, _ in ledger(p)] == ["SWIGGY"]
+
+def seed(p):
+    conn = sqlite3.connect(p.cfg["database"]["path"])
+    conn.executemany("INSERT INTO transactions (date, merchant, amount, source, raw_snippet) VALUES (?, ?, ?, 'sms', ?)",
+                     [("2025-08-01", "SWIGGY", 450.0, "a"), ("2025-08-02", "AMAZON", 999.0, "b")])
+    conn.commit()
+    conn.close()
+
+def categories(p):
+    return dict(p.db.reader().execute("SELECT merchant, user_category FROM transactions"))
+
+@pytest.mark.parametrize("body", [
+    {"category": "Food", "filter": {"merchnat": "SWIGGY"}},
+    {"category": "Food", "filter": {"merchant": "SWIGGY", "q": "x"}},
+    {"category": "Food", "filter": {"min_amount": 0, "merchant": ""}},
+    {"category": "Food", "filter": {}},
+])
+def test_bulk_edit_refuses_filters_that_match_everything(make_app, body):
+    flask_app = make_app()
+    p = app_module.PROFILES[app_module.DEFAULT_PROFILE]
+    seed(p)
+    rv = flask_app.test_client().post("/api/bulk_update_category", json=body)
+    assert rv.status_code == 400
+    assert categories(p) == {"SWIGGY": None, "AMAZON": None}
+
+def test_bulk_edit_by_filter_touches_only_matches(make_app):
+    flask_app = make_app()
+    p = app_module.PROFILES[app_module.DEFAULT_PROFILE]
+    seed(p)
+    rv = flask_app.test_client().post("/api/bulk_update_category",
+                                      json={"category": "Food", "filter": {"merchant": "swig"}})
+    assert rv.get_json() == {"ok": True, "updated": 1}
+    assert categories(p) == {"SWIGGY": "Food", "AMAZON": None}
+
+def test_profiles_keep_separate_ledgers(make_app, cfg):
+    flask_app = make_app(profiles={"home": {}, "work": {"app_name": "Work"}}, default_profile="home")
+    home, work = app_module.PROFILES["home"], app_module.PROFILES["work"]
+    assert home.cfg["database"]["path"] != work.cfg["database"]["path"]
+    assert home.cfg["database"]["path"].endswith("tx.home.db")
+    seed(work)
+    client = flask_app.test_client()
+
+    def merchants(**kw):
+        rv = client.get("/api/transactions", **kw)
+        assert rv.status_code == 200
+        return sorted(t["merchant"] for t in rv.get_json()["items"])
+
+    assert merchants() == []
+    assert merchants(query_string={"profile": "work"}) == ["AMAZON", "SWIGGY"]
+    assert merchants(headers={"X-Profile": "work"}) == ["AMAZON", "SWIGGY"]
+    # The query string wins over the header
+    assert merchants(query_string={"profile": "home"}, headers={"X-Profile": "work"}) == []
+    assert client.get("/api/transactions?profile=nope").status_code == 404
+
+    rv = client.post("/api/bulk_update_category?profile=home", json={"category": "Food", "ids": [1, 2]})
+    assert rv.get_json()["updated"] == 0
+    assert categories(work) == {"SWIGGY": None, "AMAZON": None}
+
+def test_profiled_cycle_is_not_held_up_by_a_timed_out_fetcher(make_app, cfg, monkeypatch):
+    release = threading.Event()
+
+    class HungGmail:
+        def __init__(self, p):
+            pass
+
+        def run(self):
+            release.wait(5)
+            return 0
+
+    monkeypatch.setattr(app_module, "FETCHERS", (("gmail", "Gmail", HungGmail),))
+    make_app(gmail=dict(cfg["gmail"], enabled=True, timeout=0.2),
+             metrics={"profile_cycles": True, "profile_path": os.path.join(os.path.dirname(cfg["database"]["path"]), "c.prof")})
+    p = app_module.PROFILES[app_module.DEFAULT_PROFILE]
+    t0 = time.perf_counter()
+    try:
+        assert app_module.run_fetch_cycle(p) is True
+        assert time.perf_counter() - t0 < 2
+    finally:
+        release.set()
+
+def test_summary_date_filters_leave_out_undated_rows(make_app):
+    flask_app = make_app()
+    p = app_module.PROFILES[app_module.DEFAULT_PROFILE]
+    conn = sqlite3.connect(p.cfg["database"]["path"])
+    conn.executemany("INSERT INTO transactions (date, merchant, amount, source, raw_snippet) VALUES (?, ?, ?, 'sms', ?)",
+                     [(None, "UNDATED", 100.0, "u"), ("2025-08-02", "DATED", 50.0, "d")])
+    conn.commit()
+    conn.close()
+    client = flask_app.test_client()
+
+    def summary_total():
+        return sum(c["amount"] for c in client.get("/api/summary?end=2025-08-31").get_json()["categories"])
+
+    assert summary_total() == 50.0
+    items = client.get("/api/transactions?end=2025-08-31").get_json()["items"]
+    assert sum(t["amount"] for t in items) == 50.0
+    assert client.get("/api/summary").get_json()["total"] == 2
+
+    # An edit to the undated row may keep the cached end= summary, which doesn't include it
+    undated = p.db.reader().execute("SELECT id FROM transactions WHERE date IS NULL").fetchone()[0]
+    rv = client.post("/api/bulk_update_category", json={"category": "Food", "ids": [undated], "invalidate": "affected"})
+    assert rv.get_json()["updated"] == 1
+    assert client.get("/api/summary?end=2025-08-31").get_json()["categories"] == [
+        {"category": "Uncategorized", "amount": 50.0}]
+
+def test_transaction_pages_cross_into_undated_rows(make_app):
+    flask_app = make_app()
+    p = app_module.PROFILES[app_module.DEFAULT_PROFILE]
+    conn = sqlite3.connect(p.cfg["database"]["path"])
+    conn.executemany("INSERT INTO transactions (date, merchant, amount, source, raw_snippet) VALUES (?, ?, 10, 'sms', ?)",
+                     [(f"2025-08-0{d}", f"DATED{d}", f"d{d}") for d in (1, 2, 3)]
+                     + [(None, f"UNDATED{n}", f"u{n}") for n in (1, 2, 3)])
+    conn.commit()
+    conn.close()
+    client = flask_app.test_client()
+    pages, cursor = [], None
+    while True:
+        rv = client.get("/api/transactions", query_string=dict(limit=2, **({"cursor": cursor} if cursor else {})))
+        body = rv.get_json()
+        pages.append([t["merchant"] for t in body["items"]])
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    # Newest first, undated rows last and newest id first; the second page straddles the boundary
+    assert pages == [["DATED3", "DATED2"], ["DATED1", "UNDATED3"], ["UNDATED2", "UNDATED1"]]
+
+@pytest.mark.parametrize("query", ["cursor=not-base64!", "cursor=WyJ4Il0=", "min_amount=ten", "limit=many"])
+def test_bad_transaction_cursor_or_filter_is_400(make_app, query):
+    rv = make_app().test_client().get(f"/api/transactions?{query}")
+    assert rv.status_code == 400
+    assert rv.get_json()["ok"] is False
+
+def test_etag_304_until_a_category_edit(make_app):
+    flask_app = make_app()
+    p = app_module.PROFILES[app_module.DEFAULT_PROFILE]
+    seed(p)
+    client = flask_app.test_client()
+    first = client.get("/api/transactions")
+    etag = first.headers["ETag"]
+    assert client.get("/api/transactions", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/transactions", headers={"If-None-Match": f'"other", {etag.removeprefix("W/")}'}).status_code == 304
+
+    before = app_module.data_version(p.db)
+    swiggy = p.db.reader().execute("SELECT id FROM transactions WHERE merchant='SWIGGY'").fetchone()[0]
+    assert client.post("/api/update_category", json={"id": swiggy, "category": "Food"}).get_json() == {"ok": True}
+    assert app_module.data_version(p.db) == before + 1
+    rv = client.get("/api/transactions", headers={"If-None-Match": etag})
+    assert rv.status_code == 200 and rv.headers["ETag"] != etag
+    assert {t["merchant"]: t["category"] for t in rv.get_json()["items"]}["SWIGGY"] == "Food"
+
+@pytest.mark.parametrize("accept, gzipped", [("gzip, deflate", True), ("gzip;q=0, identity", False),
+                                             ("*", True), ("", False)])
+def test_gzip_follows_accept_encoding(make_app, accept, gzipped):
+    import gzip
+    flask_app = make_app(http={"gzip_min_bytes": 1})
+    seed(app_module.PROFILES[app_module.DEFAULT_PROFILE])
+    rv = flask_app.test_client().get("/api/transactions", headers={"Accept-Encoding": accept})
+    assert (rv.headers.get("Content-Encoding") == "gzip") is gzipped
+    body = gzip.decompress(rv.data) if gzipped else rv.data
+    assert len(json.loads(body)["items"]) == 2
+
+def test_search_pages_by_offset(make_app):
+    flask_app = make_app()
+    p = app_module.PROFILES[app_module.DEFAULT_PROFILE]
+    conn = sqlite3.connect(p.cfg["database"]["path"])
+    conn.executemany("INSERT INTO transactions (date, merchant, amount, source, raw_snippet) VALUES ('2025-08-10', ?, 1, 'sms', ?)",
+                     [(f"SWIGGY {n}", f"swiggy order {n}") for n in range(5)] + [("AMAZON", "amazon order")])
+    conn.commit()
+    conn.close()
+    client = flask_app.test_client()
+    seen, offset = [], 0
+    while offset is not None:
+        body = client.get("/api/search", query_string={"q": "swig", "limit": 2, "offset": offset}).get_json()
+        assert len(body["items"]) <= 2
+        seen += [t["merchant"] for t in body["items"]]
+        offset = body["next_offset"]
+    assert sorted(seen) == [f"SWIGGY {n}" for n in range(5)]
+    assert client.get("/api/search?q=%22%29(").status_code == 400
+    assert client.get("/api/search?q=swig&offset=x").status_code == 400
@@ -0,0 +1,101 @@
+import sqlite3
+import pytest
+from database import BatchWriter, ConnectionManager, bulk_update_category, FINGERPRINT_SCHEME_KEY, check_rollups, init_db, tx_fingerprint
+
+SMS = "Rs.450.00 spent on your SBI Credit Card ending 1234 at SWIGGY on 10/08/25."
+
+def test_fingerprint_ignores_parsed_fields():
+    a = {"source": "sms", "date": "2025-08-10", "raw_snippet": SMS, "amount": 450.0, "merchant": "SWIGGY"}
+    # What a newer parser might make of the same message
+    b = dict(a, amount=45.0, merchant="SWIGGY on 10/08/25")
+    assert tx_fingerprint(a) == tx_fingerprint(b)
+    assert tx_fingerprint(a) != tx_fingerprint(dict(a, date="2025-08-11"))
+
+def test_old_fingerprints_are_recomputed_and_duplicates_dropped(tmp_path):
+    path = str(tmp_path / "old.db")
+    init_db(path).close()
+    conn = sqlite3.connect(path)
+    # Two copies of one SMS stored under an older, parser-dependent scheme
+    conn.executemany("INSERT INTO transactions (date, merchant, amount, source, raw_snippet, user_category, fingerprint) "
+                     "VALUES ('2025-08-10', ?, ?, 'sms', ?, ?, ?)",
+                     [("SWIGGY", 450.0, SMS, None, "old-a"), ("SWIGGY on 10/08/25", 45.0, SMS, "Food", "old-b")])
+    conn.execute("DELETE FROM app_state WHERE key=?", (FINGERPRINT_SCHEME_KEY,))
+    conn.commit()
+    conn.close()
+
+    conn = init_db(path)
+    rows = conn.execute("SELECT user_category, fingerprint FROM transactions").fetchall()
+    # The copy the user categorized is the one kept
+    assert rows == [("Food", tx_fingerprint({"source": "sms", "date": "2025-08-10", "raw_snippet": SMS}))]
+
+    db = ConnectionManager(path)
+    with BatchWriter(db) as w:
+        w.add({"date": "2025-08-10", "merchant": "Swiggy", "amount": 450.0, "source": "sms", "raw_snippet": SMS})
+    assert (w.inserted, w.skipped) == (0, 1)
+
+def test_identical_copies_survive_fingerprint_migration(tmp_path):
+    path = str(tmp_path / "old.db")
+    init_db(path).close()
+    conn = sqlite3.connect(path)
+    # Two real purchases with the same alert text, stored before fingerprints existed
+    conn.executemany("INSERT INTO transactions (date, merchant, amount, source, raw_snippet) "
+                     "VALUES ('2025-08-10', 'SWIGGY', 450.0, 'sms', ?)", [(SMS,), (SMS,)])
+    conn.execute("DELETE FROM app_state WHERE key=?", (FINGERPRINT_SCHEME_KEY,))
+    conn.commit()
+    conn.close()
+
+    conn = init_db(path)
+    assert conn.execute("SELECT COUNT(DISTINCT fingerprint) FROM transactions").fetchone() == (2,)
+    db = ConnectionManager(path)
+    with BatchWriter(db) as w:
+        for n in (1, 2):
+            w.add({"date": "2025-08-10", "amount": 450.0, "source": "sms", "raw_snippet": SMS, "occurrence": n})
+    assert (w.inserted, w.skipped) == (0, 2)
+
+def test_rollup_triggers_prune_only_their_own_key(tmp_path):
+    conn = init_db(str(tmp_path / "r.db"))
+    conn.executemany("INSERT INTO transactions (date, merchant, amount, source, raw_snippet, fingerprint) "
+                     "VALUES (?, 'SWIGGY', 100, 'sms', ?, ?)", [(f"2025-08-{d:02d}", f"m{d}", f"f{d}") for d in (1, 2)])
+    conn.commit()
+    plan = conn.execute("EXPLAIN QUERY PLAN DELETE FROM daily_rollup WHERE date = '2025-08-01' AND source = 'sms' "
+                        "AND category = 'Food' AND n <= 0").fetchall()
+    assert "SCAN" not in " ".join(r[-1] for r in plan)
+    conn.execute("UPDATE transactions SET category='Food' WHERE date='2025-08-01'")
+    conn.execute("DELETE FROM transactions WHERE date='2025-08-02'")
+    conn.commit()
+    assert conn.execute("SELECT date, category, n FROM daily_rollup").fetchall() == [("2025-08-01", "Food", 1)]
+    assert check_rollups(conn) == []
+
+def test_old_rollup_triggers_are_replaced(tmp_path):
+    path = str(tmp_path / "t.db")
+    conn = init_db(path)
+    conn.execute("DROP TRIGGER trg_rollup_delete")
+    conn.execute("CREATE TRIGGER trg_rollup_delete AFTER DELETE ON transactions BEGIN "
+                 "DELETE FROM daily_rollup WHERE n <= 0; END")
+    conn.commit()
+    conn.close()
+    sql = init_db(path).execute("SELECT sql FROM sqlite_master WHERE name='trg_rollup_delete'").fetchone()[0]
+    assert "OLD.date" in sql
+
+def test_bulk_update_without_ids_or_clauses_is_refused(tmp_path):
+    db = ConnectionManager(str(tmp_path / "b.db"))
+    with pytest.raises(ValueError):
+        bulk_update_category(db, "Food")
+    assert bulk_update_category(db, "Food", ids=[])["updated"] == 0
+
+def test_fts_follows_updates_and_deletes(tmp_path):
+    conn = init_db(str(tmp_path / "f.db"))
+    conn.executemany("INSERT INTO transactions (date, merchant, amount, source, raw_snippet) VALUES ('2025-08-10', ?, 1, 'sms', ?)",
+                     [("SWIGGY", "order from swiggy"), ("AMAZON", "amazon pay")])
+    conn.commit()
+    match = lambda q: [r[0] for r in conn.execute(
+        "SELECT t.merchant FROM transactions_fts f JOIN transactions t ON t.id = f.rowid WHERE transactions_fts MATCH ?", (q,))]
+    assert match('"swig"*') == ["SWIGGY"]
+
+    conn.execute("UPDATE transactions SET merchant='ZOMATO', raw_snippet='order from zomato' WHERE merchant='SWIGGY'")
+    conn.execute("DELETE FROM transactions WHERE merchant='AMAZON'")
+    conn.commit()
+    assert match('"swig"*') == [] and match('"amazon"*') == []
+    assert match('"zomato"*') == ["ZOMATO"]
+    # Raises if the index no longer matches its content table
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('integrity-check')")
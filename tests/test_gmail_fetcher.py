@@ -0,0 +1,123 @@
+import base64
+import pytest
+
+pytest.importorskip("pytz")
+from database import ConnectionManager, get_state, reading
+from gmail_fetcher import RESUME_SUFFIX, GmailFetcher, decode_payload
+
+QUERY = "subject:\"Transaction Alert from SBI\""
+
+def alert(n: int) -> dict:
+    text = f"Rs.{100 + n}.00 spent on your SBI Credit Card ending 1234 at SHOP{n} on 10/08/25."
+    return {"id": f"m{n}", "internalDate": str(1754800000000 + n * 60000), "snippet": text,
+            "payload": {"mimeType": "text/plain", "headers": [
+                {"name": "From", "value": "onlinesbicard@sbicard.com"},
+                {"name": "Subject", "value": "Transaction Alert from SBI Card"},
+                {"name": "Date", "value": "Sun, 10 Aug 2025 10:00:00 +0530"}],
+                "body": {"data": base64.urlsafe_b64encode(text.encode()).decode()}}}
+
+class Call:
+    def __init__(self, fn):
+        self.execute = fn
+
+class StubGmail:
+    """users().messages().list/get and batches over an in-memory mailbox, newest first."""
+
+    def __init__(self, messages):
+        self.mailbox = list(messages)
+        self.fail_once = set()
+        self.queries = []
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, userId, q, maxResults, pageToken=None):
+        self.queries.append((q, pageToken))
+        after = int(q.rsplit("after:", 1)[1]) if "after:" in q else 0
+        found = sorted((m for m in self.mailbox if int(m["internalDate"]) // 1000 > after),
+                       key=lambda m: -int(m["internalDate"]))
+        start = int(pageToken or 0)
+        page = {"messages": [{"id": m["id"]} for m in found[start:start + maxResults]]}
+        if start + maxResults < len(found):
+            page["nextPageToken"] = str(start + maxResults)
+        return Call(lambda: page)
+
+    def get(self, userId, id, format, metadataHeaders=None):
+        return id
+
+    def new_batch_http_request(self, callback):
+        stub = self
+
+        class Batch(list):
+            def add(self, request, request_id):
+                self.append(request_id)
+
+            def execute(self):
+                for mid in self:
+                    if mid in stub.fail_once:
+                        stub.fail_once.discard(mid)
+                        callback(mid, None, RuntimeError("backend error"))
+                    else:
+                        callback(mid, next(m for m in stub.mailbox if m["id"] == mid), None)
+        return Batch()
+
+@pytest.fixture
+def gmail_cfg(cfg):
+    cfg["gmail"].update(enabled=True, max_results_per_query=2, max_pages_per_query=1)
+    cfg["gmail"]["search_queries"] = {"sbi_txn": QUERY}
+    return cfg
+
+def stored_ids(db):
+    return {r[0] for r in reading(db).execute("SELECT message_id FROM transactions")}
+
+def watermark(db):
+    keys = [k for (k,) in reading(db).execute("SELECT key FROM app_state WHERE key LIKE 'gmail_watermark:%'")
+            if not k.endswith(RESUME_SUFFIX)]
+    return int(get_state(db, keys[0], 0)) if keys else 0
+
+def test_capped_listing_resumes_before_watermark_moves(gmail_cfg):
+    db = ConnectionManager.from_config(gmail_cfg)
+    service = StubGmail(alert(n) for n in range(5))
+    fetcher = GmailFetcher(cfg=gmail_cfg, db=db, service=service)
+
+    assert fetcher.run() == 2
+    assert watermark(db) == 0          # older pages not listed yet
+    assert fetcher.run() == 2
+    assert watermark(db) == 0
+    assert fetcher.run() == 1
+    assert stored_ids(db) == {f"m{n}" for n in range(5)}
+    assert watermark(db) == int(alert(4)["internalDate"])
+    # Resumed pages reuse the first listing's query, whatever arrived since
+    assert [t for _, t in service.queries] == [None, "2", "4"]
+
+    service.mailbox.append(alert(9))
+    # The day of overlap re-lists all six (three capped pages); only the new one is fetched
+    assert [fetcher.run() for _ in range(3)] == [1, 0, 0]
+    assert all("after:" in q for q, _ in service.queries[-3:])
+    assert watermark(db) == int(alert(9)["internalDate"])
+
+def test_failed_get_keeps_watermark_for_retry(gmail_cfg):
+    gmail_cfg["gmail"]["max_pages_per_query"] = None
+    db = ConnectionManager.from_config(gmail_cfg)
+    service = StubGmail(alert(n) for n in range(3))
+    service.fail_once.add("m1")
+    fetcher = GmailFetcher(cfg=gmail_cfg, db=db, service=service)
+
+    assert fetcher.run() == 2
+    assert watermark(db) == 0
+    assert fetcher.run() == 1
+    assert stored_ids(db) == {"m0", "m1", "m2"}
+    # Moves on a clean run; stored ids aren't fetched again, so it may stay a little behind
+    assert watermark(db) >= int(alert(1)["internalDate"])
+
+def test_amount_after_large_html_head_survives_the_cap():
+    css = "<style>" + ".c{font-family:Arial;padding:4px}\n" * 2000 + "</style>"
+    html = f"<html><head>{css}</head><body><p>Order Total: &#8377;1,299.00</p>{'<p>Thanks</p>' * 5000}</body></html>"
+    payload = {"mimeType": "multipart/alternative", "parts": [
+        {"mimeType": "text/html", "body": {"data": base64.urlsafe_b64encode(html.encode()).decode()}}]}
+    text = decode_payload(payload, max_bytes=4096)
+    assert text.startswith("Order Total: ₹1,299.00")
+    assert len(text.encode("utf-8")) <= 4096
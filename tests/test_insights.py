@@ -0,0 +1,52 @@
+import datetime
+from database import ConnectionManager, reading, writing
+import insights
+
+def add(db, rows):
+    # rows of (date, merchant, amount, category)
+    with writing(db) as conn:
+        conn.executemany("INSERT INTO transactions (date, merchant, amount, category, source, raw_snippet) "
+                         "VALUES (?, ?, ?, ?, 'sms', ?)",
+                         [r + (f"{r[0]} {r[1]} {r[2]}",) for r in rows])
+        conn.commit()
+
+def months_ago(n):
+    return (datetime.date.today() - datetime.timedelta(days=round(30.4 * n))).isoformat()
+
+def test_days_matches_iso_ordinals():
+    dates = ["2025-08-10", "2025-08-10T09:30:00", None, "", "garbage", "2024-02-29"]
+    expected = [datetime.date(2025, 8, 10).toordinal()] * 2 + [-1, -1, -1, datetime.date(2024, 2, 29).toordinal()]
+    assert insights._days(dates).tolist() == expected
+
+def test_incremental_run_finds_history_of_other_spellings(cfg):
+    db = ConnectionManager.from_config(cfg)
+    add(db, [(months_ago(n), "NETFLIX.COM 8821", 649.0, "Bills") for n in (4, 3, 2)])
+    insights.run(db, cfg)
+    add(db, [(months_ago(1), "Netflix", 649.0, "Bills")])
+    assert insights.run(db, cfg) == (1, 0)
+    assert reading(db).execute("SELECT occurrences FROM recurring_payments").fetchone() == (4,)
+
+def test_merchant_keys_backfilled_for_older_ledgers(cfg):
+    db = ConnectionManager.from_config(cfg)
+    add(db, [(months_ago(n), "NETFLIX.COM 8821", 649.0, "Bills") for n in (4, 3, 2)])
+    insights.run(db, cfg)
+    with writing(db) as conn:
+        conn.execute("DELETE FROM merchant_keys")
+        conn.commit()
+    add(db, [(months_ago(1), "Netflix", 649.0, "Bills")])
+    insights.run(db, cfg)
+    assert reading(db).execute("SELECT occurrences FROM recurring_payments").fetchone() == (4,)
+    assert reading(db).execute("SELECT COUNT(*) FROM merchant_keys").fetchone() == (2,)
+
+def test_only_debits_are_scored(cfg):
+    db = ConnectionManager.from_config(cfg)
+    today = datetime.date.today().isoformat()
+    add(db, [(today, f"SWIGGY {i}", 300.0 + i, "Food") for i in range(10)]
+        + [(today, f"EMPLOYER {i}", 500.0 + i, "Income") for i in range(10)]
+        + [(today, f"REFUND {i}", -20.0 - i, "Food") for i in range(10)])
+    add(db, [(today, "SALARY BONUS", 90000.0, "Income"), (today, "REFUND BIG", -9000.0, "Food"),
+             (today, "SWIGGY PARTY", 9000.0, "Food")])
+    insights.run(db, cfg)
+    flagged = reading(db).execute(
+        "SELECT t.merchant FROM spend_anomalies a JOIN transactions t ON t.id = a.tx_id").fetchall()
+    assert flagged == [("SWIGGY PARTY",)]
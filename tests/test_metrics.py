@@ -0,0 +1,25 @@
+import threading, time
+
+import metrics
+
+def test_busy_profiler_runs_sections_unprofiled(tmp_path):
+    # Only one cProfile may be active (3.12+ raises ValueError); a second section must
+    # neither fail nor wait for the first
+    profiler = metrics.CycleProfiler(str(tmp_path / "cycle.prof"))
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    worker = threading.Thread(target=profiler.wrap(slow))
+    worker.start()
+    started.wait(5)
+    t0 = time.perf_counter()
+    assert profiler.wrap(lambda: 42)() == 42
+    assert time.perf_counter() - t0 < 1
+    release.set()
+    worker.join()
+    assert (len(profiler._profiles), profiler.skipped) == (1, 1)
+    profiler.dump()
+    assert (tmp_path / "cycle.prof").exists()
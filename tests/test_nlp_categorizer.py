@@ -0,0 +1,50 @@
+import random
+import pytest
+from database import DATA_VERSION_KEY, LABEL_VERSION_KEY, ConnectionManager, get_state, writing
+import nlp_categorizer
+
+def test_apply_rules_counts_only_rows_it_changed(cfg, monkeypatch):
+    db = ConnectionManager.from_config(cfg)
+    with writing(db) as conn:
+        conn.executemany("INSERT INTO transactions (merchant, source, raw_snippet, fingerprint) VALUES (?, 'sms', ?, ?)",
+                         [("SWIGGY", "a", "f1"), ("AMAZON", "b", "f2"), ("UNKNOWN", "c", "f3")])
+        conn.commit()
+    assert nlp_categorizer.apply_rules(db, cfg) == 2
+    versions = get_state(db, LABEL_VERSION_KEY), get_state(db, DATA_VERSION_KEY)
+
+    with writing(db) as conn:
+        conn.execute("UPDATE transactions SET category=NULL WHERE merchant='SWIGGY'")
+        conn.commit()
+    # Another writer categorizes the row after apply_rules read it but before its UPDATE
+    real_writing = nlp_categorizer.writing
+    def racing_writing(d):
+        with real_writing(d) as conn:
+            conn.execute("UPDATE transactions SET category='Other' WHERE category IS NULL")
+            conn.commit()
+        return real_writing(d)
+    monkeypatch.setattr(nlp_categorizer, "writing", racing_writing)
+    assert nlp_categorizer.apply_rules(db, cfg) == 0
+    assert (get_state(db, LABEL_VERSION_KEY), get_state(db, DATA_VERSION_KEY)) == versions
+
+def test_rule_matcher_agrees_with_the_keyword_scan():
+    from benchmarks.bench_rules import naive_rule_category
+    rng = random.Random(7)
+    # A tiny alphabet makes overlapping, prefix and repeated keywords common
+    word = lambda: "".join(rng.choice("abc ") for _ in range(rng.randint(1, 4)))
+    for _ in range(300):
+        rules = {f"C{i}": [word() for _ in range(rng.randint(0, 4))] for i in range(rng.randint(1, 5))}
+        if rng.random() < 0.1:
+            rules[f"C{len(rules)}"] = [""]
+        matcher = nlp_categorizer.RuleMatcher(rules)
+        for _ in range(20):
+            merchant = "".join(rng.choice("abcABC .") for _ in range(rng.randint(0, 12)))
+            assert matcher.match(merchant) == naive_rule_category(merchant, rules), (rules, merchant)
+
+@pytest.mark.parametrize("merchant, expected", [
+    ("AMAZON PAY", "Wallet"), ("AMAZON", "Shopping"), ("AMAZONIA", "Shopping"),
+    ("SWIGGY INSTAMART", "Groceries"), ("SWIGGY", "Food"), ("PAYTM MALL", "Wallet"), ("", ""),
+])
+def test_rule_matcher_overlapping_keywords(merchant, expected):
+    rules = {"Groceries": ["instamart"], "Wallet": ["amazon pay", "paytm"],
+             "Shopping": ["amazon", "mall"], "Food": ["swiggy"]}
+    assert nlp_categorizer.RuleMatcher(rules).match(merchant) == expected
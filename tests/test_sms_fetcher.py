@@ -0,0 +1,71 @@
+import json, threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from database import ConnectionManager, reading
+from sms_fetcher import SMSFetcher, request_since
+
+def alert(merchant: str, amount: int, date: str) -> dict:
+    return {"address": "VM-HDFCBK", "date": date,
+            "body": f"Spent Rs.{amount}.00 On HDFC Bank Card 1234 At {merchant} On {date[:10]}:10:00:00."}
+
+class Bridge(HTTPServer):
+    """An SMS bridge on localhost: GET /sms?since= returns messages dated after since."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.inbox, self.seen_since = [], []
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        since = parse_qs(urlparse(self.path).query).get("since", [""])[0]
+        self.server.seen_since.append(since)
+        body = json.dumps([m for m in self.server.inbox if m["date"] > since]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def bridge():
+    server = Bridge()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_request_since_steps_back_a_day():
+    assert request_since("2025-08-10T18:30:00") == "2025-08-09"
+    assert request_since("2025-08-10") == "2025-08-09"
+    assert request_since("1754800000") == "1754800000"
+
+def test_messages_later_on_the_same_day_are_fetched(cfg, bridge):
+    pytest.importorskip("requests")
+    cfg["sms"].update(enabled=True, android_api_url=f"http://127.0.0.1:{bridge.server_port}/sms")
+    db = ConnectionManager.from_config(cfg)
+    bridge.inbox += [alert("SWIGGY", 450, "2025-08-10T09:00:00"), alert("ZOMATO", 300, "2025-08-09T20:00:00")]
+    assert SMSFetcher(cfg=cfg, db=db).run() == 2
+
+    bridge.inbox.append(alert("UBER", 120, "2025-08-10"))   # same day, date-only bridge
+    bridge.inbox.append(alert("AMAZON", 999, "2025-08-10T18:00:00"))
+    assert SMSFetcher(cfg=cfg, db=db).run() == 2
+    assert bridge.seen_since == ["", "2025-08-09"]
+    merchants = {m for (m,) in reading(db).execute("SELECT merchant FROM transactions")}
+    assert merchants == {"SWIGGY", "ZOMATO", "UBER", "AMAZON"}
+    # Nothing new: the overlap is re-sent and deduplicated
+    assert SMSFetcher(cfg=cfg, db=db).run() == 0
+
+def test_identical_alerts_on_one_day_stay_separate(cfg, bridge):
+    pytest.importorskip("requests")
+    cfg["sms"].update(enabled=True, android_api_url=f"http://127.0.0.1:{bridge.server_port}/sms")
+    db = ConnectionManager.from_config(cfg)
+    bridge.inbox += [alert("CHAI POINT", 50, "2025-08-10T09:00:00"), alert("CHAI POINT", 50, "2025-08-10T16:00:00")]
+    assert SMSFetcher(cfg=cfg, db=db).run() == 2
+    assert SMSFetcher(cfg=cfg, db=db).run() == 0
+    bridge.inbox.append(alert("CHAI POINT", 50, "2025-08-10T19:00:00"))
+    assert SMSFetcher(cfg=cfg, db=db).run() == 1
+    assert reading(db).execute("SELECT COUNT(*) FROM transactions").fetchone() == (3,)
@@ -0,0 +1,51 @@
+import os
+import pytest
+from database import ConnectionManager, reading
+from statement_fetcher import StatementFetcher, parse_statement
+
+@pytest.fixture
+def folder(cfg):
+    cfg["statements"]["enabled"] = True
+    os.makedirs(cfg["statements"]["folder"])
+    return cfg["statements"]["folder"]
+
+def write(path, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def manifest(db):
+    return {os.path.basename(p): rows for p, rows in reading(db).execute("SELECT path, rows FROM statement_files")}
+
+def test_corrupt_csv_is_reported_and_retried(cfg, folder):
+    write(os.path.join(folder, "good.csv"), b"Date,Description,Amount\n2025-08-10,SWIGGY,450.00\n2025-08-11,AMAZON,n/a\n")
+    bad = os.path.join(folder, "bad.csv")
+    write(bad, b"Date,Description,Amount\n2025-08-12,\xff\xfe\xfd,99\n")
+    _, rows, _, error = parse_statement(bad)
+    assert rows == [] and "codec" in error
+
+    db = ConnectionManager.from_config(cfg)
+    assert StatementFetcher(cfg=cfg, db=db).run() == 1
+    assert manifest(db) == {"good.csv": 1}
+
+    write(bad, b"Date,Description,Amount\n2025-08-12,ZOMATO,99\n")
+    assert StatementFetcher(cfg=cfg, db=db).run() == 1
+    assert manifest(db) == {"good.csv": 1, "bad.csv": 1}
+
+def test_identical_lines_in_one_file_stay_separate(cfg, folder):
+    write(os.path.join(folder, "aug.csv"),
+          b"Date,Description,Amount\n2025-08-10,CHAI POINT,50.00\n2025-08-10,CHAI POINT,50.00\n2025-08-11,SWIGGY,450.00\n")
+    # The same lines in an overlapping statement are re-imports
+    write(os.path.join(folder, "overlap.csv"), b"Date,Description,Amount\n2025-08-10,CHAI POINT,50.00\n")
+    db = ConnectionManager.from_config(cfg)
+    assert StatementFetcher(cfg=cfg, db=db).run() == 3
+    merchants = [m for (m,) in reading(db).execute("SELECT merchant FROM transactions ORDER BY id")]
+    assert merchants == ["CHAI POINT", "CHAI POINT", "SWIGGY"]
+
+def test_files_parsed_in_worker_processes(cfg, folder):
+    cfg["statements"]["workers"] = 2
+    for day, merchant in ((10, "SWIGGY"), (11, "AMAZON")):
+        write(os.path.join(folder, f"{merchant.lower()}.csv"),
+              f"Date,Description,Amount\n2025-08-{day},{merchant},100.00\n".encode())
+    db = ConnectionManager.from_config(cfg)
+    assert StatementFetcher(cfg=cfg, db=db).run() == 2
+    assert manifest(db) == {"swiggy.csv": 1, "amazon.csv": 1}
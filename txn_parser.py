@@ -0,0 +1,171 @@
+"""Shared amount/merchant extraction for SMS alerts and e-mail receipts.
+
+Every pattern is compiled once at import. A message is matched against the
+template for its sender first (SBI, HDFC, ICICI, Amazon, Flipkart...), then
+against the generic patterns, and only the first ``window`` characters are
+scanned: bank alerts and receipts put the amount near the top.
+"""
+import re
+from typing import Optional, Tuple
+
+DEFAULT_WINDOW = 8192
+
+# Commas stay inside the captured number (Indian grouping: 1,00,000.00) and are
+# stripped from the match only, instead of copying the whole text without them
+_NUM = r"[0-9][0-9,]*(?:\.[0-9]{1,2})?"
+_CUR = r"(?:₹|INR|Rs\.?)"
+_NAME = r"[A-Za-z0-9 &\-\._]"
+
+AMOUNT_PATTERNS = [
+    re.compile(_CUR + r"[\s,]*(" + _NUM + r")", re.IGNORECASE),
+    re.compile(r"(" + _NUM + r")\s*" + _CUR, re.IGNORECASE),
+]
+MERCHANT_PATTERNS = [
+    re.compile(r"at\s+(" + _NAME + r"+)", re.IGNORECASE),
+    re.compile(r"merchant\s*:\s*(" + _NAME + r"+)", re.IGNORECASE),
+    re.compile(r"spent at\s+(" + _NAME + r"+)", re.IGNORECASE),
+]
+# Generic SMS shape: Rs 4500 debited at AMAZON
+SMS_PATTERN = re.compile(_CUR + r"\s*(" + _NUM + r").{0,40}?(?:at|in)\s+(" + _NAME + r"{2,64})", re.IGNORECASE)
+
+def to_amount(s: str) -> Optional[float]:
+    try:
+        return float(s.replace(",", ""))
+    except ValueError:
+        return None
+
+def clean_merchant(s: str) -> Optional[str]:
+    name = (s or "").strip(" .,-")
+    return name if 2 <= len(name) <= 64 else None
+
+class Template:
+    """Sender-specific patterns; each pattern has ``amount`` and optionally ``merchant`` groups."""
+
+    __slots__ = ("name", "senders", "patterns", "merchant")
+
+    def __init__(self, name: str, senders: str, patterns, merchant: str = None):
+        self.name = name
+        self.senders = re.compile(senders, re.IGNORECASE)
+        self.patterns = [re.compile(p, re.IGNORECASE | re.DOTALL) for p in patterns]
+        # Fixed merchant for receipts where the sender *is* the merchant
+        self.merchant = merchant
+
+    def parse(self, text: str) -> Optional[Tuple[float, Optional[str]]]:
+        for pat in self.patterns:
+            m = pat.search(text)
+            if not m:
+                continue
+            amount = to_amount(m.group("amount"))
+            if amount is None:
+                continue
+            merchant = self.merchant
+            if merchant is None and "merchant" in pat.groupindex:
+                merchant = clean_merchant(m.group("merchant"))
+            return amount, merchant
+        return None
+
+_AMT = r"(?P<amount>" + _NUM + r")"
+_MER = r"(?P<merchant>" + _NAME + r"{2,64}?)"
+# Merchant names end at the next " on <date>", " Ref", ". ", "(", ";" or end of line
+_END = r"(?=\s+on\s|\s+ref|\.\s|\.?$|\s*\(|;|,|\n)"
+
+TEMPLATES = [
+    Template("sbi", r"sbi|sbiinb|sbicrd|sbipsg", [
+        _CUR + r"\s*" + _AMT + r"\s+spent on your SBI Credit Card.{0,40}?\bat\s+" + _MER + _END,
+        _CUR + r"\s*" + _AMT + r"\s+(?:debited|withdrawn|spent).{0,60}?\b(?:at|to|towards|trf to)\s+" + _MER + _END,
+        r"debited by\s+" + _AMT + r".{0,60}?\btrf to\s+" + _MER + _END,
+    ]),
+    Template("hdfc", r"hdfc", [
+        r"spent\s+" + _CUR + r"\s*" + _AMT + r".{0,60}?\bat\s+" + _MER + _END,
+        _CUR + r"\s*" + _AMT + r"\s+debited.{0,80}?\bto VPA\s+(?P<merchant>[\w.\-]{2,64})@",
+        _CUR + r"\s*" + _AMT + r"\s+(?:debited|spent).{0,80}?\b(?:at|to|towards)\s+" + _MER + _END,
+    ]),
+    Template("icici", r"icici", [
+        _CUR + r"\s*" + _AMT + r"\s+spent.{0,60}?\bat\s+" + _MER + _END,
+        r"debited (?:for|with)\s+" + _CUR + r"\s*" + _AMT + r".{0,60}?;\s*" + _MER + r"\s+credited",
+        _CUR + r"\s*" + _AMT + r"\s+debited.{0,80}?\b(?:at|to|towards)\s+" + _MER + _END,
+    ]),
+    Template("axis", r"axis", [
+        _CUR + r"\s*" + _AMT + r"\s+(?:spent|debited).{0,60}?\b(?:at|to)\s+" + _MER + _END,
+    ]),
+    Template("kotak", r"kotak|kmbl", [
+        r"(?:sent|spent|debited)\s+" + _CUR + r"\s*" + _AMT + r".{0,60}?\b(?:to|at)\s+" + _MER + _END,
+    ]),
+    Template("amazon", r"amazon", [
+        r"(?:order|grand)\s*total\s*:?\s*" + _CUR + r"\s*" + _AMT,
+        r"(?:amount|total)\s+(?:paid|charged)\s*:?\s*" + _CUR + r"\s*" + _AMT,
+    ], merchant="Amazon.in"),
+    Template("flipkart", r"flipkart", [
+        r"(?:order|amount paid|grand)?\s*total\s*:?\s*" + _CUR + r"\s*" + _AMT,
+    ], merchant="Flipkart"),
+    Template("swiggy", r"swiggy", [
+        r"(?:order|grand|bill)?\s*total\s*:?\s*" + _CUR + r"\s*" + _AMT,
+    ], merchant="Swiggy"),
+    Template("zomato", r"zomato", [
+        r"(?:order|grand|bill)?\s*total\s*:?\s*" + _CUR + r"\s*" + _AMT,
+    ], merchant="Zomato"),
+]
+
+_TEMPLATE_CACHE = {}
+
+def select_template(sender: str) -> Optional[Template]:
+    """Template for an e-mail From header, SMS sender id (VM-HDFCBK) or fetcher source key."""
+    if not sender:
+        return None
+    key = sender.lower()
+    if key not in _TEMPLATE_CACHE:
+        if len(_TEMPLATE_CACHE) > 4096:
+            _TEMPLATE_CACHE.clear()
+        _TEMPLATE_CACHE[key] = next((t for t in TEMPLATES if t.senders.search(key)), None)
+    return _TEMPLATE_CACHE[key]
+
+def find_amount(text: str, window: int = DEFAULT_WINDOW) -> Optional[float]:
+    text = text[:window]
+    for pat in AMOUNT_PATTERNS:
+        m = pat.search(text)
+        if m:
+            amount = to_amount(m.group(1))
+            if amount is not None:
+                return amount
+    return None
+
+def find_merchant(text: str, window: int = DEFAULT_WINDOW) -> Optional[str]:
+    text = text[:window]
+    for pat in MERCHANT_PATTERNS:
+        m = pat.search(text)
+        if m:
+            name = clean_merchant(m.group(1))
+            if name:
+                return name
+    return None
+
+def parse_message(text: str, sender: str = "", source: str = "",
+                  window: int = DEFAULT_WINDOW) -> Tuple[Optional[float], Optional[str]]:
+    """Best-effort (amount, merchant) for an e-mail; either may be None.
+
+    The template comes from the From header, else from the fetcher source key.
+    """
+    text = text[:window]
+    template = select_template(sender) or select_template(source)
+    if template is not None:
+        hit = template.parse(text)
+        if hit:
+            amount, merchant = hit
+            return amount, merchant or find_merchant(text, window)
+    return find_amount(text, window), find_merchant(text, window)
+
+def parse_sms(text: str, sender: str = "", window: int = DEFAULT_WINDOW) -> Optional[Tuple[float, str]]:
+    """(amount, merchant) for a transaction SMS, or None when it isn't one."""
+    text = text[:window]
+    template = select_template(sender)
+    if template is not None:
+        hit = template.parse(text)
+        if hit and hit[1]:
+            return hit
+    m = SMS_PATTERN.search(text)
+    if not m:
+        return None
+    amount = to_amount(m.group(1))
+    if amount is None:
+        return None
+    return amount, m.group(2).strip(" .,-")